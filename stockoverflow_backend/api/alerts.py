@@ -0,0 +1,136 @@
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+
+logger = logging.getLogger(__name__)
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+class AlertDispatcher:
+    """
+    Collects threshold breach events and mails them as one digest every
+    ALERT_DIGEST_INTERVAL seconds from a background thread.
+
+    An item is alerted once per breach: further events for it are dropped
+    until resolve() reports that it has recovered. The SMTP connection is
+    kept open between digests and reopened if the server has dropped it.
+    """
+
+    def __init__(self, interval, start=True):
+        self.interval = interval
+        self.pending = {}  # item id -> event, so repeats coalesce
+        self.alerted = set()
+        self.lock = threading.Lock()
+        self.connection = None
+        self.wakeup = threading.Event()
+        self.stopped = False
+        self.thread = None
+        if start:
+            self.thread = threading.Thread(target=self._run, name="alert-dispatcher", daemon=True)
+            self.thread.start()
+
+    def queue(self, items):
+        with self.lock:
+            for item in items:
+                if item.id in self.alerted:
+                    continue
+                self.pending[item.id] = {"name": item.name, "sku": item.sku, "quantity": item.quantity, "threshold": item.threshold}
+
+    def resolve(self, item_ids):
+        with self.lock:
+            for item_id in item_ids:
+                self.alerted.discard(item_id)
+                self.pending.pop(item_id, None)
+
+    def send_digest(self):
+        with self.lock:
+            events, self.pending = self.pending, {}
+            self.alerted.update(events)
+        if not events:
+            return 0
+
+        lines = [
+            f"- {event['name']} ({event['sku']}): {event['quantity']} in stock, threshold {event['threshold']}"
+            for event in events.values()
+        ]
+        subject = "Threshold Breach Alert" if len(events) == 1 else f"Threshold Breach Alert: {len(events)} items"
+        message = EmailMessage(
+            subject=subject,
+            body="The following items are below their threshold:\n\n" + "\n".join(lines),
+            from_email=settings.ALERT_FROM_EMAIL,
+            to=settings.ALERT_RECIPIENTS,
+        )
+        try:
+            self._send(message)
+        except Exception:
+            # Put the events back so the next digest retries them
+            with self.lock:
+                self.alerted.difference_update(events)
+                self.pending = {**events, **self.pending}
+            raise
+        return len(events)
+
+    def _send(self, message):
+        if self.connection is None:
+            self.connection = get_connection(fail_silently=False)
+        try:
+            self.connection.open()
+            self.connection.send_messages([message])
+        except Exception:
+            # The server may have closed the idle connection; reconnect once
+            self.connection.close()
+            self.connection.open()
+            self.connection.send_messages([message])
+
+    def _run(self):
+        while not self.stopped:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            try:
+                self.send_digest()
+            except Exception:
+                # The events were put back and go out with the next digest
+                logger.exception("Alert digest failed")
+
+    def close(self):
+        self.stopped = True
+        self.wakeup.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+        try:
+            self.send_digest()
+        finally:
+            if self.connection is not None:
+                self.connection.close()
+
+
+def get_dispatcher():
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = AlertDispatcher(settings.ALERT_DIGEST_INTERVAL, start=settings.ALERT_ASYNC)
+            atexit.register(_dispatcher.close)
+        return _dispatcher
+
+
+def queue_breaches(items):
+    """
+    Report items that have just crossed their threshold. With ALERT_ASYNC
+    off the digest goes out straight away.
+    """
+    if not items:
+        return
+    dispatcher = get_dispatcher()
+    dispatcher.queue(items)
+    if not settings.ALERT_ASYNC:
+        dispatcher.send_digest()
+
+
+def resolve_breaches(item_ids):
+    if item_ids:
+        get_dispatcher().resolve(item_ids)
@@ -0,0 +1,147 @@
+"""
+ASGI-native versions of the scan and checkout endpoints, mounted under
+/api/async/. Lookups use the async ORM. Each transactional write runs as
+one sync_to_async call, because Django transactions are sync-only; a slow
+client then only holds a coroutine, not a worker thread. Alert emails and
+audit log writes already happen on background threads.
+"""
+import json
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rest_framework import serializers
+
+from .barcodes import aresolve_barcodes
+from .car_inventory import scan_cars
+from .metrics import timed
+from .models import ScannedItem, normalize_vin
+from .scan_sessions import add_scans, confirm_scans, is_expired, session_lines
+from .serializers import CheckoutCreateSerializer, CheckoutSerializer
+from .stock import InsufficientStock
+
+
+def request_data(request):
+    if request.content_type == "application/json":
+        try:
+            return json.loads(request.body or b"{}")
+        except ValueError:
+            return None
+    return request.POST
+
+
+async def request_user(request):
+    """
+    (user or None, name for the audit log), like audit.request_user.
+    """
+    user = await request.auser()
+    return (user if user.is_authenticated else None), (user.username if user.is_authenticated else "Anonymous")
+
+
+@timed("async_scan_vin")
+@csrf_exempt
+@require_POST
+async def scan_vin(request):
+    data = request_data(request)
+    if data is None:
+        return JsonResponse({"error": "Invalid JSON."}, status=400)
+    vin = normalize_vin(data.get("vin"))
+    if not vin:
+        return JsonResponse({"error": "VIN is required."}, status=400)
+
+    user, name = await request_user(request)
+    car_status, message = (await sync_to_async(scan_cars)([vin], name))[vin]
+    return JsonResponse({"status": car_status, "message": message})
+
+
+def _scan_into_session(session_id, car_label, user, item_id):
+    with transaction.atomic():
+        scanned_item, created = ScannedItem.objects.select_for_update().get_or_create(
+            session_id=session_id, defaults={"car_label": car_label, "user": user}
+        )
+        if not created and is_expired(scanned_item):
+            return None
+        if item_id is not None:
+            add_scans(scanned_item, {item_id: 1})
+    return {"session_id": str(scanned_item.session_id), "parts": session_lines(scanned_item)}
+
+
+@timed("async_scan_item")
+@csrf_exempt
+@require_POST
+async def scan_item(request):
+    data = request_data(request)
+    if data is None:
+        return JsonResponse({"error": "Invalid JSON."}, status=400)
+    user, name = await request_user(request)
+    if user is None:
+        return JsonResponse({"error": "Authentication required"}, status=401)
+    try:
+        session_id = uuid.UUID(str(data.get("session_id") or uuid.uuid4()))
+    except ValueError:
+        return JsonResponse({"error": "Invalid session_id"}, status=400)
+
+    part_barcode = data.get("part_barcode")
+    item_id = None
+    if part_barcode:
+        part = (await aresolve_barcodes([part_barcode])).get(part_barcode)
+        if part is None:
+            return JsonResponse({"error": "Part not found"}, status=404)
+        item_id = part["id"]
+
+    result = await sync_to_async(_scan_into_session)(session_id, data.get("car_label") or "", user, item_id)
+    if result is None:
+        return JsonResponse({"error": "Session expired"}, status=410)
+    return JsonResponse(result)
+
+
+@timed("async_confirm_session")
+@csrf_exempt
+@require_POST
+async def confirm_session(request):
+    data = request_data(request)
+    if data is None:
+        return JsonResponse({"error": "Invalid JSON."}, status=400)
+    try:
+        scanned_item = await ScannedItem.objects.aget(session_id=data.get("session_id"))
+    except (ScannedItem.DoesNotExist, ValidationError):
+        return JsonResponse({"error": "Session not found"}, status=404)
+    if is_expired(scanned_item):
+        return JsonResponse({"error": "Session expired"}, status=410)
+
+    try:
+        await sync_to_async(confirm_scans)(scanned_item)
+    except ScannedItem.DoesNotExist:
+        return JsonResponse({"error": "Session not found"}, status=404)  # Confirmed meanwhile
+    except InsufficientStock as e:
+        return JsonResponse({"error": "Insufficient stock", "shortages": [
+            {"item": item_id, "requested": requested, "available": available}
+            for item_id, (requested, available) in e.shortages.items()
+        ]}, status=409)
+    return JsonResponse({"message": "Session confirmed and inventory updated"})
+
+
+def _create_checkout(serializer):
+    checkout = serializer.save()
+    return CheckoutSerializer(checkout).data
+
+
+@timed("async_checkout")
+@csrf_exempt
+@require_POST
+async def create_checkout(request):
+    data = request_data(request)
+    if data is None:
+        return JsonResponse({"error": "Invalid JSON."}, status=400)
+    serializer = CheckoutCreateSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+    try:
+        checkout = await sync_to_async(_create_checkout)(serializer)
+    except serializers.ValidationError as e:
+        return JsonResponse(e.detail, status=400, safe=False)
+    return JsonResponse(checkout, status=201)
@@ -0,0 +1,232 @@
+import atexit
+import ctypes
+import glob
+import json
+import logging
+import os
+import threading
+import uuid
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Log
+
+logger = logging.getLogger(__name__)
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+WINDOWS = os.name == "nt"
+# Windows process query access and GetExitCodeProcess's code for a running process
+PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+ERROR_ACCESS_DENIED = 5
+STILL_ACTIVE = 259
+
+
+def pid_alive(pid):
+    if WINDOWS:
+        return _windows_pid_alive(pid)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _windows_pid_alive(pid):
+    # os.kill(pid, 0) doesn't probe on Windows: signal 0 is CTRL_C_EVENT
+    kernel32 = ctypes.windll.kernel32
+    handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+    if not handle:
+        return kernel32.GetLastError() == ERROR_ACCESS_DENIED
+    try:
+        exit_code = ctypes.c_ulong()
+        if not kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code)):
+            return True
+        return exit_code.value == STILL_ACTIVE
+    finally:
+        kernel32.CloseHandle(handle)
+
+
+class AuditLogWriter:
+    """
+    Buffers audit log entries and writes them with bulk_create once
+    AUDIT_LOG_BATCH_SIZE entries are waiting or AUDIT_LOG_FLUSH_INTERVAL
+    seconds have passed.
+
+    Every entry is appended to a per-process spool file before it is
+    buffered. The spool is rotated at each flush and removed once the
+    batch is in the database. A batch whose write fails is retried at the
+    next flush, and entries left behind by a crashed worker are replayed
+    by the next writer that starts (at-least-once).
+    """
+
+    def __init__(self, spool_dir, batch_size, flush_interval):
+        self.spool_dir = str(spool_dir)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pid = os.getpid()
+        self.owner = f"{self.pid}-{uuid.uuid4().hex[:8]}"
+        self.buffer = []
+        self.pending = []  # (spool path, entries) of rotated batches not yet written
+        self.sequence = 0
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopped = False
+
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self.spool = open(self._spool_path(), "a", encoding="utf-8")
+        self.thread = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+        self.thread.start()
+
+    def _spool_path(self):
+        return os.path.join(self.spool_dir, f"audit-{self.owner}.jsonl")
+
+    def log(self, entry):
+        line = json.dumps(entry) + "\n"
+        with self.lock:
+            self.spool.write(line)
+            self.spool.flush()
+            self.buffer.append(entry)
+            full = len(self.buffer) >= self.batch_size
+        if full:
+            self.wakeup.set()
+
+    def flush(self):
+        with self.lock:
+            if self.buffer:
+                entries, self.buffer = self.buffer, []
+                # Hand the spooled lines to this flush and start a fresh spool
+                self.spool.close()
+                self.sequence += 1
+                flushing = os.path.join(self.spool_dir, f"audit-{self.owner}-{self.sequence}.flushing")
+                os.replace(self._spool_path(), flushing)
+                self.spool = open(self._spool_path(), "a", encoding="utf-8")
+                self.pending.append((flushing, entries))
+            pending, self.pending = self.pending, []
+
+        written = 0
+        for index, (flushing, entries) in enumerate(pending):
+            try:
+                write_entries(entries)
+            except Exception:
+                # Keep this and the later batches, oldest first, for the next flush
+                with self.lock:
+                    self.pending[:0] = pending[index:]
+                raise
+            os.remove(flushing)
+            written += len(entries)
+        return written
+
+    def _run(self):
+        try:
+            recover_spool(self.spool_dir, self.owner)
+            while not self.stopped:
+                self.wakeup.wait(self.flush_interval)
+                self.wakeup.clear()
+                try:
+                    self.flush()
+                except Exception:
+                    logger.exception("Audit log flush failed, %d batch(es) will be retried", len(self.pending))
+        finally:
+            connection.close()
+
+    def close(self):
+        if self.stopped:
+            return
+        self.stopped = True
+        self.wakeup.set()
+        self.thread.join(timeout=self.flush_interval + 5)
+        try:
+            self.flush()
+        finally:
+            connection.close()
+            with self.lock:
+                self.spool.close()
+                if not os.path.getsize(self._spool_path()):
+                    os.remove(self._spool_path())
+
+
+def write_entries(entries):
+    Log.objects.bulk_create(
+        [Log(**{**entry, "timestamp": parse_datetime(entry["timestamp"])}) for entry in entries],
+        batch_size=500,
+    )
+
+
+def _spool_owner(name):
+    """
+    The "<pid>-<token>" writer that owns a spool file name.
+    """
+    if ".recovering-" in name:
+        return name.split(".recovering-")[1]
+    return "-".join(name.split(".")[0].split("-")[1:3])
+
+
+def recover_spool(spool_dir, owner):
+    """
+    Replay spool files left by writers that are no longer running. A file
+    whose pid matches ours but whose token does not belongs to an earlier
+    process that had the same pid. Returns the number of entries written.
+    """
+    recovered = 0
+    pid = os.getpid()
+    for path in glob.glob(os.path.join(str(spool_dir), "audit-*")):
+        name = os.path.basename(path)
+        file_owner = _spool_owner(name)
+        file_pid = int(file_owner.split("-")[0])
+        if file_owner == owner or (file_pid != pid and pid_alive(file_pid)):
+            continue
+        claimed = os.path.join(str(spool_dir), f"{name.split('.recovering-')[0]}.recovering-{owner}")
+        try:
+            os.replace(path, claimed)  # Only one process wins the rename
+        except FileNotFoundError:
+            continue
+        with open(claimed, encoding="utf-8") as spool:
+            entries = [json.loads(line) for line in spool if line.strip()]
+        if entries:
+            write_entries(entries)
+        os.remove(claimed)
+        recovered += len(entries)
+    return recovered
+
+
+def get_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None or _writer.pid != os.getpid():
+            _writer = AuditLogWriter(
+                settings.AUDIT_LOG_SPOOL_DIR,
+                settings.AUDIT_LOG_BATCH_SIZE,
+                settings.AUDIT_LOG_FLUSH_INTERVAL,
+            )
+            atexit.register(_writer.close)
+        return _writer
+
+
+def audit_log(action, item_name=None, user=None, details=None):
+    """
+    Record an audit log entry. This is the only place that should write
+    Log rows; with AUDIT_LOG_ASYNC off the row is written immediately.
+    """
+    entry = {
+        "action": action,
+        "item_name": item_name,
+        "user": user,
+        "details": details,
+        "timestamp": timezone.now().isoformat(),
+    }
+    if not settings.AUDIT_LOG_ASYNC:
+        write_entries([entry])
+        return
+    get_writer().log(entry)
+
+
+def request_user(request):
+    return request.user.username if request.user.is_authenticated else "Anonymous"
@@ -0,0 +1,205 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .metrics import CACHE_LOOKUPS
+from .models import InventoryItem
+
+ITEM_FIELDS = ("id", "name", "sku", "barcode")
+# Shared entries are stored under this generation as the cache key version;
+# clear() bumps it instead of clearing a backend other code may use too.
+GENERATION_KEY = "barcode-generation"
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class BarcodeCache:
+    """
+    Bounded LRU of barcode -> {"id", "name", "sku", "barcode"} with a TTL.
+
+    Only metadata that rarely changes is cached; stock quantities are never
+    stored here and must be read from the database. With a Django cache
+    alias the entries are also shared through that backend (e.g. locmem or
+    file) as a second tier, versioned by a generation counter so clear()
+    leaves the alias's other keys alone. InventoryItem save/delete signals invalidate
+    the shared tier and this process's entries; the TTL bounds staleness
+    in other processes and from queryset.update() writes, which skip
+    signals.
+    """
+
+    def __init__(self, max_size, ttl, backend=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.backend = backend
+        self.entries = OrderedDict()  # barcode -> (expires_at, entry)
+        self.barcode_for_id = {}  # item id -> barcode, to invalidate renamed barcodes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, barcodes):
+        now = time.monotonic()
+        found, missing = {}, []
+        with self.lock:
+            for barcode in barcodes:
+                cached = self.entries.get(barcode)
+                if cached and cached[0] > now:
+                    self.entries.move_to_end(barcode)
+                    found[barcode] = cached[1]
+                else:
+                    missing.append(barcode)
+
+        if missing and self.backend is not None:
+            shared = self.backend.get_many([self._key(barcode) for barcode in missing], version=self._generation())
+            for barcode in missing:
+                entry = shared.get(self._key(barcode))
+                if entry is not None:
+                    found[barcode] = entry
+            self._store({barcode: found[barcode] for barcode in missing if barcode in found}, share=False)
+            missing = [barcode for barcode in missing if barcode not in found]
+
+        with self.lock:
+            self.hits += len(found)
+            self.misses += len(missing)
+        if found:
+            CACHE_LOOKUPS.inc(len(found), cache="barcode", result="hit")
+        if missing:
+            CACHE_LOOKUPS.inc(len(missing), cache="barcode", result="miss")
+        return found, missing
+
+    def set_many(self, entries):
+        self._store(entries, share=True)
+
+    def _store(self, entries, share):
+        if not entries:
+            return
+        expires_at = time.monotonic() + self.ttl
+        with self.lock:
+            for barcode, entry in entries.items():
+                self.entries[barcode] = (expires_at, entry)
+                self.entries.move_to_end(barcode)
+                self.barcode_for_id[entry["id"]] = barcode
+            while len(self.entries) > self.max_size:
+                evicted, (_, entry) = self.entries.popitem(last=False)
+                if self.barcode_for_id.get(entry["id"]) == evicted:
+                    del self.barcode_for_id[entry["id"]]
+        if share and self.backend is not None:
+            generation = self._generation()
+            self.backend.set_many(
+                {self._key(barcode): entry for barcode, entry in entries.items()}, self.ttl, version=generation
+            )
+            self.backend.set_many(
+                {self._id_key(entry["id"]): barcode for barcode, entry in entries.items()}, self.ttl, version=generation
+            )
+
+    def invalidate(self, item_id, barcode=None):
+        """
+        Drop the entries for an item, under its current barcode and under
+        the one it was cached with if that has since changed.
+        """
+        with self.lock:
+            stale = {barcode, self.barcode_for_id.pop(item_id, None)} - {None}
+            for key in stale:
+                self.entries.pop(key, None)
+        if self.backend is not None:
+            generation = self._generation()
+            stale.add(self.backend.get(self._id_key(item_id), version=generation))
+            self.backend.delete_many(
+                [self._key(key) for key in stale if key] + [self._id_key(item_id)], version=generation
+            )
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.barcode_for_id.clear()
+            self.hits = self.misses = 0
+        if self.backend is not None:
+            # Entries under the old generation are never read again and expire with their TTL
+            try:
+                self.backend.incr(GENERATION_KEY)
+            except ValueError:
+                self.backend.add(GENERATION_KEY, 2, None)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+    def _generation(self):
+        generation = self.backend.get(GENERATION_KEY)
+        if generation is None:
+            self.backend.add(GENERATION_KEY, 1, None)
+            generation = self.backend.get(GENERATION_KEY, 1)
+        return generation
+
+    @staticmethod
+    def _key(barcode):
+        return f"barcode:{barcode}"
+
+    @staticmethod
+    def _id_key(item_id):
+        return f"barcode-item:{item_id}"
+
+
+def get_barcode_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            alias = settings.BARCODE_CACHE_ALIAS
+            _cache = BarcodeCache(
+                settings.BARCODE_CACHE_SIZE,
+                settings.BARCODE_CACHE_TTL,
+                backend=caches[alias] if alias else None,
+            )
+        return _cache
+
+
+def resolve_barcodes(barcodes):
+    """
+    Map barcodes to item metadata dicts (see ITEM_FIELDS). Cache misses
+    are loaded with one query; unknown barcodes are left out.
+    """
+    cache = get_barcode_cache()
+    found, missing = cache.get_many(set(barcodes))
+    if missing:
+        loaded = {
+            row["barcode"]: row
+            for row in InventoryItem.objects.filter(barcode__in=missing).values(*ITEM_FIELDS)
+        }
+        cache.set_many(loaded)
+        found.update(loaded)
+    return found
+
+
+async def aresolve_barcodes(barcodes):
+    """
+    resolve_barcodes for async views; misses are loaded with the async ORM.
+    """
+    cache = get_barcode_cache()
+    found, missing = cache.get_many(set(barcodes))
+    if missing:
+        loaded = {
+            row["barcode"]: row
+            async for row in InventoryItem.objects.filter(barcode__in=missing).values(*ITEM_FIELDS)
+        }
+        cache.set_many(loaded)
+        found.update(loaded)
+    return found
+
+
+def invalidate_item(item_id, barcode=None):
+    cache = get_barcode_cache()
+    cache.invalidate(item_id, barcode)
+    # Again after commit, in case a reader cached the old row in between
+    transaction.on_commit(lambda: cache.invalidate(item_id, barcode))
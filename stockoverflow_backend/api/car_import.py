@@ -0,0 +1,200 @@
+from django.db import DatabaseError, transaction
+from openpyxl import load_workbook
+import pandas as pd
+
+from .models import Car
+from .change_feed import publish_cars
+from .response_cache import bump
+from .thresholds import items_for_cars, recompute_thresholds
+
+# Excel column -> Car field
+EXPECTED_COLUMNS = {
+    "Frame": "vin",
+    "Type description": "model",
+    "Adaptation description": "adaptation",
+    "Estim Arrival": "scheduled_date",
+    "Order date": "order_date",
+    "Name": "client_name",
+    "Dealer's comment": "dealers_comments",
+    "Location": "location",
+}
+
+DATE_FIELDS = ("scheduled_date", "order_date")
+CAR_FIELDS = list(EXPECTED_COLUMNS.values()) + ["status"]
+BATCH_SIZE = 500
+VIN_MAX_LENGTH = Car._meta.get_field("vin").max_length
+
+
+def missing_columns(columns):
+    return [col for col in EXPECTED_COLUMNS if col not in columns]
+
+
+def _header_columns(header):
+    return ["" if cell is None else str(cell) for cell in header or ()]
+
+
+def schedule_columns(file):
+    """
+    The header of an uploaded schedule, to validate it before it is
+    queued. Nothing is left open and the file is rewound for the import.
+    """
+    name = (getattr(file, "name", "") or "").lower()
+    try:
+        if name.endswith(".csv"):
+            return list(pd.read_csv(file, nrows=0).columns)
+        if name.endswith(".xls"):
+            return list(pd.read_excel(file, nrows=0).columns)
+        workbook = load_workbook(file, read_only=True, data_only=True)
+        try:
+            return _header_columns(next(workbook.active.iter_rows(max_row=1, values_only=True), None))
+        finally:
+            workbook.close()
+    finally:
+        file.seek(0)
+
+
+def open_schedule(file, batch_size=BATCH_SIZE):
+    """
+    Open an uploaded schedule without loading it whole.
+    Returns (columns, batches) where batches yields DataFrames of at most
+    batch_size rows, indexed by data row position so error rows line up
+    with the file. .xlsx is read with openpyxl in read-only mode and .csv
+    with a chunked reader; legacy .xls still goes through read_excel.
+
+    The .xlsx workbook is closed once batches is exhausted, so iterate it
+    to the end; use schedule_columns to only check the header.
+    """
+    name = (getattr(file, "name", "") or "").lower()
+    if name.endswith(".csv"):
+        columns = list(pd.read_csv(file, nrows=0).columns)
+        file.seek(0)
+        return columns, pd.read_csv(file, chunksize=batch_size, dtype=object)
+    if name.endswith(".xls"):
+        df = pd.read_excel(file)
+        return list(df.columns), (df.iloc[i:i + batch_size] for i in range(0, len(df), batch_size))
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    rows = workbook.active.iter_rows(values_only=True)
+    columns = _header_columns(next(rows, None))
+    return columns, _xlsx_batches(workbook, rows, columns, batch_size)
+
+
+def _xlsx_batches(workbook, rows, columns, batch_size):
+    try:
+        batch, index = [], []
+        for position, row in enumerate(rows):
+            if all(cell is None for cell in row):
+                continue
+            batch.append(row[:len(columns)])
+            index.append(position)
+            if len(batch) == batch_size:
+                yield pd.DataFrame(batch, columns=columns, index=index)
+                batch, index = [], []
+        if batch:
+            yield pd.DataFrame(batch, columns=columns, index=index)
+    finally:
+        workbook.close()
+
+
+def normalize_cars(df):
+    """
+    Map the schedule columns onto Car fields, one column at a time.
+    Strings are stripped, VINs uppercased and dates parsed with a single
+    to_datetime call; unparseable dates become None.
+    """
+    cars = pd.DataFrame(index=df.index)
+    for excel_col, field in EXPECTED_COLUMNS.items():
+        if field in DATE_FIELDS:
+            parsed = pd.to_datetime(df[excel_col], errors="coerce")
+            cars[field] = parsed.dt.date.astype(object).where(parsed.notna(), None)
+        else:
+            values = df[excel_col].astype(object)
+            cars[field] = values.where(values.notna(), "").astype(str).str.strip()
+    cars["vin"] = cars["vin"].str.upper()  # Same key as Car.save / normalize_vin
+    cars["status"] = "from_upcoming"
+    return cars
+
+
+def validate_cars(cars):
+    """
+    Split normalized rows into valid ones and per-row error messages.
+    """
+    errors = []
+    vins = cars["vin"]
+    valid = (vins != "") & (vins.str.len() <= VIN_MAX_LENGTH)
+    for index, vin in vins[~valid].items():
+        if not vin:
+            errors.append(f"Row {index + 1}: VIN is required.")
+        else:
+            errors.append(f"Row {index + 1}: VIN must be at most {VIN_MAX_LENGTH} characters.")
+    return cars[valid], errors
+
+
+def import_batch(df):
+    """
+    Create or update the cars in one DataFrame by VIN, in a single transaction.
+    Returns (success_count, errors) where errors is a list of "Row N: ..." messages.
+    """
+    cars, errors = validate_cars(normalize_cars(df))
+    if cars.empty:
+        return 0, errors
+
+    # Later rows win when a VIN appears more than once, as with update_or_create
+    latest = cars.drop_duplicates(subset="vin", keep="last")
+
+    existing = Car.objects.only("id", "vin").in_bulk(list(latest["vin"]), field_name="vin")
+
+    to_create, to_update = [], []
+    for row in latest.to_dict("records"):
+        car = existing.get(row["vin"])
+        if car is None:
+            to_create.append(Car(**row))
+            continue
+        for field, value in row.items():
+            setattr(car, field, value)
+        to_update.append(car)
+
+    try:
+        with transaction.atomic():
+            Car.objects.bulk_create(to_create)
+            Car.objects.bulk_update(to_update, CAR_FIELDS)
+    except DatabaseError as e:
+        errors.append(f"Rows {df.index[0] + 1}-{df.index[-1] + 1}: {str(e)}")
+        return 0, errors
+    bump("cars")
+    publish_cars(dict.fromkeys(latest["vin"], "from_upcoming"))
+
+    # bulk_update skips signals; updated cars go back to upcoming demand
+    if to_update:
+        recompute_thresholds(items_for_cars([car.id for car in to_update]))
+
+    return len(cars), errors
+
+
+def import_schedule(batches):
+    """
+    Stream schedule batches into the database, committing each one as it
+    goes. Yields a report dict per batch.
+    """
+    for df in batches:
+        if df.empty:
+            continue
+        success_count, errors = import_batch(df)
+        yield {
+            "first_row": int(df.index[0]) + 1,
+            "last_row": int(df.index[-1]) + 1,
+            "success_count": success_count,
+            "errors": errors,
+        }
+
+
+def import_cars(batches):
+    """
+    Run a full import. Returns (success_count, errors, batch_reports).
+    """
+    success_count, errors, reports = 0, [], []
+    for report in import_schedule(batches):
+        success_count += report["success_count"]
+        errors.extend(report["errors"])
+        reports.append(report)
+    return success_count, errors, reports
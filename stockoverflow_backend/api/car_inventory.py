@@ -1,29 +1,67 @@
-from django.db import models
+from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.decorators import api_view
-from django.core.mail import send_mail
-from .models import Car, InventoryItem, Log
-import pandas as pd
+from .models import Car, normalize_vin
+from .car_import import missing_columns, schedule_columns
+from .import_jobs import enqueue_import
+from .serializers import ImportJobSerializer
+from .thresholds import items_for_cars, recompute_thresholds
+from .audit import audit_log, request_user
+from .change_feed import publish_cars
+from .response_cache import bump
+from .metrics import VIN_SCANS, timed
 from rest_framework.parsers import MultiPartParser, FormParser
 
 
+def scan_cars(vins, user):
+    """
+    Scan normalized VINs in order. Upcoming cars become allocated with a
+    conditional UPDATE each, unknown ones are added with status unknown,
+    and thresholds are recomputed once for all allocated cars.
+    Returns {vin: (status, message)}.
+    """
+    results, allocated = {}, []
+    for vin in dict.fromkeys(vins):
+        # Common case: an upcoming car arrives. One conditional UPDATE on the unique VIN index.
+        if Car.objects.filter(vin=vin, status='from_upcoming').update(status='allocated'):
+            car_status = 'allocated'
+            allocated.append(vin)
+        else:
+            car_status = Car.objects.filter(vin=vin).values_list('status', flat=True).first()
+            if car_status == '' and Car.objects.filter(vin=vin, status='').update(status='from_upcoming'):
+                car_status = 'from_upcoming'
+
+        if car_status is not None:
+            audit_log(action="Scanned Car", item_name=vin, user=user, details=f"Status: {car_status}")
+            results[vin] = (car_status, 'Car status updated.')
+            continue
+
+        # Add unknown cars with minimal details
+        car, created = Car.objects.get_or_create(vin=vin, defaults={'status': 'unknown', 'model': 'Unknown'})
+        audit_log(action="Scanned Unknown Car", item_name=vin, user=user, details="Added with status: unknown")
+        results[vin] = (car.status, 'Unknown car added to the system.')
+
+    for car_status, message in results.values():
+        VIN_SCANS.inc(status=car_status)
+    if results:
+        bump("cars")
+        publish_cars({vin: car_status for vin, (car_status, message) in results.items()})
+    if allocated:
+        # UPDATE skips post_save; the cars' parts leave upcoming demand
+        recompute_thresholds(items_for_cars(Car.objects.filter(vin__in=allocated).values('id')))
+    return results
+
+
+@timed("scan_vin")
 @api_view(['POST'])
 def scan_vin(request):
-    vin = request.data.get('vin')
-    car = Car.objects.filter(vin=vin).first()
+    vin = normalize_vin(request.data.get('vin'))
+    if not vin:
+        return Response({'error': 'VIN is required.'}, status=status.HTTP_400_BAD_REQUEST)
 
-    if car:
-        if car.status in [None, '']:
-            car.status = 'from_upcoming'
-        elif car.status == 'from_upcoming':
-            car.status = 'allocated'
-        car.save()
-        return Response({'status': car.status, 'message': 'Car status updated.'})
-    else:
-        # Add unknown cars with minimal details
-        car = Car.objects.create(vin=vin, status='unknown', model='Unknown')
-        return Response({'status': car.status, 'message': 'Unknown car added to the system.'})
+    car_status, message = scan_cars([vin], request_user(request))[vin]
+    return Response({'status': car_status, 'message': message})
 
 class UploadCarsView(APIView):
     parser_classes = (MultiPartParser, FormParser)
@@ -34,84 +72,23 @@ class UploadCarsView(APIView):
             return Response({"error": "No file provided"}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            # Read the Excel file
-            df = pd.read_excel(file)
+            # Only the header is read here; the worker streams the rows
+            columns = schedule_columns(file)
         except Exception as e:
             return Response({"error": f"Failed to process file: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Define expected columns
-        expected_columns = {
-            "Frame": "vin",
-            "Type description": "model",
-            "Adaptation description": "adaptation",
-            "Estim Arrival": "scheduled_date",
-            "Order date": "order_date",
-            "Name": "client_name",
-            "Dealer's comment": "dealers_comments",
-            "Location": "location",
-        }
-
         # Check for missing columns
-        missing_columns = [col for col in expected_columns if col not in df.columns]
-        if missing_columns:
-            return Response({"error": f"Missing required columns: {', '.join(missing_columns)}"}, status=400)
-
-        errors = []
-        success_count = 0
-
-        for index, row in df.iterrows():
-            try:
-                # Map row data to model fields
-                car_data = {db_field: row.get(excel_col, "").strip() for excel_col, db_field in expected_columns.items()}
-
-                # Default status if not provided
-                car_data['status'] = 'from_upcoming'
-
-                # Convert dates
-                for date_field in ["scheduled_date", "order_date"]:
-                    if car_data.get(date_field):
-                        try:
-                            car_data[date_field] = pd.to_datetime(car_data[date_field]).date()
-                        except Exception:
-                            car_data[date_field] = None  # Handle invalid date format
-
-                # Save or update car
-                Car.objects.update_or_create(vin=car_data["vin"], defaults=car_data)
-                success_count += 1
-
-            except Exception as e:
-                errors.append(f"Row {index + 1}: {str(e)}")
-
-        return Response(
-            {
-                "message": f"Upload complete. {success_count} cars added/updated.",
-                "errors": errors,
-            },
-            status=status.HTTP_200_OK,
-        )
-
-def adjust_thresholds():
-    """
-    Adjust thresholds for inventory items based on upcoming cars.
-    """
-    upcoming_cars = Car.objects.filter(status='from_upcoming')
-    for car in upcoming_cars:
-        for part in car.required_parts.all():
-            inventory_item = InventoryItem.objects.get(id=part.id)
-            inventory_item.quantity -= part.quantity_needed
-            if inventory_item.quantity < inventory_item.threshold:
-                inventory_item.threshold_breached = True
-                send_email_notification(inventory_item)
-            inventory_item.save()
+        missing = missing_columns(columns)
+        if missing:
+            return Response({"error": f"Missing required columns: {', '.join(missing)}"}, status=400)
 
+        # Import runs in the background; poll /api/import_jobs/<id>/ for progress
+        job = enqueue_import(file)
+        return Response(ImportJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
 
-def send_email_notification(inventory_item):
+def adjust_thresholds(item_ids=None):
     """
-    Send an email when inventory thresholds are breached.
+    Recompute threshold breaches from stock minus upcoming-car demand.
+    New breaches are mailed as a digest by api.alerts.
     """
-    send_mail(
-        subject='Threshold Breach Alert',
-        message=f'Item {inventory_item.name} is below the threshold.',
-        from_email='admin@company.com',
-        recipient_list=['office@company.com']
-    )
+    return recompute_thresholds(item_ids)
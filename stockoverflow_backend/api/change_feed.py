@@ -0,0 +1,190 @@
+import asyncio
+import json
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connection, transaction
+from django.db.models import Max
+from django.http import JsonResponse, StreamingHttpResponse
+
+from .models import ChangeEvent, InventoryItem
+
+# pg_advisory_xact_lock key held by publishers while they insert
+PUBLISH_LOCK_ID = 0x43484E47
+
+_feed = None
+_feed_lock = threading.Lock()
+
+
+class ChangeFeed:
+    """
+    Sequence of compact change events stored in the ChangeEvent table, so
+    every worker process serves the same sequence; an event's id is its
+    seq. The newest CHANGE_FEED_BUFFER events are kept so clients can
+    resume after reconnecting.
+
+    A client resuming from a sequence that has already been pruned, or
+    that the database never reached, is told to reset and refetch.
+    Publishing wakes this process's clients at once; clients connected to
+    other processes pick the events up on their next poll.
+
+    Ids are handed out before commit, so concurrent publishers must also
+    commit in id order, or a client could move past an id that becomes
+    visible later. Inserts are serialized: by an advisory lock on
+    PostgreSQL, by the IMMEDIATE write lock on SQLite. Other backends get
+    no such guarantee.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.lock = threading.Lock()
+        self.waiters = set()  # (loop, asyncio.Event) per connected client
+
+    def publish(self, events):
+        """
+        Store (kind, data) events, prune old ones and wake every waiting
+        client of this process.
+        """
+        if not events:
+            return
+        with transaction.atomic():
+            if connection.vendor == "postgresql":
+                # Released at commit, after the ids taken under it are visible
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT pg_advisory_xact_lock(%s)", [PUBLISH_LOCK_ID])
+            ChangeEvent.objects.bulk_create([ChangeEvent(kind=kind, data=data) for kind, data in events])
+        ChangeEvent.objects.filter(id__lte=self.latest() - self.size).delete()
+        with self.lock:
+            waiters = list(self.waiters)
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    def latest(self):
+        return ChangeEvent.objects.aggregate(seq=Max("id"))["seq"] or 0
+
+    def since(self, seq):
+        """
+        Events after seq, or None if some of them are no longer stored.
+        """
+        latest = self.latest()
+        if seq == latest:
+            return []
+        if seq > latest or seq < latest - self.size:
+            return None
+        events = ChangeEvent.objects.filter(id__gt=seq, id__lte=latest).order_by("id")
+        return list(events.values_list("id", "kind", "data"))
+
+    def cursor(self, last_event_id):
+        """
+        The seq to resume from for an event id, or None if the client has
+        to start over.
+        """
+        last_event_id = last_event_id or ""
+        return int(last_event_id) if last_event_id.isdigit() else None
+
+    async def stream(self, seq, heartbeat, poll_interval):
+        """
+        Yield SSE frames from seq onwards until the client disconnects.
+        """
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        waiter = (loop, wakeup)
+        latest, since = sync_to_async(self.latest), sync_to_async(self.since)
+        with self.lock:
+            self.waiters.add(waiter)
+        try:
+            if seq is None:
+                seq = await latest()
+                yield _frame("reset", {"seq": seq}, seq)
+            sent_at = loop.time()
+            while True:
+                wakeup.clear()
+                events = await since(seq)
+                if events is None:
+                    seq = await latest()
+                    yield _frame("reset", {"seq": seq}, seq)
+                    continue
+                for seq, kind, data in events:
+                    yield _frame(kind, data, seq)
+                if events:
+                    sent_at = loop.time()
+                elif loop.time() - sent_at >= heartbeat:
+                    sent_at = loop.time()
+                    yield ": keepalive\n\n"
+                try:
+                    await asyncio.wait_for(wakeup.wait(), poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self.lock:
+                self.waiters.discard(waiter)
+
+
+def _frame(kind, data, event_id):
+    return f"id: {event_id}\nevent: {kind}\ndata: {json.dumps(data)}\n\n"
+
+
+def get_feed():
+    global _feed
+    with _feed_lock:
+        if _feed is None:
+            _feed = ChangeFeed(settings.CHANGE_FEED_BUFFER)
+        return _feed
+
+
+def _publish_on_commit(build):
+    # robust: the write has already committed, so a failure here is logged, not raised.
+    # The events are stored in their own autocommitted statements.
+    transaction.on_commit(lambda: get_feed().publish(build()), robust=True)
+
+
+def publish_items(item_ids):
+    """
+    Emit the current quantity and breach flag of items once committed.
+    """
+    item_ids = list(item_ids)
+    if item_ids:
+        _publish_on_commit(lambda: [
+            ("item", {"id": item_id, "quantity": quantity, "threshold_breached": breached})
+            for item_id, quantity, breached in InventoryItem.objects.filter(id__in=item_ids)
+            .values_list("id", "quantity", "threshold_breached")
+        ])
+
+
+def publish_item_deleted(item_id):
+    _publish_on_commit(lambda: [("item", {"id": item_id, "deleted": True})])
+
+
+def publish_cars(statuses):
+    """
+    Emit car status changes ({vin: status}) once committed.
+    """
+    if statuses:
+        events = [("car", {"vin": vin, "status": car_status}) for vin, car_status in statuses.items()]
+        _publish_on_commit(lambda: events)
+
+
+def publish_car_deleted(vin):
+    _publish_on_commit(lambda: [("car", {"vin": vin, "deleted": True})])
+
+
+async def change_feed(request):
+    """
+    Server-Sent Events stream of item and car deltas. Resume with the
+    Last-Event-ID header (sent by EventSource on reconnect) or ?last_event_id=.
+    Needs an ASGI server (see stockoverflow_backend/asgi.py): under WSGI the
+    endless stream would hold a worker, so the request is refused.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({"error": "The change feed is only served by the ASGI application."}, status=501)
+    feed = get_feed()
+    last_event_id = request.headers.get("Last-Event-ID") or request.GET.get("last_event_id")
+    response = StreamingHttpResponse(
+        feed.stream(feed.cursor(last_event_id), settings.CHANGE_FEED_HEARTBEAT, settings.CHANGE_FEED_POLL_INTERVAL),
+        content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # Don't let nginx buffer the stream
+    return response
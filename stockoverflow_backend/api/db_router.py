@@ -0,0 +1,57 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+from stockoverflow_backend.databases import REPLICA
+
+_replica_reads = ContextVar("replica_reads", default=False)
+
+
+class ReplicaRouter:
+    """
+    Sends reads to the "replica" alias, when one is configured, inside
+    replica_reads() blocks only. Everything else, and any read made inside
+    a transaction on the primary, stays on the primary, so a request never
+    misses its own writes. Migrations only run on the primary; the replica
+    gets its schema through replication.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and REPLICA in settings.DATABASES and not connections["default"].in_atomic_block:
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA
+
+
+@contextmanager
+def replica_reads():
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReplicaReadsMixin:
+    """
+    Serve a view's GET requests from the replica. For read-only list, log
+    and report views that can tolerate replication lag; views whose
+    responses are cached (response_cache) stay on the primary so a lagging
+    read is never cached under a new version.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method != "GET":
+            return super().dispatch(request, *args, **kwargs)
+        with replica_reads():
+            return super().dispatch(request, *args, **kwargs)
@@ -0,0 +1,72 @@
+import sys
+from datetime import datetime
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import models
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
+
+BOOLEAN_VALUES = {"true": True, "1": True, "false": False, "0": False}
+
+
+class QueryParamFilter(BaseFilterBackend):
+    """
+    Filters a list by the view's query_filters, a mapping of query
+    parameter -> ORM lookup, e.g. {"vin": "vin__startswith"}. A lookup may
+    also be a (lookup, normalizer) pair to clean the value first. Values
+    are converted with the model field so bad input is a 400, not a 500.
+
+    "<field>__prefix" is a case-sensitive startswith written as a range
+    (field >= value < next value), which any B-tree index on the field can
+    serve, unlike LIKE on SQLite or PostgreSQL with a non-C collation.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        lookups = {}
+        for param, lookup in getattr(view, "query_filters", {}).items():
+            value = request.query_params.get(param)
+            if value in (None, ""):
+                continue
+            if isinstance(lookup, tuple):
+                lookup, normalize = lookup
+                value = normalize(value)
+                if value in (None, ""):
+                    continue  # e.g. ?vin=%20, treated like an empty parameter
+            field = queryset.model._meta.get_field(lookup.split("__")[0])
+            if isinstance(field, models.BooleanField):
+                value = BOOLEAN_VALUES.get(value.lower(), value)
+            try:
+                value = field.to_python(value)
+            except DjangoValidationError:
+                raise ValidationError({param: f"Invalid value '{value}'."})
+            if isinstance(value, datetime) and timezone.is_naive(value):
+                value = timezone.make_aware(value)
+            if lookup.endswith("__prefix"):
+                name = lookup[:-len("__prefix")]
+                if ord(value[-1]) == sys.maxunicode:
+                    lookups[f"{name}__startswith"] = value  # No next value to bound the range with
+                    continue
+                lookups[f"{name}__gte"] = value
+                lookups[f"{name}__lt"] = value[:-1] + chr(ord(value[-1]) + 1)
+                continue
+            lookups[lookup] = value
+        return queryset.filter(**lookups) if lookups else queryset
+
+
+def is_filtered(request, view):
+    return any(request.query_params.get(param) for param in getattr(view, "query_filters", {}))
+
+
+class StableOrderingFilter(OrderingFilter):
+    """
+    OrderingFilter that always ends on the primary key, so rows with equal
+    sort values keep a fixed order across pages.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        ordering = list(super().get_ordering(request, queryset, view) or [])
+        if not any(field.lstrip("-") in ("id", "pk") for field in ordering):
+            descending = bool(ordering) and ordering[0].startswith("-")
+            ordering.append("-id" if descending else "id")
+        return tuple(ordering)
@@ -0,0 +1,119 @@
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .car_import import import_schedule, open_schedule
+from .metrics import IMPORT_JOBS, IMPORT_ROWS, IMPORT_SECONDS
+from .models import ImportJob
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMPORT_JOB_WORKERS, thread_name_prefix="import-job"
+        )
+    return _executor
+
+
+def save_upload(file):
+    """
+    Copy an uploaded schedule to IMPORT_JOB_DIR so the worker can read it
+    after the request has finished.
+    """
+    os.makedirs(settings.IMPORT_JOB_DIR, exist_ok=True)
+    extension = os.path.splitext(file.name or "")[1].lower() or ".xlsx"
+    path = os.path.join(settings.IMPORT_JOB_DIR, f"{uuid.uuid4().hex}{extension}")
+    file.seek(0)
+    with open(path, "wb") as out:
+        for chunk in file.chunks():
+            out.write(chunk)
+    return path
+
+
+def enqueue_import(file):
+    """
+    Create an ImportJob for an uploaded schedule and hand it to the worker
+    pool once the job row is committed.
+    """
+    job = ImportJob.objects.create(file_name=file.name or "", file_path=save_upload(file))
+    transaction.on_commit(lambda: get_executor().submit(run_import_job, job.id))
+    return job
+
+
+def retry_import(job):
+    """
+    Queue a finished job again. Cars are upserted by VIN, so re-running a
+    file that partly landed does not create duplicates.
+    """
+    updated = ImportJob.objects.filter(pk=job.pk, status__in=["completed", "failed"]).update(
+        status="pending", rows_processed=0, success_count=0, errors=[],
+        started_at=None, finished_at=None,
+    )
+    if updated:
+        transaction.on_commit(lambda: get_executor().submit(run_import_job, job.pk))
+    return bool(updated)
+
+
+def run_import_job(job_id):
+    """
+    Process one job. The pending -> running transition is a conditional
+    UPDATE, so a job picked up twice (pool and management command) only
+    runs once.
+    """
+    try:
+        claimed = ImportJob.objects.filter(pk=job_id, status="pending").update(
+            status="running", started_at=timezone.now(), attempts=F("attempts") + 1
+        )
+        if not claimed:
+            return
+        job = ImportJob.objects.get(pk=job_id)
+        started = time.perf_counter()
+
+        try:
+            with open(job.file_path, "rb") as file:
+                _, batches = open_schedule(file)
+                for report in import_schedule(batches):
+                    job.rows_processed = report["last_row"]
+                    job.success_count += report["success_count"]
+                    job.errors.extend(report["errors"])
+                    job.save(update_fields=["rows_processed", "success_count", "errors"])
+        except Exception as e:
+            job.status = "failed"
+            job.errors.append(f"Import failed: {str(e)}")
+        else:
+            job.status = "completed"
+
+        job.finished_at = timezone.now()
+        job.save(update_fields=["status", "errors", "finished_at"])
+        IMPORT_JOBS.inc(status=job.status)
+        IMPORT_SECONDS.observe(time.perf_counter() - started)
+        IMPORT_ROWS.inc(job.success_count, result="success")
+        IMPORT_ROWS.inc(len(job.errors), result="error")
+
+        if job.status == "completed" and not job.errors:
+            try:
+                os.remove(job.file_path)
+            except OSError:
+                pass
+    finally:
+        # Worker threads hold their own connection
+        connection.close()
+
+
+def run_pending_jobs():
+    """
+    Run every pending job in the current thread. Returns how many were run.
+    """
+    job_ids = list(ImportJob.objects.filter(status="pending").order_by("created_at").values_list("id", flat=True))
+    for job_id in job_ids:
+        run_import_job(job_id)
+    return len(job_ids)
@@ -0,0 +1,154 @@
+import json
+import logging
+import random
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+logger = logging.getLogger("api.requests")
+slow_logger = logging.getLogger("api.requests.slow")
+
+# Queries kept per request for the slow-request sampler
+MAX_CAPTURED_QUERIES = 200
+
+# The current request's QueryRecorder. A context variable rather than a
+# per-connection execute_wrapper: under ASGI the ORM runs in sync_to_async
+# threads with their own connections, which still see the request's context.
+_recorder = ContextVar("query_recorder", default=None)
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper that counts queries and their time. Queries
+    with the same SQL text (parameters aside) run more than once are the
+    duplicates that point at N+1 loops. With capture on, the SQL and
+    timing of each query is kept as well.
+    """
+
+    def __init__(self, capture=False):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+        self.capture = capture
+        self.captured = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.duration += elapsed
+            self.statements[sql] += 1
+            if self.capture and len(self.captured) < MAX_CAPTURED_QUERIES:
+                self.captured.append({"sql": sql, "ms": round(elapsed * 1000, 2), "many": many})
+
+    @property
+    def duplicates(self):
+        return sum(count - 1 for count in self.statements.values() if count > 1)
+
+
+def record_queries(execute, sql, params, many, context):
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install_query_recorder(connection):
+    """
+    Add record_queries to a new connection's execute wrappers (see the
+    connection_created receiver in signals.py).
+    """
+    if record_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_queries)
+
+
+class RequestMetricsMiddleware:
+    """
+    Records per request: route, status, query count, SQL time, duplicate
+    queries, response size and total time. They are added as a
+    Server-Timing header and logged as one JSON line on "api.requests".
+
+    With REQUEST_METRICS_SLOW_MS set, requests at least that slow are
+    sampled (REQUEST_METRICS_SLOW_SAMPLE_RATE) and logged on
+    "api.requests.slow" together with their SQL.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Native under ASGI, so the async views don't pay for a thread hop here
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not settings.REQUEST_METRICS:
+            return self.get_response(request)
+
+        recorder = QueryRecorder(capture=settings.REQUEST_METRICS_SLOW_MS is not None)
+        started = time.perf_counter()
+        token = _recorder.set(recorder)
+        try:
+            response = self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        return self.record(request, response, recorder, started)
+
+    async def __acall__(self, request):
+        if not settings.REQUEST_METRICS:
+            return await self.get_response(request)
+
+        recorder = QueryRecorder(capture=settings.REQUEST_METRICS_SLOW_MS is not None)
+        started = time.perf_counter()
+        token = _recorder.set(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        return self.record(request, response, recorder, started)
+
+    def record(self, request, response, recorder, started):
+        total_ms = (time.perf_counter() - started) * 1000
+        db_ms = recorder.duration * 1000
+
+        response["Server-Timing"] = ", ".join([
+            f'db;dur={db_ms:.2f};desc="{recorder.count} queries, {recorder.duplicates} duplicate"',
+            f"app;dur={total_ms - db_ms:.2f}",
+            f"total;dur={total_ms:.2f}",
+        ])
+
+        match = request.resolver_match
+        record = {
+            "method": request.method,
+            "route": match.route if match else None,
+            "view": match.view_name if match else None,
+            "path": request.path,
+            "status": response.status_code,
+            "queries": recorder.count,
+            "duplicate_queries": recorder.duplicates,
+            "db_ms": round(db_ms, 2),
+            "total_ms": round(total_ms, 2),
+            "response_bytes": None if response.streaming else len(response.content),
+        }
+        request.metrics = record
+        logger.info(json.dumps(record))
+
+        slow_ms = settings.REQUEST_METRICS_SLOW_MS
+        if slow_ms is not None and total_ms >= slow_ms and random.random() < settings.REQUEST_METRICS_SLOW_SAMPLE_RATE:
+            repeated = {sql: count for sql, count in recorder.statements.items() if count > 1}
+            slow_logger.warning(json.dumps({
+                **record,
+                "slowest": sorted(recorder.captured, key=lambda query: query["ms"], reverse=True)[:20],
+                "repeated": sorted(repeated.items(), key=lambda item: item[1], reverse=True)[:20],
+            }))
+        return response
@@ -0,0 +1,146 @@
+import gzip
+import json
+import os
+import re
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .logs import LOG_FIELDS
+from .models import Log
+
+ARCHIVE_NAME = re.compile(r"^logs-(\d{4}-\d{2})\.jsonl\.gz$")
+
+
+def archive_path(month):
+    return os.path.join(settings.LOG_ARCHIVE_DIR, f"logs-{month}.jsonl.gz")
+
+
+def archived_months():
+    if not os.path.isdir(settings.LOG_ARCHIVE_DIR):
+        return []
+    months = [ARCHIVE_NAME.match(name) for name in os.listdir(settings.LOG_ARCHIVE_DIR)]
+    return sorted(match.group(1) for match in months if match)
+
+
+def archive_logs(older_than_days=None, batch_size=1000):
+    """
+    Move logs older than the retention window into gzip JSONL files, one
+    per month, oldest first. Each batch is appended to its archive and
+    then deleted in its own short transaction, so the table is never
+    locked for the whole run. Returns the number of logs archived.
+
+    Archived rows keep their id. If a run dies between writing and
+    deleting, the next run archives the batch again and readers drop the
+    duplicate.
+    """
+    if older_than_days is None:
+        older_than_days = settings.LOG_RETENTION_DAYS
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    os.makedirs(settings.LOG_ARCHIVE_DIR, exist_ok=True)
+
+    archived = 0
+    while True:
+        rows = list(
+            Log.objects.filter(timestamp__lt=cutoff)
+            .order_by("timestamp", "id")
+            .values("id", *LOG_FIELDS)[:batch_size]
+        )
+        if not rows:
+            return archived
+
+        by_month = {}
+        for row in rows:
+            row["timestamp"] = row["timestamp"].isoformat()
+            by_month.setdefault(row["timestamp"][:7], []).append(row)
+        for month, month_rows in by_month.items():
+            # Each append adds a gzip member; gzip.open reads them back as one stream
+            with gzip.open(archive_path(month), "at", encoding="utf-8") as archive:
+                archive.writelines(json.dumps(row) + "\n" for row in month_rows)
+
+        with transaction.atomic():
+            Log.objects.filter(id__in=[row["id"] for row in rows]).delete()
+        archived += len(rows)
+
+
+def read_archive(month):
+    """
+    Yield the archived logs of one month (YYYY-MM), skipping duplicates.
+    """
+    seen = set()
+    with gzip.open(archive_path(month), "rt", encoding="utf-8") as archive:
+        for line in archive:
+            row = json.loads(line)
+            if row["id"] in seen:
+                continue
+            seen.add(row["id"])
+            yield row
+
+
+def _parse_bound(value):
+    """
+    Accept the same since/until values as the log API: a date or a datetime.
+    """
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Invalid date '{value}'.")
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def filter_archived(rows, action=None, user=None, item=None, since=None, until=None):
+    """
+    Apply the log API filters to archived rows. Bad dates raise ValueError
+    here rather than halfway through a stream.
+    """
+    since = _parse_bound(since) if since else None
+    until = _parse_bound(until) if until else None
+
+    def matching():
+        for row in rows:
+            if action and row["action"] != action:
+                continue
+            if user and row["user"] != user:
+                continue
+            if item and row["item_name"] != item:
+                continue
+            if since or until:
+                timestamp = parse_datetime(row["timestamp"])
+                if since and timestamp < since:
+                    continue
+                if until and timestamp >= until:
+                    continue
+            yield row
+
+    return matching()
+
+
+def compact_archive(month):
+    """
+    Rewrite a month's archive as a single gzip member, deduplicated and
+    sorted by timestamp.
+    """
+    rows = sorted(read_archive(month), key=lambda row: (row["timestamp"], row["id"]))
+    tmp_path = archive_path(month) + ".tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as archive:
+        archive.writelines(json.dumps(row) + "\n" for row in rows)
+    os.replace(tmp_path, archive_path(month))
+    return len(rows)
+
+
+def vacuum_logs():
+    """
+    Give the space freed by archived rows back to the database.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(f"VACUUM ANALYZE {Log._meta.db_table}")
+        elif connection.vendor == "sqlite":
+            cursor.execute("VACUUM")
@@ -0,0 +1,45 @@
+import csv
+import json
+from itertools import chain
+
+from django.http import StreamingHttpResponse
+
+LOG_FIELDS = ["action", "item_name", "user", "timestamp", "details"]
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", "logs.ndjson"),
+    "csv": ("text/csv", "logs.csv"),
+}
+
+
+class _Echo:
+    """File-like object for csv.writer that hands each line straight back."""
+
+    def write(self, value):
+        return value
+
+
+def log_rows(queryset, chunk_size=2000):
+    """
+    Yield logs as dicts without materializing the queryset.
+    """
+    for row in queryset.values(*LOG_FIELDS).iterator(chunk_size=chunk_size):
+        row["timestamp"] = row["timestamp"].isoformat()
+        yield row
+
+
+def export_logs(rows, export_format):
+    """
+    Stream log rows as NDJSON or CSV.
+    """
+    content_type, filename = EXPORT_FORMATS[export_format]
+    if export_format == "csv":
+        writer = csv.writer(_Echo())
+        body = chain(
+            [writer.writerow(LOG_FIELDS)],
+            (writer.writerow([row[field] for field in LOG_FIELDS]) for row in rows),
+        )
+    else:
+        body = (json.dumps(row) + "\n" for row in rows)
+    response = StreamingHttpResponse(body, content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,36 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.log_archive import archive_logs, archived_months, compact_archive, vacuum_logs
+
+class Command(BaseCommand):
+    help = "Move logs older than the retention window into monthly gzip archives"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=settings.LOG_RETENTION_DAYS,
+                            help="Archive logs older than this many days")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--compact", action="store_true",
+                            help="Rewrite each month's archive as one deduplicated file")
+        parser.add_argument("--vacuum", action="store_true",
+                            help="Reclaim database space after archiving")
+        parser.add_argument("--every", type=int, metavar="SECONDS",
+                            help="Keep running and archive again every SECONDS")
+
+    def handle(self, *args, **options):
+        while True:
+            self.run_once(options)
+            if not options["every"]:
+                break
+            time.sleep(options["every"])
+
+    def run_once(self, options):
+        archived = archive_logs(options["days"], options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} log(s) older than {options['days']} days."))
+        if options["compact"]:
+            for month in archived_months():
+                count = compact_archive(month)
+                self.stdout.write(f"Compacted {month}: {count} log(s).")
+        if options["vacuum"] and archived:
+            vacuum_logs()
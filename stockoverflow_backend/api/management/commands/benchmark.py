@@ -0,0 +1,314 @@
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+import uuid
+from datetime import date, timedelta
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from openpyxl import Workbook
+
+from api.car_import import EXPECTED_COLUMNS, import_schedule, open_schedule
+from api.models import Car, CarPart, InventoryItem, Log, User
+
+SCENARIOS = (
+    "inventory_list", "inventory_tree", "checkout_create", "scan_vin",
+    "scan_item", "confirm_session", "excel_upload", "car_import", "log_list",
+)
+LOG_ACTIONS = ("Scanned Car", "Scanned Unknown Car", "Updated Item", "Checkout", "Deleted Item")
+BATCH_SIZE = 5_000
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed synthetic data at scale, measure latency percentiles and query counts "
+        "of the API hot paths and write the results to JSON. Everything runs in a "
+        "rolled-back transaction; point SQLITE_PATH at a scratch copy for big runs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--cars", type=int, default=100_000)
+        parser.add_argument("--items", type=int, default=20_000,
+                            help="Inventory items, in trees of a parent, two children and two grandchildren")
+        parser.add_argument("--logs", type=int, default=1_000_000)
+        parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+        parser.add_argument("--upload-rows", type=int, default=1_000, help="Rows in the generated schedule")
+        parser.add_argument("--scenarios", nargs="*", choices=SCENARIOS, default=SCENARIOS)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--output", help="Results file (default: BASE_DIR/benchmarks/<timestamp>.json)")
+        parser.add_argument("--compare", help="An earlier results file to compare against")
+
+    def handle(self, *args, **options):
+        if options["compare"] and not os.path.exists(options["compare"]):
+            raise CommandError(f"No results file at {options['compare']}.")
+        self.rng = random.Random(options["seed"])
+        self.options = options
+        self.samples = {}
+
+        with tempfile.TemporaryDirectory() as import_dir, override_settings(
+            ALLOWED_HOSTS=["*"],
+            AUDIT_LOG_ASYNC=False,  # Audit entries are rolled back with everything else
+            EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+            IMPORT_JOB_DIR=import_dir,
+            METRICS_DIR=None,  # Keep benchmark requests out of the server's metrics
+            REQUEST_METRICS=False,  # One log line per request would drown the output
+            # Measure the database work, not the response cache
+            CACHES={**settings.CACHES, "benchmark": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}},
+            RESPONSE_CACHE_ALIAS="benchmark",
+        ), transaction.atomic():
+            seeding = self.seed()
+            self.client = Client()
+            self.client.force_login(self.user)
+            for scenario in options["scenarios"]:
+                started = time.perf_counter()
+                getattr(self, f"bench_{scenario}")()
+                self.stdout.write(f"{scenario}: {time.perf_counter() - started:.1f}s")
+            transaction.set_rollback(True)
+
+        results = {
+            "started_at": timezone.now().isoformat(),
+            "commit": git_commit(),
+            "environment": {
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": connection.vendor,
+            },
+            "scale": {key: options[key] for key in ("cars", "items", "logs", "requests", "upload_rows", "seed")},
+            "seeding_seconds": seeding,
+            "scenarios": {name: summarize(samples) for name, samples in self.samples.items()},
+        }
+        output = options["output"] or os.path.join(
+            settings.BASE_DIR, "benchmarks", f"{timezone.now():%Y%m%d-%H%M%S}.json"
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+        self.report(results["scenarios"])
+        if options["compare"]:
+            with open(options["compare"], encoding="utf-8") as file:
+                self.compare(json.load(file)["scenarios"], results["scenarios"])
+        self.stdout.write(self.style.SUCCESS(f"Results written to {output}"))
+
+    # Seeding
+
+    def seed(self):
+        timings = {}
+        for name, seed in (("users", self.seed_users), ("items", self.seed_items),
+                           ("cars", self.seed_cars), ("logs", self.seed_logs)):
+            started = time.perf_counter()
+            count = seed()
+            timings[name] = round(time.perf_counter() - started, 2)
+            self.stdout.write(f"Seeded {count} {name} in {timings[name]:.1f}s")
+        return timings
+
+    def seed_users(self):
+        self.user = User.objects.create_user(username=f"bench-{uuid.uuid4().hex[:8]}", role="admin", unique_id="BENCH0")
+        return 1
+
+    def seed_items(self):
+        # Quantities are large enough that no checkout or confirm runs short
+        def item(n, parent_id=None):
+            return InventoryItem(
+                name=f"Bench part {n}", sku=f"BENCH-{n:06d}", barcode=f"BENCH{n:08d}",
+                quantity=10 ** 9, threshold=self.rng.randrange(50), category="Production", parent_id=parent_id,
+            )
+
+        trees = max(1, self.options["items"] // 5)
+        roots = InventoryItem.objects.bulk_create((item(n) for n in range(trees)), batch_size=BATCH_SIZE)
+        children = InventoryItem.objects.bulk_create(
+            (item(trees + 2 * i + k, root.id) for i, root in enumerate(roots) for k in (0, 1)), batch_size=BATCH_SIZE
+        )
+        InventoryItem.objects.bulk_create(
+            (item(3 * trees + i, child.id) for i, child in enumerate(children)), batch_size=BATCH_SIZE
+        )
+        self.barcodes = list(InventoryItem.objects.filter(sku__startswith="BENCH-").values_list("barcode", flat=True))
+        return len(self.barcodes)
+
+    def seed_cars(self):
+        today = date.today()
+        statuses = ("from_upcoming", "from_upcoming", "allocated", "")
+        Car.objects.bulk_create(
+            (Car(vin=f"BENCH{n:012d}", model="Bench", status=statuses[n % len(statuses)],
+                 scheduled_date=today + timedelta(days=n % 365)) for n in range(self.options["cars"])),
+            batch_size=BATCH_SIZE,
+        )
+        # One part per upcoming car, so stock movements have demand to recompute
+        item_ids = list(InventoryItem.objects.filter(sku__startswith="BENCH-").values_list("id", flat=True))
+        car_ids = Car.objects.filter(vin__startswith="BENCH", status="from_upcoming").values_list("id", flat=True)
+        CarPart.objects.bulk_create(
+            (CarPart(car_id=car_id, inventory_item_id=self.rng.choice(item_ids)) for car_id in list(car_ids)),
+            batch_size=BATCH_SIZE,
+        )
+        return self.options["cars"]
+
+    def seed_logs(self):
+        now = timezone.now()
+        Log.objects.bulk_create(
+            (Log(action=LOG_ACTIONS[n % len(LOG_ACTIONS)], item_name=f"BENCH{n % 100_000:012d}",
+                 user=f"user{n % 50}", timestamp=now - timedelta(seconds=n * 30), details="Benchmark")
+             for n in range(self.options["logs"])),
+            batch_size=BATCH_SIZE,
+        )
+        return self.options["logs"]
+
+    # Scenarios
+
+    def measure(self, name, request):
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            response = request()
+            elapsed = (time.perf_counter() - started) * 1000
+        samples = self.samples.setdefault(name, {"ms": [], "queries": [], "errors": 0})
+        samples["ms"].append(elapsed)
+        samples["queries"].append(len(ctx.captured_queries))
+        if response is not None and response.status_code >= 400:
+            samples["errors"] += 1
+        return response
+
+    def post(self, path, data):
+        return self.client.post(path, data, content_type="application/json")
+
+    def bench_inventory_list(self):
+        for _ in range(self.options["requests"]):
+            self.measure("inventory_list", lambda: self.client.get("/api/inventory/?category=Production&page_size=50"))
+
+    def bench_inventory_tree(self):
+        # The whole tree in one response; a tenth of the requests, it is the slowest read
+        for _ in range(max(1, self.options["requests"] // 10)):
+            self.measure("inventory_tree", lambda: self.client.get("/api/inventory/"))
+
+    def bench_checkout_create(self):
+        for n in range(self.options["requests"]):
+            body = {
+                "user": self.user.unique_id, "vin": f"BENCH{self.rng.randrange(self.options['cars']):012d}",
+                "order_number": f"BENCH-{n}",
+                "parts": [{"part": barcode} for barcode in self.rng.sample(self.barcodes, min(5, len(self.barcodes)))],
+            }
+            self.measure("checkout_create", lambda: self.post("/api/checkout/", body))
+
+    def bench_scan_vin(self):
+        for _ in range(self.options["requests"]):
+            # Mostly known VINs (first and repeat scans), some unknown
+            if self.rng.random() < 0.9:
+                vin = f"bench{self.rng.randrange(self.options['cars']):012d}"
+            else:
+                vin = f"UNKNOWN{self.rng.randrange(10 ** 9):010d}"
+            self.measure("scan_vin", lambda: self.post("/api/api/scan_vin/", {"vin": vin}))
+
+    def bench_scan_item(self):
+        # Sessions of five scans, kept for confirm_session
+        self.sessions = []
+        for n in range(self.options["requests"]):
+            if n % 5 == 0:
+                self.sessions.append(str(uuid.uuid4()))
+            data = {"session_id": self.sessions[-1], "car_label": "Bench", "part_barcode": self.rng.choice(self.barcodes)}
+            self.measure("scan_item", lambda: self.client.post("/api/api/scan_item/", data))
+
+    def bench_confirm_session(self):
+        if not getattr(self, "sessions", None):
+            self.bench_scan_item()
+        for session_id in self.sessions:
+            self.measure("confirm_session", lambda: self.client.post("/api/api/confirm_session/", {"session_id": session_id}))
+
+    def schedule(self, prefix):
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(list(EXPECTED_COLUMNS))
+        today = date.today()
+        for n in range(self.options["upload_rows"]):
+            sheet.append([f"{prefix}{n:09d}", "Bench", "", today, today, "Client", "", "Yard"])
+        file = io.BytesIO()
+        workbook.save(file)
+        file.name = "schedule.xlsx"
+        return file
+
+    def bench_excel_upload(self):
+        # Validate and queue; the import itself is car_import
+        content = self.schedule("UPLOAD").getvalue()
+        for _ in range(self.options["requests"]):
+            file = io.BytesIO(content)
+            file.name = "schedule.xlsx"
+            self.measure("excel_upload", lambda: self.client.post("/api/api/cars/bulk_upload/", {"file": file}))
+
+    def bench_car_import(self):
+        # Half new VINs, half updates of seeded cars; one sample per file
+        def run_import(file):
+            for _ in import_schedule(open_schedule(file)[1]):
+                pass
+
+        for n in range(max(1, self.options["requests"] // 20)):
+            file = self.schedule(f"IMP{n:03d}" if n % 2 else "BENCH000")
+            self.measure("car_import", lambda: run_import(file))
+
+    def bench_log_list(self):
+        for n in range(self.options["requests"]):
+            path = "/api/logs/" if n % 2 else f"/api/logs/?action={LOG_ACTIONS[n % len(LOG_ACTIONS)]}"
+            self.measure("log_list", lambda: self.client.get(path))
+
+    # Output
+
+    def report(self, scenarios):
+        for name, result in scenarios.items():
+            self.stdout.write(
+                f"{name:16} {result['requests']:5} req  p50 {result['p50_ms']:8.2f}ms  "
+                f"p95 {result['p95_ms']:8.2f}ms  p99 {result['p99_ms']:8.2f}ms  "
+                f"{result['queries_mean']:6.1f} queries  {result['errors']} errors"
+            )
+
+    def compare(self, before, after):
+        self.stdout.write(self.style.MIGRATE_HEADING("Change against the baseline:"))
+        for name, result in after.items():
+            if name not in before:
+                continue
+            changes = "  ".join(
+                f"{key} {before[name][key]:.2f} -> {result[key]:.2f} ({change(before[name][key], result[key])})"
+                for key in ("p50_ms", "p95_ms", "queries_mean")
+            )
+            self.stdout.write(f"{name:16} {changes}")
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else 0.0
+
+
+def summarize(samples):
+    timings = sorted(samples["ms"])
+    return {
+        "requests": len(timings),
+        "errors": samples["errors"],
+        "p50_ms": round(percentile(timings, 50), 3),
+        "p95_ms": round(percentile(timings, 95), 3),
+        "p99_ms": round(percentile(timings, 99), 3),
+        "mean_ms": round(statistics.mean(timings), 3),
+        "max_ms": round(timings[-1], 3),
+        "queries_mean": round(statistics.mean(samples["queries"]), 2),
+        "queries_max": max(samples["queries"]),
+    }
+
+
+def change(before, after):
+    if not before:
+        return "n/a"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,62 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIRequestFactory
+from api.car_inventory import scan_vin
+from api.models import Car
+
+class Command(BaseCommand):
+    help = "Measure scan_vin latency against a large car table (seeded and rolled back)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--cars", type=int, default=100_000)
+        parser.add_argument("--scans", type=int, default=2_000)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        factory = APIRequestFactory()
+
+        # Audit entries are written inline so the rollback removes them too
+        with override_settings(AUDIT_LOG_ASYNC=False), transaction.atomic():
+            started = time.perf_counter()
+            Car.objects.bulk_create(
+                (Car(vin=f"BENCH{i:012d}", model="Bench", status="from_upcoming") for i in range(options["cars"])),
+                batch_size=5_000,
+            )
+            self.stdout.write(f"Seeded {options['cars']} cars in {time.perf_counter() - started:.1f}s")
+
+            with connection.cursor() as cursor:
+                sql, params = Car.objects.filter(vin="BENCH000000000001").query.sql_with_params()
+                prefix = "EXPLAIN QUERY PLAN " if connection.vendor == "sqlite" else "EXPLAIN "
+                cursor.execute(prefix + sql, params)
+                self.stdout.write("Lookup plan: " + " | ".join(str(row[-1]) for row in cursor.fetchall()))
+
+            timings, queries = [], []
+            for _ in range(options["scans"]):
+                # Mostly known VINs (first and repeat scans), some unknown
+                if rng.random() < 0.9:
+                    vin = f"bench{rng.randrange(options['cars']):012d}"
+                else:
+                    vin = f"UNKNOWN{rng.randrange(10**9):010d}"
+                request = factory.post("/api/api/scan_vin/", {"vin": vin}, format="json")
+                with CaptureQueriesContext(connection) as ctx:
+                    started = time.perf_counter()
+                    scan_vin(request)
+                    timings.append((time.perf_counter() - started) * 1000)
+                queries.append(len(ctx.captured_queries))
+
+            transaction.set_rollback(True)
+
+        timings.sort()
+        def percentile(p):
+            return timings[min(len(timings) - 1, int(len(timings) * p / 100))]
+        self.stdout.write(self.style.SUCCESS(
+            f"{options['scans']} scans: p50 {percentile(50):.2f}ms, p95 {percentile(95):.2f}ms, "
+            f"p99 {percentile(99):.2f}ms, mean {statistics.mean(timings):.2f}ms, "
+            f"{statistics.mean(queries):.1f} queries/scan"
+        ))
@@ -0,0 +1,127 @@
+import re
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+# Endpoint -> tables it may scan in full, plus "sort" if sorting the matches is expected
+ENDPOINTS = {
+    "/api/cars/?status=from_upcoming&page_size=50": set(),
+    "/api/cars/?vin=WV&page_size=50": {"sort"},  # VIN range, then id order
+    "/api/cars/?scheduled_after=2025-01-01&ordering=scheduled_date&page_size=50": set(),
+    "/api/cars/?page_size=50": set(),
+    "/api/checkout/?vin=WV&page_size=50": {"sort"},  # VIN range, then newest first
+    "/api/checkout/?order_number=1001": set(),
+    "/api/checkout/?page_size=50": set(),
+    "/api/inventory/?category=Production&page_size=50": set(),
+    "/api/inventory/?threshold_breached=true&page_size=50": set(),
+    "/api/inventory/": {"api_inventoryitem"},  # The whole tree
+    # Compares quantity with threshold on every item that could breach
+    "/api/inventory/shortfalls/": {"api_inventoryitem"},
+    "/api/logs/?action=Scanned%20Car": set(),
+    "/api/logs/?user=admin": set(),
+    "/api/logs/": set(),
+    "/api/import_jobs/": set(),
+    "/api/api/scan_sessions/stats/": set(),
+}
+
+# Table scans; walking an index in order (SCAN t USING INDEX) is not one
+SQLITE_FULL_SCAN = re.compile(r"^SCAN (\w+)\b(?! USING (?:COVERING )?INDEX)")
+POSTGRES_FULL_SCAN = re.compile(r"Seq Scan on (\w+)")
+SORT = re.compile(r"USE TEMP B-TREE FOR ORDER BY|^\s*->\s*Sort\b|^Sort\b")
+ORDER_BY_PK = re.compile(r'\bORDER BY "(\w+)"\."id"(?: ASC| DESC)?(?:,|\s+LIMIT\b|\s*$)', re.IGNORECASE)
+
+
+class Command(BaseCommand):
+    help = (
+        "EXPLAIN every query issued by the main GET endpoints and flag full table "
+        "scans and in-memory sorts. Runs in a rolled-back transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("endpoints", nargs="*", help="Paths to check (default: the built-in list)")
+        parser.add_argument("--verbose-plans", action="store_true", help="Print every plan, not just problems")
+        parser.add_argument("--fail-on-scan", action="store_true",
+                            help="Exit with an error if any unexpected full scan is found (for CI)")
+
+    def handle(self, *args, **options):
+        endpoints = {path: ENDPOINTS.get(path, set()) for path in options["endpoints"]} or ENDPOINTS
+        problems = 0
+        # Bypass the response cache so every endpoint really queries
+        with override_settings(
+            ALLOWED_HOSTS=["*"],
+            METRICS_DIR=None,  # Keep these requests out of the server's metrics
+            CACHES={**settings.CACHES, "explain": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}},
+            RESPONSE_CACHE_ALIAS="explain",
+        ), transaction.atomic():
+            client = Client()
+            for path, allowed in endpoints.items():
+                problems += self.check_endpoint(client, path, allowed, options["verbose_plans"])
+            transaction.set_rollback(True)
+
+        summary = f"{len(endpoints)} endpoint(s) checked, {problems} problem(s)."
+        if problems and options["fail_on_scan"]:
+            raise CommandError(summary)
+        self.stdout.write(self.style.SUCCESS(summary) if not problems else self.style.WARNING(summary))
+
+    def check_endpoint(self, client, path, allowed, verbose):
+        with ExitStack() as stack:
+            captured = {
+                alias: stack.enter_context(CaptureQueriesContext(connections[alias]))
+                for alias in settings.DATABASES
+            }
+            status = client.get(path, HTTP_ACCEPT="application/json").status_code
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{path} -> {status}"))
+        problems = 0
+        for alias, context in captured.items():
+            for query in context.captured_queries:
+                sql = query["sql"]
+                if not sql.lstrip().upper().startswith("SELECT"):
+                    continue
+                plan = explain(connections[alias], sql)
+                issues = plan_issues(connections[alias].vendor, sql, plan, allowed)
+                problems += len(issues)
+                if issues or verbose:
+                    self.stdout.write(f"  {sql[:160]}")
+                    for line in plan:
+                        self.stdout.write(f"    {line}")
+                for issue in issues:
+                    self.stdout.write(self.style.WARNING(f"    ! {issue}"))
+        return problems
+
+
+def explain(connection, sql):
+    prefix = "EXPLAIN QUERY PLAN " if connection.vendor == "sqlite" else "EXPLAIN "
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql)
+        return [str(row[-1]) for row in cursor.fetchall()]
+
+
+def plan_issues(vendor, sql, plan, allowed):
+    full_scan = SQLITE_FULL_SCAN if vendor == "sqlite" else POSTGRES_FULL_SCAN
+    sorted_in_memory = any(SORT.search(line) for line in plan)
+    issues = []
+    for line in plan:
+        match = full_scan.search(line.strip())
+        if match and match.group(1) not in allowed and not early_exit(vendor, sql, match.group(1), sorted_in_memory):
+            issues.append(f"full scan of {match.group(1)}")
+        if SORT.search(line) and "sort" not in allowed:
+            issues.append("sort without an index")
+    return issues
+
+
+def early_exit(vendor, sql, table, sorted_in_memory):
+    """
+    Whether a scan of table is a keyset page rather than a full scan.
+    SQLite walks a table in primary key order, so ordered by that key and
+    limited it stops after one page. An ordered PostgreSQL primary key
+    walk is an Index Scan and never reported in the first place.
+    """
+    if vendor != "sqlite" or sorted_in_memory or not re.search(r"\bLIMIT\b", sql, re.IGNORECASE):
+        return False
+    match = ORDER_BY_PK.search(sql)
+    return match is not None and match.group(1) == table
@@ -0,0 +1,237 @@
+import asyncio
+import http.client
+import json
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+
+from api.models import InventoryItem, ScanLine, ScannedItem, User
+
+# (sync path under WSGI, async path under ASGI), relative to the server root
+SCENARIOS = {
+    "scan_vin": ("/api/api/scan_vin/", "/api/async/scan_vin/"),
+    "scan_item": ("/api/api/scan_item/", "/api/async/scan_item/"),
+    "confirm_session": ("/api/api/confirm_session/", "/api/async/confirm_session/"),
+    "checkout": ("/api/checkout/", "/api/async/checkout/"),
+}
+# Both scan_item views need a logged-in user; DRF's checkout would then also want a CSRF token
+LOGIN_SCENARIOS = {"scan_item"}
+PARTS = 20  # Seeded inventory items, cycled through by the part scenarios
+SCANS_PER_SESSION = 10
+LINES_PER_SESSION = 5
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare requests/sec and latency of the WSGI and ASGI scan and checkout paths. "
+        "Start the servers first, against a disposable database that this command can "
+        "also reach (it seeds parts, a user and scan sessions), e.g. "
+        "`gunicorn -w 4 stockoverflow_backend.wsgi` and `uvicorn stockoverflow_backend.asgi:application`. "
+        "With --in-process both paths are driven through Django's test clients instead, "
+        "one request at a time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--wsgi-url", help="Base URL of the WSGI server, e.g. http://127.0.0.1:8000")
+        parser.add_argument("--asgi-url", help="Base URL of the ASGI server, e.g. http://127.0.0.1:8001")
+        parser.add_argument("--in-process", action="store_true",
+                            help="Run both paths through the WSGI and ASGI request handlers in this process")
+        parser.add_argument("--scenario", choices=SCENARIOS, default="scan_vin")
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--concurrency", type=int, default=32)
+        parser.add_argument("--vins", type=int, default=500,
+                            help="Distinct VINs to cycle through; the first scan of each adds a car")
+
+    def handle(self, *args, **options):
+        if options["in_process"]:
+            urls = (None, None)
+        else:
+            urls = (options["wsgi_url"], options["asgi_url"])
+            if not any(urls):
+                raise CommandError("Pass --wsgi-url and/or --asgi-url, or --in-process.")
+
+        scenario = options["scenario"]
+        cookie = self.login_cookie() if scenario in LOGIN_SCENARIOS else None
+        for name, url, path in zip(("WSGI", "ASGI"), urls, SCENARIOS[scenario]):
+            if url is None and not options["in_process"]:
+                continue
+            # Built up front so the timings don't include building the bodies
+            bodies = self.prepare(scenario, options)
+            if options["in_process"]:
+                result = self.run_in_process(name == "ASGI", path, bodies, cookie)
+            else:
+                result = self.run(url, path, bodies, cookie, options["concurrency"])
+            self.stdout.write(
+                f"{name:5} {result['requests']} requests, {result['errors']} errors, "
+                f"{result['rps']:.1f} req/s, p50 {result['p50']:.1f}ms, "
+                f"p95 {result['p95']:.1f}ms, p99 {result['p99']:.1f}ms"
+            )
+
+    # Fixtures
+
+    def user(self):
+        user, _ = User.objects.get_or_create(username="loadtest", defaults={"role": "admin"})
+        return user
+
+    def login_cookie(self):
+        client = Client()
+        client.force_login(self.user())
+        return f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+
+    def parts(self):
+        """
+        Barcodes and ids of the seeded parts, restocked so no run goes short.
+        """
+        parts = []
+        for n in range(PARTS):
+            item, _ = InventoryItem.objects.update_or_create(
+                barcode=f"LOADTEST-PART-{n}",
+                defaults={"name": f"Load test part {n}", "sku": f"LOADTEST-{n}", "quantity": 10 ** 9,
+                          "threshold": 0, "category": "Production"},
+            )
+            parts.append((item.barcode, item.id))
+        return parts
+
+    def prepare(self, scenario, options):
+        """
+        Seed what the scenario needs and return its request bodies as
+        (body, content type) pairs.
+        """
+        count, vins = options["requests"], options["vins"]
+        if scenario == "scan_vin":
+            return [json_body({"vin": f"LOADTEST{n % vins:09d}"}) for n in range(count)]
+
+        parts = self.parts()
+        if scenario == "scan_item":
+            # The first scan of each session creates it
+            sessions = [str(uuid.uuid4()) for _ in range(count // SCANS_PER_SESSION + 1)]
+            return [
+                form_body({
+                    "session_id": sessions[n // SCANS_PER_SESSION],
+                    "car_label": "LOADTEST",
+                    "part_barcode": parts[n % PARTS][0],
+                })
+                for n in range(count)
+            ]
+
+        if scenario == "confirm_session":
+            # Confirming closes a session, so every request gets its own
+            user = self.user()
+            sessions = ScannedItem.objects.bulk_create([
+                ScannedItem(car_label="LOADTEST", user=user) for _ in range(count)
+            ])
+            ScanLine.objects.bulk_create([
+                ScanLine(session=session, item_id=parts[(n + line) % PARTS][1], count=1)
+                for n, session in enumerate(sessions)
+                for line in range(LINES_PER_SESSION)
+            ])
+            return [form_body({"session_id": str(session.session_id)}) for session in sessions]
+
+        unique_id = self.user().unique_id
+        run = uuid.uuid4().hex[:8]
+        return [
+            json_body({
+                "user": unique_id,
+                "vin": f"LOADTEST{n % vins:09d}",
+                "order_number": f"LOADTEST-{run}-{n}",
+                "parts": [{"part": parts[n % PARTS][0]}],
+            })
+            for n in range(count)
+        ]
+
+    # Runners
+
+    def run(self, url, path, bodies, cookie, concurrency):
+        parts = urlsplit(url)
+        connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        local = threading.local()
+        timings, errors = [], []
+        lock = threading.Lock()
+
+        def request(body):
+            # One keep-alive connection per client thread
+            if not hasattr(local, "connection"):
+                local.connection = connection_class(parts.netloc, timeout=30)
+            content, content_type = body
+            headers = {"Content-Type": content_type, **({"Cookie": cookie} if cookie else {})}
+            started = time.perf_counter()
+            try:
+                local.connection.request("POST", parts.path.rstrip("/") + path, content, headers)
+                response = local.connection.getresponse()
+                response.read()
+                ok = response.status < 400
+            except (OSError, http.client.HTTPException):
+                local.connection.close()
+                del local.connection
+                ok = False
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                (timings if ok else errors).append(elapsed)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(request, bodies))
+        return summarize(timings, errors, time.perf_counter() - started)
+
+    def run_in_process(self, asgi, path, bodies, cookie):
+        timings, errors = [], []
+
+        def record(started, response):
+            elapsed = (time.perf_counter() - started) * 1000
+            (timings if response.status_code < 400 else errors).append(elapsed)
+
+        def run_wsgi():
+            client = Client(raise_request_exception=False)
+            client.cookies = SimpleCookie(cookie)
+            for content, content_type in bodies:
+                started = time.perf_counter()
+                record(started, client.post(path, content, content_type=content_type))
+
+        async def run_asgi():
+            client = AsyncClient(raise_request_exception=False)
+            client.cookies = SimpleCookie(cookie)
+            for content, content_type in bodies:
+                started = time.perf_counter()
+                record(started, await client.post(path, content, content_type=content_type))
+
+        with override_settings(ALLOWED_HOSTS=["*"], METRICS_DIR=None):
+            started = time.perf_counter()
+            if asgi:
+                asyncio.run(run_asgi())
+            else:
+                run_wsgi()
+            return summarize(timings, errors, time.perf_counter() - started)
+
+
+def json_body(data):
+    return json.dumps(data), "application/json"
+
+
+def form_body(data):
+    return urlencode(data), "application/x-www-form-urlencoded"
+
+
+def summarize(timings, errors, duration):
+    timings.sort()
+
+    def percentile(p):
+        return timings[min(len(timings) - 1, int(len(timings) * p / 100))] if timings else 0.0
+
+    return {
+        "requests": len(timings) + len(errors),
+        "errors": len(errors),
+        "rps": len(timings) / duration if duration else 0.0,
+        "p50": percentile(50),
+        "p95": percentile(95),
+        "p99": percentile(99),
+        "mean": statistics.mean(timings) if timings else 0.0,
+    }
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from api.import_jobs import run_pending_jobs
+from api.models import ImportJob
+
+class Command(BaseCommand):
+    help = "Run pending car import jobs (e.g. after a restart left them queued)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requeue-running",
+            action="store_true",
+            help="Reset jobs stuck in 'running' to 'pending' before processing",
+        )
+
+    def handle(self, *args, **options):
+        if options["requeue_running"]:
+            requeued = ImportJob.objects.filter(status="running").update(status="pending")
+            self.stdout.write(f"Requeued {requeued} running job(s).")
+        count = run_pending_jobs()
+        self.stdout.write(self.style.SUCCESS(f"Processed {count} import job(s)."))
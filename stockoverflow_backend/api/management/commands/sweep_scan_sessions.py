@@ -0,0 +1,25 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.scan_sessions import session_counts, sweep_sessions
+
+class Command(BaseCommand):
+    help = "Delete scan sessions older than SCAN_SESSION_TTL_HOURS that were never confirmed"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--every", type=int, metavar="SECONDS",
+                            help="Keep running and sweep again every SECONDS")
+
+    def handle(self, *args, **options):
+        while True:
+            swept = sweep_sessions(options["batch_size"])
+            counts = session_counts()
+            self.stdout.write(self.style.SUCCESS(
+                f"Removed {swept} expired session(s) older than {settings.SCAN_SESSION_TTL_HOURS}h; "
+                f"{counts['live']} live, {counts['expired']} expired."
+            ))
+            if not options["every"]:
+                break
+            time.sleep(options["every"])
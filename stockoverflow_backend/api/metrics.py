@@ -0,0 +1,446 @@
+"""
+Counters, gauges and histograms in Prometheus' text format, served at
+/metrics.
+
+Each process records into its own registry in memory (a dict update under
+a lock), and a background thread writes a snapshot of it to
+METRICS_DIR/metrics-<pid>-<token>.json every METRICS_FLUSH_INTERVAL
+seconds. A scrape adds up this process' live values and every other
+process' last snapshot, so any worker can answer for all of them. Counters
+and histograms of workers that have exited are folded into
+metrics-archive.json so totals don't drop on restarts; their gauges are
+dropped. Without METRICS_DIR each process only reports its own values.
+"""
+import atexit
+import functools
+import glob
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+
+from .audit import pid_alive
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+ARCHIVE = "metrics-archive.json"
+
+
+class Metric:
+    type = None
+
+    def __init__(self, registry, name, help, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple(map(labels.__getitem__, self.labelnames))
+
+    def describe(self):
+        return {"type": self.type, "help": self.help, "labelnames": list(self.labelnames)}
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.registry.recording():
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    Summed over the running processes.
+    """
+    type = "gauge"
+
+    def set(self, value, **labels):
+        with self.registry.recording():
+            self.values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.registry.recording():
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """
+    Values are [count per bucket (the last is +Inf), sum].
+    """
+    type = "histogram"
+
+    def __init__(self, registry, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self.registry.recording():
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def describe(self):
+        return {**super().describe(), "buckets": list(self.buckets)}
+
+
+class MetricsRegistry:
+    def __init__(self, directory=None, flush_interval=5):
+        self.directory = str(directory) if directory else None
+        self.flush_interval = flush_interval
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.pid = None
+        self.owner = None
+        self.dirty = False
+        self.flusher = None
+        if hasattr(os, "register_at_fork"):  # Not on Windows, which doesn't fork
+            os.register_at_fork(after_in_child=self._forked)
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter(self, name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        return self._register(Gauge(self, name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(self, name, help, labelnames, buckets))
+
+    def _register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric '{metric.name}' is already registered.")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def recording(self):
+        """
+        The lock to hold while changing values; the first call in a process
+        starts its flusher.
+        """
+        if self.owner is None:
+            self._start_process()
+        self.dirty = True
+        return self.lock
+
+    def configure(self, directory, flush_interval):
+        """
+        Switch to another directory, e.g. METRICS_DIR=None under
+        override_settings. Values so far are dropped, so they are never
+        written where the new configuration would not have put them.
+        """
+        with self.lock:
+            self.directory = str(directory) if directory else None
+            self.flush_interval = flush_interval
+            self.owner = None  # Stops the running flusher; the next recording starts one
+            self.dirty = False
+            for metric in self.metrics.values():
+                metric.values.clear()
+
+    def _forked(self):
+        # Values inherited through a fork belong to the parent, and the
+        # lock may have been held by one of its threads
+        self.lock = threading.Lock()
+        self.owner = None
+        self.dirty = False
+        for metric in self.metrics.values():
+            metric.values.clear()
+
+    def _start_process(self):
+        with self.lock:
+            if self.owner is not None:
+                return
+            self.pid = os.getpid()
+            self.owner = f"{self.pid}-{uuid.uuid4().hex[:8]}"
+            if self.directory:
+                os.makedirs(self.directory, exist_ok=True)
+                self.flusher = threading.Thread(
+                    target=self._run, args=(self.owner,), name="metrics-flusher", daemon=True
+                )
+                self.flusher.start()
+                atexit.register(self.flush)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                name: {**metric.describe(), "samples": [
+                    [list(map(str, key)), list(value) if isinstance(value, list) else value]
+                    for key, value in metric.values.items()
+                ]}
+                for name, metric in self.metrics.items()
+                if metric.values
+            }
+
+    def _run(self, owner):
+        while True:
+            time.sleep(self.flush_interval)
+            if self.owner != owner:
+                return  # Forked or reconfigured
+            self.flush()
+
+    def flush(self):
+        if not self.directory or not self.dirty or self.pid != os.getpid():
+            return
+        self.dirty = False
+        path = os.path.join(self.directory, f"metrics-{self.owner}.json")
+        try:
+            _write_json(path, self.snapshot())
+        except OSError:
+            self.dirty = True  # Metrics never take a worker down; retried next interval
+
+    def collect(self):
+        """
+        Every process' values added up, as {name: merged metric}.
+        """
+        merged = {}
+        _merge(merged, self.snapshot())
+        if not self.directory or not os.path.isdir(self.directory):
+            return merged
+
+        dead = []
+        for path in glob.glob(os.path.join(self.directory, "metrics-*-*.json")):
+            owner = os.path.basename(path)[len("metrics-"):-len(".json")]
+            if owner == self.owner:
+                continue
+            pid = int(owner.split("-")[0])
+            if pid != os.getpid() and pid_alive(pid):
+                _merge(merged, _read_json(path))
+            else:
+                dead.append(path)
+        if dead:
+            self._archive(dead)
+        _merge(merged, _read_json(os.path.join(self.directory, ARCHIVE)))
+        return merged
+
+    def _archive(self, paths):
+        """
+        Fold the counters and histograms of exited processes into the
+        archive, under a file lock so concurrent scrapes don't lose counts.
+        """
+        with _file_lock(os.path.join(self.directory, ARCHIVE + ".lock")):
+            archive_path = os.path.join(self.directory, ARCHIVE)
+            archive = {}
+            _merge(archive, _read_json(archive_path))
+            for path in paths:
+                if os.path.exists(path):
+                    _merge(archive, _read_json(path), include_gauges=False)
+            _write_json(archive_path, _unmerge(archive))
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def render(self, extra=()):
+        """
+        The text exposition of collect() plus scrape-time metrics from
+        extra: (name, type, help, [(labels dict, value)]).
+        """
+        lines = []
+        for name, metric in sorted(self.collect().items()):
+            lines.append(f"# HELP {name} {_escape_help(metric['help'])}")
+            lines.append(f"# TYPE {name} {metric['type']}")
+            labelnames = metric["labelnames"]
+            for key, value in sorted(metric["samples"].items()):
+                labels = dict(zip(labelnames, key))
+                if metric["type"] != "histogram":
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip([*metric["buckets"], "+Inf"], value[:-1]):
+                    cumulative += count
+                    le = bound if bound == "+Inf" else _number(bound)
+                    lines.append(f"{name}_bucket{_labels({**labels, 'le': le})} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(value[-1])}")
+                lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+        for name, type, help, samples in extra:
+            lines.append(f"# HELP {name} {_escape_help(help)}")
+            lines.append(f"# TYPE {name} {type}")
+            lines.extend(f"{name}{_labels(labels)} {_number(value)}" for labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+def _merge(merged, snapshot, include_gauges=True):
+    for name, metric in snapshot.items():
+        if metric["type"] == "gauge" and not include_gauges:
+            continue
+        target = merged.setdefault(name, {**metric, "samples": {}})
+        for key, value in metric["samples"]:
+            key = tuple(key)
+            current = target["samples"].get(key)
+            if current is None:
+                target["samples"][key] = list(value) if isinstance(value, list) else value
+            elif isinstance(value, list):
+                target["samples"][key] = [a + b for a, b in zip(current, value)]
+            else:
+                target["samples"][key] = current + value
+
+
+def _unmerge(merged):
+    return {
+        name: {**metric, "samples": [[list(key), value] for key, value in metric["samples"].items()]}
+        for name, metric in merged.items()
+    }
+
+
+@contextmanager
+def _file_lock(path):
+    """
+    Hold an exclusive lock on path: flock on POSIX, msvcrt.locking of its
+    first byte on Windows.
+    """
+    with open(path, "w") as file:
+        if fcntl is not None:
+            fcntl.flock(file, fcntl.LOCK_EX)  # Released when the file is closed
+            yield
+            return
+        while True:
+            try:
+                msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+                break
+            except OSError:
+                pass  # LK_LOCK gives up after 10 attempts; keep waiting
+        try:
+            yield
+        finally:
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _write_json(path, data):
+    temp = f"{path}.{os.getpid()}.tmp"
+    with open(temp, "w", encoding="utf-8") as file:
+        json.dump(data, file)
+    os.replace(temp, path)
+
+
+def _escape_help(text):
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in labels.items()) + "}"
+
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+registry = MetricsRegistry(settings.METRICS_DIR, settings.METRICS_FLUSH_INTERVAL)
+
+REQUESTS = registry.counter(
+    "stockoverflow_requests_total", "Requests to instrumented endpoints.", ["endpoint", "status"]
+)
+REQUEST_SECONDS = registry.histogram(
+    "stockoverflow_request_seconds", "Time spent in instrumented endpoints.", ["endpoint"]
+)
+VIN_SCANS = registry.counter("stockoverflow_vin_scans_total", "Scanned VINs by resulting car status.", ["status"])
+ITEM_SCANS = registry.counter("stockoverflow_item_scans_total", "Part units added to scan sessions.")
+CACHE_LOOKUPS = registry.counter(
+    "stockoverflow_cache_lookups_total", "Barcode and response cache lookups.", ["cache", "result"]
+)
+IMPORT_JOBS = registry.counter("stockoverflow_import_jobs_total", "Finished car import jobs.", ["status"])
+IMPORT_ROWS = registry.counter("stockoverflow_import_rows_total", "Car import rows.", ["result"])
+IMPORT_SECONDS = registry.histogram(
+    "stockoverflow_import_job_seconds", "Duration of car import jobs.",
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800),
+)
+
+
+def timed(endpoint):
+    """
+    Count a view's responses by status and time them, for sync and async
+    views. An exception is counted with its status_code (DRF's API
+    exceptions) or as 500, and re-raised.
+    """
+    def decorator(view):
+        def record(started, status):
+            REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+            REQUESTS.inc(endpoint=endpoint, status=status)
+
+        if inspect.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    response = await view(*args, **kwargs)
+                except Exception as e:
+                    record(started, getattr(e, "status_code", 500))
+                    raise
+                record(started, response.status_code)
+                return response
+            return markcoroutinefunction(wrapper)
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                response = view(*args, **kwargs)
+            except Exception as e:
+                record(started, getattr(e, "status_code", 500))
+                raise
+            record(started, response.status_code)
+            return response
+        return wrapper
+    return decorator
+
+
+def scrape_metrics():
+    """
+    Gauges read from the database at scrape time, so they are the same
+    whichever worker answers.
+    """
+    from .models import ImportJob
+    from .scan_sessions import session_counts
+
+    sessions = session_counts()
+    pending = ImportJob.objects.filter(status__in=["pending", "running"]).count()
+    return [
+        ("stockoverflow_scan_sessions", "gauge", "Unconfirmed scan sessions.",
+         [({"state": state}, sessions[state]) for state in ("live", "expired")]),
+        ("stockoverflow_import_jobs_waiting", "gauge", "Car import jobs pending or running.", [({}, pending)]),
+    ]
+
+
+def metrics_view(request):
+    return HttpResponse(registry.render(scrape_metrics()), content_type=CONTENT_TYPE)
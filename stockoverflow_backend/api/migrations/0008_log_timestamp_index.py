@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_list_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(fields=['timestamp'], name='log_timestamp_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:47
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_log_timestamp_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='log',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:50
+
+from django.db import migrations
+from django.utils import timezone
+
+# Cars without a VIN get "NOVIN" + their zero-padded id, 17 characters like a VIN
+PLACEHOLDER_PREFIX = 'NOVIN'
+
+
+def deduplicate_vins(apps, schema_editor):
+    """
+    Normalize VINs (stripped, uppercase) and merge cars that share one.
+    The newest row wins, since uploads update the latest copy; parts and
+    installations of the others are moved onto it.
+
+    Cars without a VIN are not duplicates of each other: each keeps its
+    parts and gets a placeholder VIN, recorded in the audit log so the
+    office can find and correct them.
+
+    Runs in its own migration so the row changes are committed before
+    0011_unique_normalized_vin alters the table (PostgreSQL refuses an
+    ALTER TABLE with pending trigger events).
+    """
+    Car = apps.get_model('api', 'Car')
+    CarPart = apps.get_model('api', 'CarPart')
+    CarInstallation = apps.get_model('api', 'CarInstallation')
+    Log = apps.get_model('api', 'Log')
+
+    by_vin, blank = {}, []
+    for car_id, vin in Car.objects.order_by('id').values_list('id', 'vin').iterator():
+        normalized = (vin or '').strip().upper()
+        if normalized:
+            by_vin.setdefault(normalized, []).append((car_id, vin))
+        else:
+            blank.append(car_id)
+
+    for normalized, cars in by_vin.items():
+        keep_id, keep_vin = cars[-1]
+        duplicate_ids = [car_id for car_id, _ in cars[:-1]]
+        if duplicate_ids:
+            CarPart.objects.filter(car_id__in=duplicate_ids).update(car_id=keep_id)
+            CarInstallation.objects.filter(car_id__in=duplicate_ids).update(car_id=keep_id)
+            Car.objects.filter(id__in=duplicate_ids).delete()
+        if keep_vin != normalized:
+            Car.objects.filter(id=keep_id).update(vin=normalized)
+
+    entries = []
+    for car_id in blank:
+        placeholder = f'{PLACEHOLDER_PREFIX}{car_id:012d}'
+        if placeholder in by_vin:
+            raise ValueError(f"Car {car_id} has no VIN and its placeholder {placeholder} is taken.")
+        Car.objects.filter(id=car_id).update(vin=placeholder)
+        entries.append(Log(
+            action='Assigned Placeholder VIN', item_name=placeholder, user='System',
+            timestamp=timezone.now(), details=f'Car {car_id} had no VIN',
+        ))
+    Log.objects.bulk_create(entries)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_log_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate_vins, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_deduplicate_vins'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='car',
+            name='car_vin_idx',
+        ),
+        migrations.AlterField(
+            model_name='car',
+            name='vin',
+            field=models.CharField(max_length=17, unique=True),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:53
+
+from collections import Counter
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_parts_to_lines(apps, schema_editor):
+    """
+    Turn each session's parts list into one line per item, counting
+    repeated barcodes. Barcodes that no longer match an item are dropped.
+    """
+    ScannedItem = apps.get_model('api', 'ScannedItem')
+    ScanLine = apps.get_model('api', 'ScanLine')
+    InventoryItem = apps.get_model('api', 'InventoryItem')
+
+    for session in ScannedItem.objects.iterator():
+        counts = Counter(part.get('barcode') for part in session.parts or [])
+        items = InventoryItem.objects.in_bulk([barcode for barcode in counts if barcode], field_name='barcode')
+        ScanLine.objects.bulk_create([
+            ScanLine(session=session, item=items[barcode], count=count)
+            for barcode, count in counts.items()
+            if barcode in items
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_unique_normalized_vin'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.inventoryitem')),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='api.scanneditem')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('session', 'item'), name='scan_line_session_item_uniq')],
+            },
+        ),
+        migrations.RunPython(copy_parts_to_lines, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='scanneditem',
+            name='parts',
+        ),
+    ]
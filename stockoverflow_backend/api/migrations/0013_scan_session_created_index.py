@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_scan_lines'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='scanneditem',
+            index=models.Index(fields=['created_at'], name='scan_session_created_idx'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_scan_session_created_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='car',
+            name='car_status_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='inventoryitem',
+            name='inventory_breached_idx',
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['status', 'id'], name='car_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['status', 'scheduled_date'], name='car_status_scheduled_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='checkout',
+            index=models.Index(fields=['order_number', 'created_at'], name='checkout_order_number_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='checkout',
+            index=models.Index(fields=['user', 'created_at'], name='checkout_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='importjob',
+            index=models.Index(fields=['created_at'], name='import_job_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='importjob',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['created_at'], name='import_job_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventoryitem',
+            index=models.Index(condition=models.Q(('threshold_breached', True)), fields=['id'], name='inventory_breached_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(fields=['action', 'timestamp'], name='log_action_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(fields=['user', 'timestamp'], name='log_user_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['timestamp'], name='transaction_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', 'timestamp'], name='transaction_user_time_idx'),
+        ),
+    ]
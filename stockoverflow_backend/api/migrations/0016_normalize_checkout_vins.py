@@ -0,0 +1,29 @@
+# Generated by Django 5.1.4 on 2026-10-18 21:10
+
+from django.db import migrations
+
+
+def normalize_checkout_vins(apps, schema_editor):
+    """
+    Store checkout VINs normalized (stripped, uppercase) like car VINs, so
+    the ?vin= prefix filter can range-scan checkout_vin_idx.
+    """
+    Checkout = apps.get_model('api', 'Checkout')
+    changed = []
+    for checkout in Checkout.objects.only('id', 'vin').iterator():
+        normalized = (checkout.vin or '').strip().upper()
+        if normalized != checkout.vin:
+            checkout.vin = normalized
+            changed.append(checkout)
+    Checkout.objects.bulk_update(changed, ['vin'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_change_events'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_checkout_vins, migrations.RunPython.noop),
+    ]
@@ -65,11 +65,24 @@ class User(AbstractUser):
 
 class Checkout(models.Model):
     user = models.ForeignKey('User', on_delete=models.CASCADE)
-    vin = models.CharField(max_length=100)
+    vin = models.CharField(max_length=100)  # Stored normalized, see normalize_vin
     order_number = models.CharField(max_length=100)
     parts = models.ManyToManyField('InventoryItem', through='CheckoutPart')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['vin'], name='checkout_vin_idx'),
+            models.Index(fields=['created_at'], name='checkout_created_at_idx'),
+            models.Index(fields=['order_number', 'created_at'], name='checkout_order_number_idx'),
+            # ?user= filter in the default newest-first order
+            models.Index(fields=['user', 'created_at'], name='checkout_user_created_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.vin = normalize_vin(self.vin)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.user.username} - {self.order_number}"
 
@@ -98,22 +111,55 @@ class Transaction(models.Model):
     parts = models.JSONField()  # Stores details of the parts involved
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['timestamp'], name='transaction_timestamp_idx'),
+            models.Index(fields=['user', 'timestamp'], name='transaction_user_time_idx'),
+        ]
+
 
 class ScannedItem(models.Model):
     session_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
     car_label = models.CharField(max_length=100)
-    parts = models.JSONField()  # Temporary storage for scanned items
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='scan_session_created_idx'),
+        ]
+
+
+class ScanLine(models.Model):
+    """
+    One inventory item scanned in a session; repeated scans add to count.
+    """
+    session = models.ForeignKey(ScannedItem, on_delete=models.CASCADE, related_name="lines")
+    item = models.ForeignKey('InventoryItem', on_delete=models.CASCADE, related_name="+")
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Also serves as the index for looking up a session's lines
+            models.UniqueConstraint(fields=['session', 'item'], name='scan_line_session_item_uniq'),
+        ]
+
 
 class Log(models.Model):
     action = models.CharField(max_length=255)
     item_name = models.CharField(max_length=255, null=True, blank=True)
     user = models.CharField(max_length=255, null=True, blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)  # Set by the writer, not at insert time
     details = models.TextField(null=True, blank=True)  # Ensure details are included
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['timestamp'], name='log_timestamp_idx'),
+            # ?action= / ?user= filters, served newest first
+            models.Index(fields=['action', 'timestamp'], name='log_action_time_idx'),
+            models.Index(fields=['user', 'timestamp'], name='log_user_time_idx'),
+        ]
+
     def __str__(self):
         return f"{self.timestamp} - {self.action}: {self.item_name or 'No Item'} ({self.details or 'No Details'})"
 
@@ -130,6 +176,13 @@ class InventoryItem(models.Model):
     # ✅ NEW FIELD FOR CHILD-PARENT RELATION
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='children')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['category'], name='inventory_category_idx'),
+            # Only the few breached items are ever looked up by the flag
+            models.Index(fields=['id'], condition=models.Q(threshold_breached=True), name='inventory_breached_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.barcode:
             self.barcode = str(uuid.uuid4()).replace("-", "")[:12]
@@ -140,8 +193,12 @@ class InventoryItem(models.Model):
 
 
 
+def normalize_vin(vin):
+    return (vin or "").strip().upper()
+
+
 class Car(models.Model):
-    vin = models.CharField(max_length=17)  # No unique constraint here
+    vin = models.CharField(max_length=17, unique=True)  # Stored normalized, see normalize_vin
     model = models.CharField(max_length=255)
     adaptation = models.CharField(max_length=255, null=True, blank=True) 
     scheduled_date = models.DateField(null=True, blank=True)
@@ -151,6 +208,18 @@ class Car(models.Model):
     dealers_comments = models.TextField(null=True, blank=True)
     status = models.CharField(max_length=50, default='from_upcoming')
 
+    class Meta:
+        indexes = [
+            # ?status= in the default id order, and by arrival date
+            models.Index(fields=['status', 'id'], name='car_status_idx'),
+            models.Index(fields=['status', 'scheduled_date'], name='car_status_scheduled_idx'),
+            models.Index(fields=['scheduled_date'], name='car_scheduled_date_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.vin = normalize_vin(self.vin)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.vin} - {self.model}"
 
@@ -173,4 +242,43 @@ class CarInstallation(models.Model):
     dealers_comments = models.TextField(blank=True, null=True)  # Comments from the dealer
 
     def __str__(self):
-        return f"Installation for {self.car.vin}: {self.task_description}"
\ No newline at end of file
+        return f"Installation for {self.car.vin}: {self.task_description}"
+
+class ImportJob(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    file_name = models.CharField(max_length=255)
+    file_path = models.CharField(max_length=500)  # Copy of the upload kept for the worker
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    rows_processed = models.PositiveIntegerField(default=0)
+    success_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list)
+    attempts = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='import_job_created_idx'),
+            # run_pending_jobs only looks for pending jobs
+            models.Index(fields=['created_at'], condition=models.Q(status='pending'), name='import_job_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.file_name} ({self.status})"
+
+
+class ChangeEvent(models.Model):
+    # Shared by every worker process; the id is the event's sequence number (see api/change_feed.py)
+    kind = models.CharField(max_length=10)
+    data = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.kind} #{self.id}"
@@ -0,0 +1,36 @@
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Opt-in cursor pagination. Lists stay plain arrays unless the client asks
+    for ?page_size=N; the response then carries next/previous cursor links.
+    Add ?count=true to include the total number of matching rows.
+    """
+    page_size = None
+    page_size_query_param = "page_size"
+    max_page_size = 500
+    count_query_param = "count"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param, "").lower() in ("1", "true"):
+            # COUNT over the filtered queryset, without the ORDER BY
+            self.count = queryset.order_by().count()
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        body = {"next": self.get_next_link(), "previous": self.get_previous_link()}
+        if self.count is not None:
+            body["count"] = self.count
+        body["results"] = data
+        return Response(body)
+
+
+class LogPagination(KeysetPagination):
+    """
+    Logs only grow, so they are always paginated, newest first.
+    """
+    page_size = 100
+    ordering = ("-timestamp", "-id")
@@ -0,0 +1,89 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+from .metrics import CACHE_LOOKUPS
+
+
+def _cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def _shared():
+    # A per-process locmem cache would keep serving a response after another
+    # worker's write bumped the version in its own memory
+    return not isinstance(_cache(), LocMemCache)
+
+
+def resource_version(resource):
+    """
+    The current version stamp of a resource. Stamps are random tokens, so
+    one lost to cache eviction can never bring back an old response.
+    """
+    key = f"response-version:{resource}"
+    version = _cache().get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not _cache().add(key, version, None):
+            version = _cache().get(key) or version
+    return version
+
+
+def bump(*resources):
+    """
+    Give resources a new version once the current transaction commits,
+    so cached list responses and their ETags are dropped. Writes that skip
+    model signals (queryset.update, bulk_create) call this directly.
+    """
+    def apply():
+        _cache().set_many({f"response-version:{resource}": uuid.uuid4().hex for resource in resources}, None)
+    transaction.on_commit(apply, robust=True)
+
+
+class CachedListMixin:
+    """
+    Serve list responses from a cache keyed by the resource version and
+    the request path, with a strong ETag. A matching If-None-Match gets an
+    empty 304. Views override uncached_list instead of list. Nothing is
+    cached when RESPONSE_CACHE_ALIAS is a locmem backend.
+    """
+    cache_resource = None
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != "json" or not _shared():
+            return self.uncached_list(request, *args, **kwargs)
+
+        # Read the version before the data, so a concurrent write can only
+        # leave newer data under an old version, never old data under a new one
+        version = resource_version(self.cache_resource)
+        path = hashlib.sha1(request.get_full_path().encode()).hexdigest()
+        key = f"response:{self.cache_resource}:{version}:{path}"
+        cached = _cache().get(key)
+        CACHE_LOOKUPS.inc(cache="response", result="miss" if cached is None else "hit")
+        if cached is None:
+            response = self.uncached_list(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            body = request.accepted_renderer.render(
+                response.data, request.accepted_media_type, self.get_renderer_context()
+            )
+            cached = (f'"{hashlib.sha1(body).hexdigest()}"', body)
+            _cache().set(key, cached, settings.RESPONSE_CACHE_TTL)
+
+        etag, body = cached
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(body, content_type="application/json")
+        response["ETag"] = etag
+        response["Cache-Control"] = "no-cache"  # Always revalidate
+        return response
+
+    def uncached_list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
@@ -0,0 +1,106 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Q, Sum, Value, When
+from django.utils import timezone
+
+from .audit import audit_log
+from .metrics import ITEM_SCANS
+from .models import ScanLine, ScannedItem
+from .stock import MAX_ITEMS_PER_STATEMENT, remove_stock
+
+
+def add_scans(session, counts):
+    """
+    Add scans ({item_id: count}) to a saved session. Items already in the
+    session are bumped with one UPDATE, new ones inserted with one
+    bulk_create. Call with the session row locked.
+    """
+    counts = {item_id: count for item_id, count in counts.items() if count > 0}
+    ITEM_SCANS.inc(sum(counts.values()))
+    existing = set(session.lines.filter(item_id__in=counts).values_list("item_id", flat=True))
+
+    bumps = [(item_id, count) for item_id, count in counts.items() if item_id in existing]
+    for start in range(0, len(bumps), MAX_ITEMS_PER_STATEMENT):
+        chunk = bumps[start:start + MAX_ITEMS_PER_STATEMENT]
+        amount = Case(
+            *[When(item_id=item_id, then=Value(count)) for item_id, count in chunk],
+            output_field=IntegerField(),
+        )
+        session.lines.filter(item_id__in=[item_id for item_id, _ in chunk]).update(count=F("count") + amount)
+
+    ScanLine.objects.bulk_create([
+        ScanLine(session=session, item_id=item_id, count=count)
+        for item_id, count in counts.items()
+        if item_id not in existing
+    ])
+
+
+def session_lines(session):
+    return [
+        {"barcode": line["item__barcode"], "name": line["item__name"], "sku": line["item__sku"], "count": line["count"]}
+        for line in session.lines.order_by("id").values("item__barcode", "item__name", "item__sku", "count")
+    ]
+
+
+def scan_total(session):
+    return session.lines.aggregate(total=Sum("count"))["total"] or 0
+
+
+def confirm_scans(session):
+    """
+    Take every scanned unit out of stock in one movement and close the
+    session. Raises stock.InsufficientStock and leaves the session intact
+    if any item is short. The session row is locked before its lines are
+    read, so a second confirm of the same session (a double tap, a
+    retry) waits and then raises ScannedItem.DoesNotExist.
+    """
+    with transaction.atomic():
+        session = ScannedItem.objects.select_for_update().get(id=session.id)
+        result = remove_stock(dict(session.lines.values_list("item_id", "count")))
+        session.delete()
+    return result
+
+
+def session_cutoff():
+    """
+    Sessions started before this are expired (SCAN_SESSION_TTL_HOURS).
+    """
+    return timezone.now() - timedelta(hours=settings.SCAN_SESSION_TTL_HOURS)
+
+
+def is_expired(session):
+    return session.created_at < session_cutoff()
+
+
+def session_counts():
+    cutoff = session_cutoff()
+    return ScannedItem.objects.aggregate(
+        live=Count("id", filter=Q(created_at__gte=cutoff)),
+        expired=Count("id", filter=Q(created_at__lt=cutoff)),
+    )
+
+
+def sweep_sessions(batch_size=500):
+    """
+    Delete expired sessions and their lines, oldest first, one short
+    transaction per batch. Stock is untouched: only confirmed sessions
+    move stock. Returns the number of sessions removed.
+    """
+    cutoff = session_cutoff()
+    swept = 0
+    while True:
+        ids = list(
+            ScannedItem.objects.filter(created_at__lt=cutoff)
+            .order_by("created_at")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        with transaction.atomic():
+            ScannedItem.objects.filter(id__in=ids).delete()
+        swept += len(ids)
+    if swept:
+        audit_log(action="Expired Scan Sessions", details=f"Removed {swept} session(s) older than {settings.SCAN_SESSION_TTL_HOURS}h")
+    return swept
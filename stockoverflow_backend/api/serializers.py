@@ -1,8 +1,13 @@
 from rest_framework import serializers
-from .models import Car, InventoryItem, Category, CarPart, Log, User, Checkout, CheckoutPart
+from .models import Car, InventoryItem, Category, CarPart, Log, User, Checkout, CheckoutPart, ImportJob, normalize_vin
+from django.utils import timezone
 
 from rest_framework import serializers
+from django.db import transaction
+from django.db.models import prefetch_related_objects
 from .models import User, InventoryItem, Checkout, CheckoutPart
+from .stock import InsufficientStock, remove_stock
+from .barcodes import resolve_barcodes
 
 class CheckoutPartWriteSerializer(serializers.Serializer):
     part = serializers.CharField()  # barcode
@@ -23,32 +28,51 @@ class CheckoutCreateSerializer(serializers.Serializer):
         except User.DoesNotExist:
             raise serializers.ValidationError({'user': f"No user with unique_id '{unique_id}' found"})
 
-        # ✅ Create checkout
-        checkout = Checkout.objects.create(
-            user=user,
-            vin=validated_data["vin"],
-            order_number=validated_data["order_number"]
-        )
-
-        # ✅ Add parts by barcode
-        for part_data in validated_data["parts"]:
-            barcode = part_data["part"]
-            try:
-                inventory_part = InventoryItem.objects.get(barcode=barcode)
-            except InventoryItem.DoesNotExist:
-                raise serializers.ValidationError({'parts': f"No inventory item with barcode '{barcode}' found"})
-
-            CheckoutPart.objects.create(
-                checkout=checkout,
-                part=inventory_part,
-                damaged=part_data.get("damaged", False),
-                edit_reason=part_data.get("edit_reason", ""),
-                edited_by=None
+        parts = validated_data["parts"]
+
+        with transaction.atomic():
+            # ✅ Resolve every barcode in one query
+            barcodes = {part_data["part"] for part_data in parts}
+            items = resolve_barcodes(barcodes)
+            for part_data in parts:
+                if part_data["part"] not in items:
+                    raise serializers.ValidationError({'parts': f"No inventory item with barcode '{part_data['part']}' found"})
+
+            # ✅ Create checkout
+            checkout = Checkout.objects.create(
+                user=user,
+                vin=validated_data["vin"],
+                order_number=validated_data["order_number"]
             )
 
-            inventory_part.quantity -= 2 if part_data.get("damaged") else 1
-            inventory_part.save()
-
+            # ✅ Add parts in one insert
+            CheckoutPart.objects.bulk_create([
+                CheckoutPart(
+                    checkout=checkout,
+                    part_id=items[part_data["part"]]["id"],
+                    damaged=part_data.get("damaged", False),
+                    edit_reason=part_data.get("edit_reason", ""),
+                    edited_by=None
+                )
+                for part_data in parts
+            ])
+
+            # ✅ Deduct stock: damaged parts cost two
+            deductions = {}
+            for part_data in parts:
+                item_id = items[part_data["part"]]["id"]
+                deductions[item_id] = deductions.get(item_id, 0) + (2 if part_data.get("damaged") else 1)
+            try:
+                remove_stock(deductions)
+            except InsufficientStock as e:
+                names = {item["id"]: item["name"] for item in items.values()}
+                raise serializers.ValidationError({'parts': [
+                    f"Not enough stock for '{names[item_id]}': {requested} needed, {available} available"
+                    for item_id, (requested, available) in e.shortages.items()
+                ]})
+
+        # ✅ Load the new parts for the response in one query, not one per part
+        prefetch_related_objects([checkout], "checkoutpart_set__part")
         return checkout
 
 class CheckoutPartSerializer(serializers.ModelSerializer):
@@ -123,8 +147,13 @@ class InventoryItemSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
     def get_children(self, obj):
-        children = obj.children.all()
-        return InventoryItemSerializer(children, many=True).data
+        # The list view passes the whole forest grouped by parent id
+        children_by_parent = self.context.get("children_by_parent")
+        if children_by_parent is not None:
+            children = children_by_parent.get(obj.id, [])
+        else:
+            children = obj.children.all()
+        return InventoryItemSerializer(children, many=True, context=self.context).data
 
     def validate_category(self, value):
         if value not in ['Production', 'Office', 'Car Wash', 'Paint/Damage']:
@@ -147,9 +176,34 @@ class CarSerializer(serializers.ModelSerializer):
             'location', 'client_name', 'dealers_comments', 'status'
         ]
 
+    def to_internal_value(self, data):
+        # Normalize before the unique check so "abc " matches "ABC"
+        if isinstance(data.get("vin"), str):
+            data = data.copy()
+            data["vin"] = normalize_vin(data["vin"])
+        return super().to_internal_value(data)
+
     def validate(self, data):
         if not data.get("vin"):
             raise serializers.ValidationError({"vin": "VIN is required."})
         if not data.get("model"):
             raise serializers.ValidationError({"model": "Model is required."})
         return data
+
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    rows_per_second = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ImportJob
+        fields = [
+            'id', 'file_name', 'status', 'rows_processed', 'success_count', 'errors',
+            'attempts', 'created_at', 'started_at', 'finished_at', 'rows_per_second'
+        ]
+
+    def get_rows_per_second(self, obj):
+        if not obj.started_at:
+            return None
+        elapsed = ((obj.finished_at or timezone.now()) - obj.started_at).total_seconds()
+        return round(obj.rows_processed / elapsed, 1) if elapsed > 0 else None
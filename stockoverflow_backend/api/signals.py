@@ -0,0 +1,84 @@
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .barcodes import invalidate_item
+from .change_feed import publish_car_deleted, publish_cars, publish_item_deleted, publish_items
+from .instrumentation import install_query_recorder
+from .metrics import registry
+from .models import Car, CarPart, Category, InventoryItem, User
+from .response_cache import bump
+from .thresholds import items_for_cars, recompute_thresholds
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    # Lets RequestMetricsMiddleware count queries on any thread's connection
+    install_query_recorder(connection)
+
+
+@receiver(setting_changed)
+def metrics_setting_changed(sender, setting, **kwargs):
+    # The registry is built at import; follow override_settings in tests and commands
+    if setting in ("METRICS_DIR", "METRICS_FLUSH_INTERVAL"):
+        registry.configure(settings.METRICS_DIR, settings.METRICS_FLUSH_INTERVAL)
+
+
+@receiver(post_save, sender=Car)
+def car_saved(sender, instance, created, **kwargs):
+    # A status change moves the car's parts in or out of upcoming demand
+    if not created:
+        recompute_thresholds(items_for_cars([instance.id]))
+
+
+@receiver(post_save, sender=CarPart)
+@receiver(post_delete, sender=CarPart)
+def car_part_changed(sender, instance, **kwargs):
+    recompute_thresholds([instance.inventory_item_id])
+
+
+@receiver(post_save, sender=InventoryItem)
+@receiver(post_delete, sender=InventoryItem)
+def inventory_item_changed(sender, instance, **kwargs):
+    invalidate_item(instance.id, instance.barcode)
+
+
+@receiver(post_save, sender=InventoryItem)
+def inventory_item_saved(sender, instance, update_fields=None, **kwargs):
+    # Creates and edits (PUT/PATCH, admin) can move quantity or threshold;
+    # stock movements are UPDATEs and recompute on their own
+    if update_fields is None or {"quantity", "threshold"} & set(update_fields):
+        recompute_thresholds([instance.id])
+
+
+# Cached list responses (see response_cache) for each model
+CACHED_RESOURCES = {InventoryItem: "inventory", Car: "cars", User: "users", Category: "categories"}
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def cached_resource_changed(sender, **kwargs):
+    if sender in CACHED_RESOURCES:
+        bump(CACHED_RESOURCES[sender])
+
+
+@receiver(post_save, sender=InventoryItem)
+def inventory_item_saved_feed(sender, instance, **kwargs):
+    publish_items([instance.id])
+
+
+@receiver(post_delete, sender=InventoryItem)
+def inventory_item_deleted_feed(sender, instance, **kwargs):
+    publish_item_deleted(instance.id)
+
+
+@receiver(post_save, sender=Car)
+def car_saved_feed(sender, instance, **kwargs):
+    publish_cars({instance.vin: instance.status})
+
+
+@receiver(post_delete, sender=Car)
+def car_deleted_feed(sender, instance, **kwargs):
+    publish_car_deleted(instance.vin)
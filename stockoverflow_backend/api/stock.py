@@ -0,0 +1,95 @@
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+
+from .models import InventoryItem
+from .change_feed import publish_items
+from .response_cache import bump
+from .thresholds import recompute_thresholds
+
+# Items per UPDATE statement; keeps the CASE/WHERE parameter count bounded
+MAX_ITEMS_PER_STATEMENT = 250
+
+
+class InsufficientStock(Exception):
+    """
+    Raised when a movement would take an item below zero.
+    shortages maps item id -> (requested, available).
+    """
+
+    def __init__(self, shortages):
+        self.shortages = shortages
+        super().__init__(f"Insufficient stock for item(s): {', '.join(str(i) for i in shortages)}")
+
+
+def _decrement(amounts):
+    """
+    Subtract amounts ({item_id: qty}) in as few statements as possible.
+    Each row is only touched if it still has enough stock, so the check
+    and the write happen atomically in the database. Returns the number
+    of rows updated.
+    """
+    updated = 0
+    items = list(amounts.items())
+    for start in range(0, len(items), MAX_ITEMS_PER_STATEMENT):
+        chunk = items[start:start + MAX_ITEMS_PER_STATEMENT]
+        guard = Q()
+        for item_id, amount in chunk:
+            guard |= Q(id=item_id, quantity__gte=amount)
+        amount = Case(
+            *[When(id=item_id, then=Value(amount)) for item_id, amount in chunk],
+            output_field=IntegerField(),
+        )
+        updated += InventoryItem.objects.filter(guard).update(quantity=F("quantity") - amount)
+    bump("inventory")
+    publish_items(amounts)
+    return updated
+
+
+def remove_stock(movements, backorder=False):
+    """
+    Take stock out of inventory. movements maps item id -> quantity.
+
+    By default the whole batch is rejected with InsufficientStock if any
+    item is short. With backorder=True, short items are emptied instead and
+    the missing quantity is reported.
+
+    Returns {"backordered": {item_id: qty}, "breached": [InventoryItem]} where
+    breached lists items now projected below their threshold (see
+    thresholds.recompute_thresholds).
+    """
+    movements = {item_id: qty for item_id, qty in movements.items() if qty > 0}
+    backordered = {}
+    if not movements:
+        return {"backordered": backordered, "breached": []}
+
+    try:
+        with transaction.atomic():
+            if backorder:
+                available = dict(
+                    InventoryItem.objects.select_for_update()
+                    .filter(id__in=movements)
+                    .values_list("id", "quantity")
+                )
+                taken = {}
+                for item_id, qty in movements.items():
+                    taken[item_id] = min(qty, available.get(item_id, 0))
+                    if taken[item_id] < qty:
+                        backordered[item_id] = qty - taken[item_id]
+                taken = {item_id: qty for item_id, qty in taken.items() if qty > 0}
+            else:
+                taken = movements
+
+            if _decrement(taken) != len(taken):
+                # Roll back the rows that did go through
+                raise InsufficientStock({})
+
+            breached = recompute_thresholds(movements)["newly_breached"]
+    except InsufficientStock:
+        available = dict(InventoryItem.objects.filter(id__in=taken).values_list("id", "quantity"))
+        raise InsufficientStock({
+            item_id: (qty, available.get(item_id, 0))
+            for item_id, qty in taken.items()
+            if available.get(item_id, 0) < qty
+        }) from None
+
+    return {"backordered": backordered, "breached": breached}
@@ -1,3 +1,1093 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.db import OperationalError, connection
+from django.core import mail
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils import timezone
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+import pandas as pd
+from openpyxl import Workbook, load_workbook
+
+from . import import_jobs
+from . import audit
+from . import metrics
+from .alerts import AlertDispatcher
+from .audit import AuditLogWriter, recover_spool
+from .barcodes import BarcodeCache, get_barcode_cache, resolve_barcodes
+from .car_import import EXPECTED_COLUMNS, import_batch, import_schedule, open_schedule, schedule_columns
+from .change_feed import PUBLISH_LOCK_ID, ChangeFeed, get_feed
+from .import_jobs import retry_import, run_import_job
+from .instrumentation import QueryRecorder
+from .log_archive import archive_logs, archived_months, compact_archive, read_archive
+from .metrics import CACHE_LOOKUPS, REQUESTS, MetricsRegistry, registry
+from .db_router import ReplicaRouter, replica_reads
+from .management.commands.explain_queries import explain, plan_issues
+from .models import Car, CarPart, ChangeEvent, Checkout, CheckoutPart, ImportJob, InventoryItem, Log, ScanLine, ScannedItem, User
+from .scan_sessions import add_scans, confirm_scans, scan_total, session_counts, session_lines, sweep_sessions
+from .stock import InsufficientStock, remove_stock
+from .views import MAX_BATCH_SCANS
+from stockoverflow_backend.databases import REPLICA, database_settings
+
+# Keep tests out of BASE_DIR: metrics stay in memory, audit logs are written
+# in the request instead of by a writer thread spooling to audit_spool, and
+# responses use the locmem alias (so they are not cached) instead of cache/
+isolated = override_settings(METRICS_DIR=None, AUDIT_LOG_ASYNC=False, RESPONSE_CACHE_ALIAS="default")
+
+
+def setUpModule():
+    isolated.enable()
+
+
+def tearDownModule():
+    isolated.disable()
+
+
+def make_item(name, quantity, threshold=0):
+    return InventoryItem.objects.create(
+        name=name, sku=name.upper(), quantity=quantity, threshold=threshold, category="Production"
+    )
+
+
+def lookups(cache):
+    return tuple(CACHE_LOOKUPS.values.get((cache, result), 0) for result in ("hit", "miss"))
+
+
+def schedule_csv(*vins):
+    header = ",".join(f'"{column}"' for column in EXPECTED_COLUMNS)
+    rows = [f"{vin},Model {vin},,2025-01-01,2024-12-01,Client,,Yard" for vin in vins]
+    return "\n".join([header, *rows]) + "\n"
+
+
+def upload(content, name="schedule.csv"):
+    file = io.BytesIO(content.encode() if isinstance(content, str) else content)
+    file.name = name
+    return file
+
+
+class RemoveStockTests(TestCase):
+    def test_batch_is_applied_in_one_statement(self):
+        a, b = make_item("a", 5), make_item("b", 3)
+        with CaptureQueriesContext(connection) as ctx:
+            remove_stock({a.id: 2, b.id: 3})
+        updates = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 1)
+        a.refresh_from_db()
+        b.refresh_from_db()
+        self.assertEqual((a.quantity, b.quantity), (3, 0))
+
+    def test_short_item_rejects_whole_batch(self):
+        a, b = make_item("a", 5), make_item("b", 1)
+        with self.assertRaises(InsufficientStock) as ctx:
+            remove_stock({a.id: 2, b.id: 2})
+        self.assertEqual(ctx.exception.shortages, {b.id: (2, 1)})
+        a.refresh_from_db()
+        self.assertEqual(a.quantity, 5)
+
+    def test_backorder_empties_short_items(self):
+        a, b = make_item("a", 5), make_item("b", 1)
+        result = remove_stock({a.id: 2, b.id: 4}, backorder=True)
+        self.assertEqual(result["backordered"], {b.id: 3})
+        self.assertEqual(
+            dict(InventoryItem.objects.values_list("id", "quantity")), {a.id: 3, b.id: 0}
+        )
+
+    def test_breached_items_are_flagged_once(self):
+        a = make_item("a", 5, threshold=4)
+        self.assertEqual(remove_stock({a.id: 2})["breached"], [a])
+        self.assertEqual(remove_stock({a.id: 1})["breached"], [])
+        a.refresh_from_db()
+        self.assertTrue(a.threshold_breached)
+
+
+class CarImportTests(TestCase):
+    def frame(self, *rows):
+        return pd.DataFrame([dict(zip(EXPECTED_COLUMNS, row)) for row in rows])
+
+    def test_rows_are_upserted_by_normalized_vin(self):
+        Car.objects.create(vin="VIN1", model="Old", status="allocated")
+        success_count, errors = import_batch(self.frame(
+            (" vin1 ", "Van", None, "2025-01-31", "not a date", " Client ", None, "Yard"),
+            ("VIN2", "Van", None, None, None, "A", None, "Yard"),
+            ("VIN2", "Truck", None, None, None, "B", None, "Yard"),  # Later rows win
+        ))
+        self.assertEqual((success_count, errors), (3, []))
+        car = Car.objects.get(vin="VIN1")
+        self.assertEqual(
+            (car.model, car.scheduled_date, car.order_date, car.client_name, car.status),
+            ("Van", date(2025, 1, 31), None, "Client", "from_upcoming"),
+        )
+        self.assertEqual(list(Car.objects.filter(vin="VIN2").values_list("model", "client_name")), [("Truck", "B")])
+
+    def test_invalid_rows_are_reported_and_skipped(self):
+        success_count, errors = import_batch(self.frame(
+            (" ", "Van", None, None, None, "A", None, "Yard"),
+            ("V" * 18, "Van", None, None, None, "A", None, "Yard"),
+            ("VIN3", "Van", None, None, None, "A", None, "Yard"),
+        ))
+        self.assertEqual(success_count, 1)
+        self.assertEqual(errors, ["Row 1: VIN is required.", "Row 2: VIN must be at most 17 characters."])
+        self.assertEqual(list(Car.objects.values_list("vin", flat=True)), ["VIN3"])
+
+    def test_query_count_does_not_grow_with_the_rows(self):
+        def queries(vins):
+            Car.objects.bulk_create([Car(vin=vin, model="Old") for vin in vins[::2]])
+            with CaptureQueriesContext(connection) as ctx:
+                import_batch(self.frame(*[(vin, "Van", None, None, None, "A", None, "Yard") for vin in vins]))
+            return len(ctx.captured_queries)
+
+        self.assertEqual(queries([f"A{n}" for n in range(4)]), queries([f"B{n}" for n in range(40)]))
+
+
+class ScheduleReaderTests(TestCase):
+    def test_csv_is_read_in_bounded_batches(self):
+        columns, batches = open_schedule(upload(schedule_csv(*[f"VIN{n}" for n in range(5)])), batch_size=2)
+        self.assertEqual(columns, list(EXPECTED_COLUMNS))
+        self.assertEqual([list(batch.index) for batch in batches], [[0, 1], [2, 3], [4]])
+
+    def test_xlsx_batches_skip_blank_rows_and_keep_row_positions(self):
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append(list(EXPECTED_COLUMNS))
+        for vin in ("VIN0", None, "VIN2", "VIN3"):
+            sheet.append([vin, "Van"] if vin else [])
+        content = io.BytesIO()
+        workbook.save(content)
+
+        columns, batches = open_schedule(upload(content.getvalue(), "schedule.xlsx"), batch_size=2)
+        batches = list(batches)
+        self.assertEqual([list(batch.index) for batch in batches], [[0, 2], [3]])
+        self.assertEqual(list(batches[0]["Frame"]), ["VIN0", "VIN2"])
+
+    def test_each_batch_is_reported_as_it_is_imported(self):
+        content = schedule_csv("VIN1", "", "VIN3")
+        _, batches = open_schedule(upload(content), batch_size=2)
+        reports = import_schedule(batches)
+        self.assertEqual(next(reports), {
+            "first_row": 1, "last_row": 2, "success_count": 1, "errors": ["Row 2: VIN is required."],
+        })
+        self.assertEqual(Car.objects.count(), 1)  # Written before the next batch is read
+        self.assertEqual(next(reports), {"first_row": 3, "last_row": 3, "success_count": 1, "errors": []})
+
+
+class CheckoutCreateTests(TestCase):
+    def setUp(self):
+        User.objects.create_user(username="fitter", unique_id="F1")
+        get_barcode_cache().clear()
+
+    def checkout(self, *parts, order_number="1001"):
+        return self.client.post("/api/checkout/", {
+            "user": "F1", "vin": "VIN1", "order_number": order_number, "parts": list(parts),
+        }, content_type="application/json")
+
+    def quantities(self):
+        return dict(InventoryItem.objects.values_list("name", "quantity"))
+
+    def test_parts_are_added_and_stock_taken(self):
+        a, b = make_item("a", 5), make_item("b", 5)
+        response = self.checkout({"part": a.barcode}, {"part": a.barcode}, {"part": b.barcode, "damaged": True})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.quantities(), {"a": 3, "b": 3})  # Damaged parts cost two
+        self.assertEqual(CheckoutPart.objects.filter(checkout__order_number="1001").count(), 3)
+
+    def test_unknown_barcode_leaves_nothing_behind(self):
+        a = make_item("a", 5)
+        response = self.checkout({"part": a.barcode}, {"part": "missing"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("'missing'", response.json()["parts"])
+        self.assertFalse(Checkout.objects.exists())
+        self.assertEqual(self.quantities(), {"a": 5})
+
+    def test_short_stock_rejects_the_whole_checkout(self):
+        a, b = make_item("a", 5), make_item("b", 1)
+        response = self.checkout({"part": a.barcode}, {"part": b.barcode, "damaged": True})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["parts"], ["Not enough stock for 'b': 2 needed, 1 available"])
+        self.assertFalse(Checkout.objects.exists())
+        self.assertEqual(self.quantities(), {"a": 5, "b": 1})
+
+    def test_vin_is_stored_normalized_and_filtered_by_prefix(self):
+        a = make_item("a", 5)
+        self.client.post("/api/checkout/", {
+            "user": "F1", "vin": " wvwzzz1 ", "order_number": "1001", "parts": [{"part": a.barcode}],
+        }, content_type="application/json")
+        self.checkout({"part": a.barcode}, order_number="1002")  # VIN1
+        self.assertEqual(Checkout.objects.get(order_number="1001").vin, "WVWZZZ1")
+        response = self.client.get("/api/checkout/?vin=%20wv")
+        self.assertEqual([checkout["order_number"] for checkout in response.json()], ["1001"])
+
+    def test_query_count_does_not_grow_with_the_parts(self):
+        items = [make_item(f"p{n}", 5) for n in range(10)]
+
+        def queries(count, order_number):
+            get_barcode_cache().clear()
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.checkout(*[{"part": item.barcode} for item in items[:count]], order_number=order_number)
+            self.assertEqual(response.status_code, 201)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(queries(2, "1001"), queries(10, "1002"))
+
+
+class ImportJobTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+
+    def make_job(self, content):
+        path = os.path.join(self.directory, "schedule.csv")
+        with open(path, "w") as file:
+            file.write(content)
+        return ImportJob.objects.create(file_name="schedule.csv", file_path=path)
+
+    def test_job_is_imported_and_only_claimed_once(self):
+        job = self.make_job(schedule_csv("VIN1", "VIN2"))
+        real_import = import_jobs.import_schedule
+
+        def import_schedule(batches):
+            run_import_job(job.id)  # A second worker picks the same job up mid-run
+            yield from real_import(batches)
+
+        with mock.patch.object(import_jobs, "import_schedule", import_schedule):
+            run_import_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.success_count, job.errors), ("completed", 1, 2, []))
+        self.assertEqual(Car.objects.count(), 2)
+        self.assertFalse(os.path.exists(job.file_path))  # Removed once fully imported
+
+    def test_failed_job_can_be_retried(self):
+        job = self.make_job(schedule_csv("VIN1"))
+        os.remove(job.file_path)
+        run_import_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.status, "failed")
+        self.assertTrue(job.errors[0].startswith("Import failed:"))
+
+        self.assertTrue(retry_import(job))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.errors, job.finished_at), ("pending", [], None))
+        self.assertFalse(retry_import(job))  # Already queued
+
+    def test_upload_checks_the_header_before_queueing(self):
+        with override_settings(IMPORT_JOB_DIR=self.directory):
+            response = self.client.post("/api/api/cars/bulk_upload/", {"file": upload("Frame,Name\nVIN1,Client\n")})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("Missing required columns", response.json()["error"])
+            response = self.client.post("/api/api/cars/bulk_upload/", {"file": upload(schedule_csv("VIN1"))})
+        self.assertEqual(response.status_code, 202)
+        job = ImportJob.objects.get()
+        with open(job.file_path) as file:
+            self.assertEqual(file.read(), schedule_csv("VIN1"))
+
+    def test_uploads_to_the_car_list_are_counted(self):
+        before = [REQUESTS.values.get(("upload_cars", status), 0) for status in (400, 202)]
+        with override_settings(IMPORT_JOB_DIR=self.directory):
+            self.client.post("/api/cars/", {"file": upload("Frame,Name\nVIN1,Client\n")})
+            response = self.client.post("/api/cars/", {"file": upload(schedule_csv("VIN1"))})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual([REQUESTS.values.get(("upload_cars", status), 0) for status in (400, 202)],
+                         [count + 1 for count in before])
+
+    def test_header_check_closes_the_workbook(self):
+        workbook = Workbook()
+        workbook.active.append(list(EXPECTED_COLUMNS))
+        content = io.BytesIO()
+        workbook.save(content)
+
+        opened = []
+
+        def open_workbook(*args, **kwargs):
+            opened.append(load_workbook(*args, **kwargs))
+            return opened[-1]
+
+        file = upload(content.getvalue(), "schedule.xlsx")
+        with mock.patch("api.car_import.load_workbook", open_workbook):
+            self.assertEqual(schedule_columns(file), list(EXPECTED_COLUMNS))
+        self.assertIsNone(opened[0]._archive.fp)
+        self.assertEqual(file.tell(), 0)
+
+
+class LogArchiveTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        archive_dir = override_settings(LOG_ARCHIVE_DIR=directory)
+        archive_dir.enable()
+        self.addCleanup(archive_dir.disable)
+
+    def log(self, action, when, user="alice"):
+        return Log.objects.create(action=action, user=user, timestamp=timezone.make_aware(when))
+
+    def test_old_logs_move_to_monthly_archives(self):
+        january = self.log("Added", datetime(2020, 1, 31, 23, 0))
+        february = self.log("Removed", datetime(2020, 2, 1, 1, 0), user="bob")
+        recent = Log.objects.create(action="Added", user="alice")
+
+        self.assertEqual(archive_logs(older_than_days=30, batch_size=1), 2)
+        self.assertEqual(list(Log.objects.values_list("id", flat=True)), [recent.id])
+        self.assertEqual(archived_months(), ["2020-01", "2020-02"])
+        self.assertEqual([row["id"] for row in read_archive("2020-01")], [january.id])
+        self.assertEqual([(row["id"], row["user"]) for row in read_archive("2020-02")], [(february.id, "bob")])
+
+    def test_rearchived_batch_is_read_once(self):
+        log = self.log("Added", datetime(2020, 1, 1))
+        archive_logs(older_than_days=30)
+        log.save()  # As if the run had died before deleting the batch
+        self.assertEqual(archive_logs(older_than_days=30), 1)
+
+        self.assertEqual([row["id"] for row in read_archive("2020-01")], [log.id])
+        self.assertEqual(compact_archive("2020-01"), 1)
+        self.assertEqual([row["id"] for row in read_archive("2020-01")], [log.id])
+
+    def test_archive_view_filters_a_month(self):
+        self.log("Added", datetime(2020, 1, 5))
+        self.log("Removed", datetime(2020, 1, 6))
+        self.log("Added", datetime(2020, 1, 20), user="bob")
+        archive_logs(older_than_days=30)
+
+        self.assertEqual(self.client.get("/api/logs/archive/").json(), {"months": ["2020-01"]})
+        response = self.client.get("/api/logs/archive/2020-01/?action=Added&until=2020-01-10")
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual([(row["action"], row["timestamp"][:10]) for row in rows], [("Added", "2020-01-05")])
+        self.assertEqual(self.client.get("/api/logs/archive/2020-01/?since=soon").status_code, 400)
+        self.assertEqual(self.client.get("/api/logs/archive/2020-02/").status_code, 404)
+
+
+class CarFilterTests(TestCase):
+    def vins(self, query):
+        response = self.client.get(f"/api/cars/?{query}")
+        self.assertEqual(response.status_code, 200)
+        return [car["vin"] for car in response.json()]
+
+    def test_vin_prefix_is_bounded_on_both_sides(self):
+        for vin in ("AB", "ABC", "ABC1", "ABCZ", "ABD1"):
+            Car.objects.create(vin=vin, model="M")
+        self.assertEqual(self.vins("vin=abc"), ["ABC", "ABC1", "ABCZ"])
+        self.assertEqual(self.vins("vin=ABC1"), ["ABC1"])
+
+    def test_blank_vin_is_ignored(self):
+        Car.objects.create(vin="ABC1", model="M")
+        self.assertEqual(self.vins("vin=%20"), ["ABC1"])
+
+    def test_invalid_value_is_a_bad_request(self):
+        response = self.client.get("/api/cars/?scheduled_after=soon")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("scheduled_after", response.json())
+
+
+class ScanVinTests(TestCase):
+    def scan(self, vin):
+        return self.client.post("/api/api/scan_vin/", {"vin": vin}, content_type="application/json")
+
+    def test_upcoming_car_is_allocated_once(self):
+        Car.objects.create(vin="VIN1", model="M", status="from_upcoming")
+        response = self.scan(" vin1 ")
+        self.assertEqual(response.json(), {"status": "allocated", "message": "Car status updated."})
+        self.assertEqual(self.scan("VIN1").json()["status"], "allocated")  # Not moved again
+        self.assertEqual(Car.objects.get().status, "allocated")
+        self.assertEqual(Log.objects.filter(action="Scanned Car", item_name="VIN1").count(), 2)
+
+    def test_scheduled_car_becomes_upcoming(self):
+        Car.objects.create(vin="VIN1", model="M", status="")
+        self.assertEqual(self.scan("vin1").json()["status"], "from_upcoming")
+        self.assertEqual(Car.objects.get().status, "from_upcoming")
+
+    def test_unknown_car_is_added_normalized(self):
+        response = self.scan(" vin9 ")
+        self.assertEqual(response.json(), {"status": "unknown", "message": "Unknown car added to the system."})
+        car = Car.objects.get()
+        self.assertEqual((car.vin, car.status), ("VIN9", "unknown"))
+        self.assertEqual(self.scan("VIN9").json()["status"], "unknown")
+        self.assertEqual(Car.objects.count(), 1)
+
+    def test_blank_vin_is_rejected(self):
+        self.assertEqual(self.scan("  ").status_code, 400)
+        self.assertFalse(Car.objects.exists())
+
+
+class ScanBatchTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user(username="fitter", unique_id="F1"))
+        get_barcode_cache().clear()
+
+    def batch(self, **data):
+        return self.client.post("/api/api/scan_batch/", data, content_type="application/json")
+
+    def lines(self, session_id):
+        return dict(ScanLine.objects.filter(session__session_id=session_id).values_list("item__name", "count"))
+
+    def test_barcodes_and_vins_are_scanned_together(self):
+        a, b = make_item("a", 5), make_item("b", 5)
+        response = self.batch(barcodes=[a.barcode, "missing", a.barcode, b.barcode], vins=[" vin1 ", ""])
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["scanned"], 3)
+        self.assertEqual([result["status"] for result in body["results"]], ["added", "not_found", "added", "added"])
+        self.assertEqual(body["cars"], [{"vin": "VIN1", "status": "unknown", "message": "Unknown car added to the system."}])
+        self.assertEqual(self.lines(body["session_id"]), {"a": 2, "b": 1})
+
+        body = self.batch(session_id=body["session_id"], barcodes=[b.barcode, b.barcode]).json()
+        self.assertEqual(body["scanned"], 5)
+        self.assertEqual(self.lines(body["session_id"]), {"a": 2, "b": 3})
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        items = [make_item(f"p{n}", 5) for n in range(10)]
+
+        def queries(count):
+            get_barcode_cache().clear()
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.batch(barcodes=[item.barcode for item in items[:count]] * 3)
+            self.assertEqual(response.status_code, 200)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(queries(2), queries(10))
+
+    def test_bad_batches_are_rejected(self):
+        self.assertEqual(self.batch(barcodes="ABC").status_code, 400)
+        self.assertEqual(self.batch(barcodes=["ABC"] * (MAX_BATCH_SCANS + 1)).status_code, 400)
+        self.assertEqual(self.batch(session_id="nope", barcodes=["ABC"]).status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.batch(barcodes=["ABC"]).status_code, 403)
+        self.assertFalse(ScannedItem.objects.exists())
+
+
+class ScanSessionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="fitter", unique_id="F1")
+        get_barcode_cache().clear()
+
+    def session(self, **counts):
+        session = ScannedItem.objects.create(car_label="CAR", user=self.user)
+        add_scans(session, {InventoryItem.objects.get(name=name).id: count for name, count in counts.items()})
+        return session
+
+    def test_repeated_scans_add_to_one_line(self):
+        a, b = make_item("a", 5), make_item("b", 5)
+        session = self.session(a=2)
+        with self.assertNumQueries(3):  # Existing lines, one bump, one insert
+            add_scans(session, {a.id: 3, b.id: 1, 0: 0})
+        self.assertEqual([(line["name"], line["count"]) for line in session_lines(session)], [("a", 5), ("b", 1)])
+        self.assertEqual(scan_total(session), 6)
+
+    def test_scan_item_shows_the_session_lines(self):
+        a = make_item("a", 5)
+        self.client.force_login(self.user)
+        session_id = self.client.post("/api/api/scan_item/", {"car_label": "CAR", "part_barcode": a.barcode}).json()["session_id"]
+        response = self.client.post("/api/api/scan_item/", {"session_id": session_id, "part_barcode": a.barcode})
+        self.assertEqual(response.json()["parts"], [{"barcode": a.barcode, "name": "a", "sku": "A", "count": 2}])
+        response = self.client.post("/api/api/scan_item/", {"session_id": session_id, "part_barcode": "missing"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_confirm_takes_the_session_out_of_stock(self):
+        make_item("a", 5)
+        make_item("b", 5)
+        session = self.session(a=2, b=5)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post("/api/api/confirm_session/", {"session_id": session.session_id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sum(query["sql"].startswith("UPDATE") for query in ctx.captured_queries), 1)
+        self.assertEqual(dict(InventoryItem.objects.values_list("name", "quantity")), {"a": 3, "b": 0})
+        self.assertFalse(ScannedItem.objects.exists())
+        self.assertFalse(ScanLine.objects.exists())
+
+    def test_short_stock_keeps_the_session(self):
+        make_item("a", 5)
+        b = make_item("b", 1)
+        session = self.session(a=2, b=3)
+        response = self.client.post("/api/api/confirm_session/", {"session_id": session.session_id})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["shortages"], [{"item": b.id, "requested": 3, "available": 1}])
+        self.assertEqual(dict(InventoryItem.objects.values_list("name", "quantity")), {"a": 5, "b": 1})
+        self.assertEqual(scan_total(session), 5)
+
+
+@override_settings(SCAN_SESSION_TTL_HOURS=12)
+class ScanSessionExpiryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="fitter", unique_id="F1")
+        self.item = make_item("a", 5)
+        get_barcode_cache().clear()
+
+    def session(self, age_hours):
+        session = ScannedItem.objects.create(car_label="CAR", user=self.user)
+        add_scans(session, {self.item.id: 2})
+        ScannedItem.objects.filter(id=session.id).update(created_at=timezone.now() - timedelta(hours=age_hours))
+        return session
+
+    def test_expired_session_is_not_scanned_into_or_confirmed(self):
+        session_id = str(self.session(13).session_id)
+        self.client.force_login(self.user)
+        response = self.client.post("/api/api/scan_item/", {"session_id": session_id, "part_barcode": self.item.barcode})
+        self.assertEqual(response.status_code, 410)
+        response = self.client.post("/api/api/scan_batch/", {"session_id": session_id, "barcodes": [self.item.barcode]},
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 410)
+        self.assertEqual(self.client.post("/api/api/confirm_session/", {"session_id": session_id}).status_code, 410)
+        self.assertEqual(ScanLine.objects.get().count, 2)
+        self.assertEqual(InventoryItem.objects.get().quantity, 5)
+
+    def test_sweep_removes_only_expired_sessions(self):
+        live = self.session(1)
+        for _ in range(3):
+            self.session(13)
+        self.assertEqual(session_counts(), {"live": 1, "expired": 3})
+
+        self.assertEqual(sweep_sessions(batch_size=2), 3)
+        self.assertEqual(list(ScannedItem.objects.all()), [live])
+        self.assertEqual(ScanLine.objects.count(), 1)
+        self.assertEqual(InventoryItem.objects.get().quantity, 5)  # Stock is untouched
+        self.assertEqual(Log.objects.get(action="Expired Scan Sessions").details, "Removed 3 session(s) older than 12h")
+        self.assertEqual(self.client.get("/api/api/scan_sessions/stats/").json(), {"live": 1, "expired": 0, "ttl_hours": 12})
+
+    def test_sweep_command_reports_counts(self):
+        self.session(1)
+        self.session(13)
+        out = io.StringIO()
+        call_command("sweep_scan_sessions", stdout=out)
+        self.assertEqual(out.getvalue(), "Removed 1 expired session(s) older than 12h; 1 live, 0 expired.\n")
+        call_command("sweep_scan_sessions", stdout=out)
+        self.assertEqual(Log.objects.filter(action="Expired Scan Sessions").count(), 1)  # Nothing swept, nothing logged
+
+
+class ThresholdTests(TestCase):
+    def test_upcoming_demand_breaches_until_the_car_is_allocated(self):
+        item = make_item("a", 10, threshold=5)
+        car = Car.objects.create(vin="VIN1", model="Model", status="from_upcoming")
+        CarPart.objects.create(car=car, inventory_item=item, quantity_needed=6)
+        item.refresh_from_db()
+        self.assertTrue(item.threshold_breached)  # 10 in stock - 6 needed < 5
+
+        car.status = "allocated"
+        car.save()
+        item.refresh_from_db()
+        self.assertFalse(item.threshold_breached)
+
+    def test_item_edit_recomputes_the_flag(self):
+        item = make_item("a", 10, threshold=5)
+        response = self.client.patch(f"/api/inventory/{item.id}/", {"quantity": 2}, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        item.refresh_from_db()
+        self.assertTrue(item.threshold_breached)
+
+        self.client.patch(f"/api/inventory/{item.id}/", {"threshold": 1}, content_type="application/json")
+        item.refresh_from_db()
+        self.assertFalse(item.threshold_breached)
+
+    def test_shortfalls_only_reads(self):
+        item = make_item("a", 10, threshold=5)
+        InventoryItem.objects.filter(id=item.id).update(quantity=2)  # Skips the flag update
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/api/inventory/shortfalls/")
+        self.assertEqual([row["item"] for row in response.json()], [item.id])
+        self.assertTrue(all(query["sql"].startswith("SELECT") for query in ctx.captured_queries))
+        item.refresh_from_db()
+        self.assertFalse(item.threshold_breached)
+
+
+class InventoryListQueryTests(TestCase):
+    def test_tree_is_served_in_one_query(self):
+        for root in range(3):
+            parent = make_item(f"root{root}", 1)
+            for level in range(4):
+                child = make_item(f"root{root}-{level}", 1)
+                child.parent = parent
+                child.save()
+                parent = child
+
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/inventory/")
+        self.assertEqual(response.status_code, 200)
+
+        roots = [item for item in response.json() if item["parent"] is None]
+        self.assertEqual(len(response.json()), 15)
+        depth, node = 0, roots[0]
+        while node["children"]:
+            depth, node = depth + 1, node["children"][0]
+        self.assertEqual(depth, 4)
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        responses = {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": directory}
+        overridden = override_settings(CACHES={**settings.CACHES, "responses": responses}, RESPONSE_CACHE_ALIAS="responses")
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+    def test_unchanged_list_is_not_modified(self):
+        make_item("a", 5)
+        etag = self.client.get("/api/inventory/")["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/inventory/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_stock_movement_changes_the_etag(self):
+        item = make_item("a", 5)
+        etag = self.client.get("/api/inventory/")["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            remove_stock({item.id: 2})
+        response = self.client.get("/api/inventory/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.json()[0]["quantity"], 3)
+
+    def test_lookups_are_counted(self):
+        before = lookups("response")
+        self.client.get("/api/inventory/")
+        self.client.get("/api/inventory/")
+        self.assertEqual(lookups("response"), (before[0] + 1, before[1] + 1))
+
+    def test_locmem_alias_is_not_cached(self):
+        make_item("a", 5)
+        with override_settings(RESPONSE_CACHE_ALIAS="default"):
+            etag = self.client.get("/api/inventory/").get("ETag")
+            with self.assertNumQueries(1):
+                response = self.client.get("/api/inventory/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(etag)
+
+
+class RequestMetricsTests(TestCase):
+    @override_settings(DEBUG=True)
+    def test_middleware_chain_is_not_adapted_under_asgi(self):
+        # Django logs every sync/async adaptation of a middleware handler in DEBUG
+        with self.assertNoLogs("django.request", "DEBUG"):
+            ASGIHandler()
+
+    async def test_queries_are_reported_under_asgi(self):
+        with self.assertLogs("api.requests", "INFO") as logs:
+            response = await self.async_client.get("/api/categories/")
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record["view"], record["queries"]), ("category-list", 1))
+        self.assertIn('desc="1 queries, 0 duplicate"', response["Server-Timing"])
+
+    def test_queries_and_repeats_are_reported(self):
+        user = User.objects.create_user(username="scanner", unique_id="S1")
+        for order in range(3):
+            Checkout.objects.create(user=user, vin="VIN", order_number=str(order))
+        with self.assertLogs("api.requests", "INFO") as logs:
+            response = self.client.get("/api/checkout/")
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record["view"], record["queries"], record["duplicate_queries"]), ("checkout-list", 2, 0))
+        self.assertIn('desc="2 queries, 0 duplicate"', response["Server-Timing"])
+
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for checkout in Checkout.objects.all():
+                checkout.user  # One query per checkout
+        self.assertEqual((recorder.count, recorder.duplicates), (4, 2))
+
+
+class MetricsTests(SimpleTestCase):
+    def test_processes_are_added_up_and_exited_ones_archived(self):
+        with tempfile.TemporaryDirectory() as directory:
+            def worker_file(pid, scans, workers):
+                registry = MetricsRegistry()
+                registry.counter("scans_total", "Scans.", ["kind"]).inc(scans, kind="vin")
+                registry.gauge("workers", "Workers.").set(workers)
+                with open(os.path.join(directory, f"metrics-{pid}-token.json"), "w") as file:
+                    json.dump(registry.snapshot(), file)
+
+            worker_file(os.getppid(), 3, 1)  # Running
+            worker_file(2 ** 22 + 1, 4, 1)  # Exited: above the kernel's pid limit
+            registry = MetricsRegistry(directory)
+            registry.counter("scans_total", "Scans.", ["kind"]).inc(kind="vin")
+            registry.histogram("scan_seconds", "Scan time.", buckets=(0.1, 1)).observe(0.5)
+
+            text = registry.render()
+            self.assertIn('scans_total{kind="vin"} 8', text)
+            self.assertIn("workers 1", text)  # The exited worker's gauge is dropped
+            self.assertIn('scan_seconds_bucket{le="0.1"} 0\nscan_seconds_bucket{le="1"} 1', text)
+            self.assertEqual(
+                sorted(name for name in os.listdir(directory) if name.endswith(".json")),
+                [f"metrics-{os.getppid()}-token.json", "metrics-archive.json"],
+            )
+            self.assertEqual(text, registry.render())  # Archived counts are kept, once
+
+    def test_archive_lock_uses_msvcrt_without_fcntl(self):
+        msvcrt = mock.Mock(LK_LOCK=1, LK_UNLCK=0)
+        msvcrt.locking.side_effect = [OSError("busy"), None, None]
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch("api.metrics.fcntl", None), mock.patch("api.metrics.msvcrt", msvcrt, create=True):
+            with metrics._file_lock(os.path.join(directory, "lock")):
+                self.assertEqual(msvcrt.locking.call_count, 2)  # Retried until granted
+        self.assertEqual(msvcrt.locking.call_args.args[1:], (msvcrt.LK_UNLCK, 1))
+
+    def test_timed_views_count_responses_by_status(self):
+        before = self.requests("scan_vin", 400)
+        self.client.post("/api/api/scan_vin/", {}, content_type="application/json")
+        self.assertEqual(self.requests("scan_vin", 400), before + 1)
+
+    def test_requests_rejected_before_the_view_are_counted(self):
+        counted = [("scan_batch", 403), ("scan_vin", 405), ("async_scan_item", 405)]
+        before = [self.requests(*key) for key in counted]
+        self.client.post("/api/api/scan_batch/", {}, content_type="application/json")  # Not logged in
+        self.client.get("/api/api/scan_vin/")
+        self.client.get("/api/async/scan_item/")
+        self.assertEqual([self.requests(*key) for key in counted], [count + 1 for count in before])
+
+    def test_registry_follows_metrics_dir(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(METRICS_DIR=directory):
+                REQUESTS.inc(endpoint="scan_vin", status=200)
+                registry.flush()
+                self.assertEqual(len(os.listdir(directory)), 1)
+            self.assertIsNone(registry.directory)
+            self.assertEqual(REQUESTS.values, {})  # Not carried over to the other directory
+
+    def requests(self, endpoint, status):
+        return REQUESTS.values.get((endpoint, status), 0)
+
+
+class BenchmarkCommandTests(TestCase):
+    def test_results_are_written_and_rolled_back(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "results.json")
+            call_command(
+                "benchmark", cars=20, items=10, logs=20, requests=5, upload_rows=5,
+                output=output, stdout=io.StringIO(),
+            )
+            with open(output) as file:
+                scenarios = json.load(file)["scenarios"]
+        self.assertEqual(scenarios["scan_vin"]["requests"], 5)
+        self.assertFalse(any(result["errors"] for result in scenarios.values()))
+        self.assertFalse(InventoryItem.objects.exists())
+
+
+class LoadTestCommandTests(TransactionTestCase):
+    # Under the ASGI handler sync views run on another thread, which only sees committed rows
+    def test_every_scenario_runs_in_process_without_errors(self):
+        for scenario in ("scan_vin", "scan_item", "confirm_session", "checkout"):
+            with self.subTest(scenario), self.assertLogs("api.requests", "INFO"):
+                stdout = io.StringIO()
+                call_command("load_test", in_process=True, scenario=scenario, requests=12, stdout=stdout)
+            lines = stdout.getvalue().splitlines()
+            self.assertEqual([line.split()[0] for line in lines], ["WSGI", "ASGI"])
+            self.assertTrue(all("12 requests, 0 errors" in line for line in lines), lines)
+
+
+class ExplainQueriesTests(TestCase):
+    def issues(self, queryset):
+        with CaptureQueriesContext(connection) as ctx:
+            list(queryset)
+        sql = ctx.captured_queries[0]["sql"]
+        return plan_issues(connection.vendor, sql, explain(connection, sql), set())
+
+    def test_limited_scan_on_an_unindexed_filter_is_reported(self):
+        self.assertEqual(self.issues(InventoryItem.objects.filter(name="a")[:5]), ["full scan of api_inventoryitem"])
+
+    def test_keyset_page_in_primary_key_order_is_not_a_full_scan(self):
+        self.assertEqual(self.issues(InventoryItem.objects.order_by("-id")[:5]), [])
+        self.assertEqual(self.issues(InventoryItem.objects.order_by("name")[:5]), [
+            "full scan of api_inventoryitem", "sort without an index",
+        ])
+
+
+class AuditLogWriterTests(TestCase):
+    EXITED_PID = 2 ** 22 + 1  # Above the kernel's pid limit
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+
+    def entry(self, action):
+        return {"action": action, "item_name": None, "user": "tester", "details": None,
+                "timestamp": "2025-01-01T00:00:00+00:00"}
+
+    def test_entries_are_spooled_until_written(self):
+        writer = AuditLogWriter(self.directory, batch_size=100, flush_interval=3600)
+        self.addCleanup(writer.close)
+        writer.log(self.entry("Scanned Car"))
+        with open(os.path.join(self.directory, f"audit-{writer.owner}.jsonl")) as spool:
+            self.assertEqual(json.loads(spool.readline())["action"], "Scanned Car")
+        self.assertFalse(Log.objects.exists())
+
+        self.assertEqual(writer.flush(), 1)
+        self.assertEqual(list(Log.objects.values_list("action", flat=True)), ["Scanned Car"])
+        self.assertEqual(os.listdir(self.directory), [f"audit-{writer.owner}.jsonl"])
+
+    def test_windows_liveness_is_probed_without_signals(self):
+        def get_exit_code(handle, exit_code):
+            exit_code._obj.value = audit.STILL_ACTIVE if handle == "running" else 0
+            return 1
+
+        kernel32 = mock.Mock()
+        kernel32.OpenProcess.side_effect = lambda access, inherit, pid: {1: "running", 2: "exited"}.get(pid, 0)
+        kernel32.GetExitCodeProcess.side_effect = get_exit_code
+        kernel32.GetLastError.return_value = 87  # ERROR_INVALID_PARAMETER: no such process
+        with mock.patch.object(audit, "WINDOWS", True), mock.patch("ctypes.windll", mock.Mock(kernel32=kernel32), create=True), \
+                mock.patch("os.kill") as kill:
+            self.assertEqual([audit.pid_alive(pid) for pid in (1, 2, 3)], [True, False, False])
+        kill.assert_not_called()
+        self.assertEqual(kernel32.CloseHandle.call_count, 2)
+
+    def test_failed_flush_is_retried_on_the_next_flush(self):
+        writer = AuditLogWriter(self.directory, batch_size=100, flush_interval=3600)
+        self.addCleanup(writer.close)
+        writer.log(self.entry("First"))
+        with mock.patch.object(audit, "write_entries", side_effect=OperationalError("database is locked")):
+            with self.assertRaises(OperationalError):
+                writer.flush()
+        self.assertEqual(len([name for name in os.listdir(self.directory) if name.endswith(".flushing")]), 1)
+
+        writer.log(self.entry("Second"))
+        self.assertEqual(writer.flush(), 2)
+        self.assertEqual(list(Log.objects.order_by("id").values_list("action", flat=True)), ["First", "Second"])
+        self.assertFalse(any(name.endswith(".flushing") for name in os.listdir(self.directory)))
+
+    def test_spool_of_an_exited_writer_is_replayed(self):
+        exited = f"{self.EXITED_PID}-deadbeef"
+        running = f"{os.getppid()}-cafef00d"
+        for name, action in ((f"audit-{exited}.jsonl", "Spooled"), (f"audit-{exited}-3.flushing", "Flushing"),
+                             (f"audit-{running}.jsonl", "Running")):
+            with open(os.path.join(self.directory, name), "w") as spool:
+                spool.write(json.dumps(self.entry(action)) + "\n")
+
+        self.assertEqual(recover_spool(self.directory, "1-owner"), 2)
+        self.assertEqual(set(Log.objects.values_list("action", flat=True)), {"Spooled", "Flushing"})
+        self.assertEqual(os.listdir(self.directory), [f"audit-{running}.jsonl"])
+
+
+class AlertDispatcherTests(TestCase):
+    def test_breaches_are_coalesced_into_one_digest(self):
+        dispatcher = AlertDispatcher(60, start=False)
+        a, b = make_item("a", 1, threshold=5), make_item("b", 2, threshold=5)
+        dispatcher.queue([a])
+        dispatcher.queue([a, b])
+        self.assertEqual(dispatcher.send_digest(), 2)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn("a (A)", mail.outbox[0].body)
+        self.assertIn("b (B)", mail.outbox[0].body)
+
+    def test_repeats_are_suppressed_until_recovery(self):
+        dispatcher = AlertDispatcher(60, start=False)
+        a = make_item("a", 1, threshold=5)
+        dispatcher.queue([a])
+        dispatcher.send_digest()
+        dispatcher.queue([a])
+        self.assertEqual(dispatcher.send_digest(), 0)
+        dispatcher.resolve([a.id])
+        dispatcher.queue([a])
+        self.assertEqual(dispatcher.send_digest(), 1)
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_failed_digest_is_logged_and_kept(self):
+        dispatcher = AlertDispatcher(0, start=False)
+        dispatcher.queue([make_item("a", 1, threshold=5)])
+
+        def send(messages):
+            dispatcher.stopped = True  # Leave the loop after this digest
+            raise OSError("Connection refused")
+
+        with mock.patch("django.core.mail.backends.locmem.EmailBackend.send_messages", side_effect=send), \
+                self.assertLogs("api.alerts", "ERROR") as logs:
+            dispatcher._run()
+        self.assertIn("Connection refused", logs.output[0])
+        self.assertEqual(dispatcher.send_digest(), 1)
+
+
+class BarcodeCacheTests(TestCase):
+    def setUp(self):
+        get_barcode_cache().clear()
+
+    def test_repeat_lookups_are_served_from_cache(self):
+        item = make_item("a", 5)
+        before = lookups("barcode")
+        resolve_barcodes([item.barcode, "missing"])
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_barcodes([item.barcode])[item.barcode]["id"], item.id)
+        stats = get_barcode_cache().stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 2))
+        self.assertEqual(lookups("barcode"), (before[0] + 1, before[1] + 2))
+
+    def test_saving_an_item_invalidates_its_old_barcode(self):
+        item = make_item("a", 5)
+        old = item.barcode
+        resolve_barcodes([old])
+        item.barcode = "NEW-BARCODE"
+        item.save()
+        self.assertEqual(resolve_barcodes([old, "NEW-BARCODE"]), {
+            "NEW-BARCODE": {"id": item.id, "name": "a", "sku": "A", "barcode": "NEW-BARCODE"},
+        })
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = BarcodeCache(max_size=2, ttl=60)
+        cache.set_many({code: {"id": i} for i, code in enumerate("abc")})
+        self.assertEqual(cache.get_many(["a", "b", "c"]), ({"b": {"id": 1}, "c": {"id": 2}}, ["a"]))
+
+    def test_clear_drops_shared_entries_but_not_other_keys(self):
+        backend = LocMemCache("barcode-tests", {})
+        backend.set("session", "kept")
+        cache, other_process = BarcodeCache(10, 60, backend), BarcodeCache(10, 60, backend)
+        cache.set_many({"a": {"id": 1}})
+        self.assertEqual(other_process.get_many(["a"]), ({"a": {"id": 1}}, []))
+        other_process.entries.clear()
+
+        cache.clear()
+        self.assertEqual(other_process.get_many(["a"]), ({}, ["a"]))
+        self.assertEqual(backend.get("session"), "kept")
+
+
+class ChangeFeedTests(TestCase):
+    def test_client_resumes_from_its_last_event(self):
+        feed = ChangeFeed(10)
+        start = feed.latest()
+        feed.publish([("car", {"vin": "A", "status": "allocated"}), ("car", {"vin": "B", "status": "allocated"})])
+        seq = feed.cursor(str(start + 1))
+        self.assertEqual(feed.since(seq), [(start + 2, "car", {"vin": "B", "status": "allocated"})])
+
+    def test_client_resets_when_events_were_pruned_or_never_stored(self):
+        feed = ChangeFeed(2)
+        feed.publish([("item", {"id": i}) for i in range(5)])
+        latest = feed.latest()
+        self.assertEqual(ChangeEvent.objects.count(), 2)
+        self.assertIsNone(feed.since(latest - 3))
+        self.assertIsNone(feed.since(latest + 1))
+        self.assertIsNone(feed.cursor("epoch-4"))
+        self.assertEqual(len(feed.since(latest - 2)), 2)
+
+    def test_publishers_are_serialized_on_postgresql(self):
+        postgres = mock.MagicMock(vendor="postgresql")
+        with mock.patch("api.change_feed.connection", postgres):
+            ChangeFeed(10).publish([("car", {"vin": "A", "status": "allocated"})])
+        cursor = postgres.cursor.return_value.__enter__.return_value
+        cursor.execute.assert_called_once_with("SELECT pg_advisory_xact_lock(%s)", [PUBLISH_LOCK_ID])
+
+    def test_stock_movement_is_published_after_commit(self):
+        item = make_item("a", 5)
+        feed = get_feed()
+        seq = feed.latest()
+        with self.captureOnCommitCallbacks(execute=True):
+            remove_stock({item.id: 2})
+        self.assertIn(("item", {"id": item.id, "quantity": 3, "threshold_breached": False}),
+                      [(kind, data) for _, kind, data in feed.since(seq)])
+
+    def test_feed_is_refused_under_wsgi(self):
+        self.assertEqual(self.client.get("/api/changes/").status_code, 501)
+
+    @override_settings(CHANGE_FEED_POLL_INTERVAL=0.01)
+    async def test_stream_picks_up_events_from_other_processes(self):
+        response = await self.async_client.get("/api/changes/")
+        frames = aiter(response.streaming_content)
+        try:
+            self.assertIn(b"event: reset", await anext(frames))
+            # A separate feed has none of this stream's waiters, like one in another worker
+            await sync_to_async(ChangeFeed(10).publish)([("car", {"vin": "A", "status": "allocated"})])
+            frame = await asyncio.wait_for(anext(frames), 5)
+        finally:
+            await frames.aclose()
+        self.assertIn(b'event: car\ndata: {"vin": "A", "status": "allocated"}', frame)
+
+
+class DatabaseRoutingTests(SimpleTestCase):
+    def test_reads_use_the_replica_only_when_asked(self):
+        router = ReplicaRouter()
+        with mock.patch.dict(settings.DATABASES, {REPLICA: {}}):
+            self.assertIsNone(router.db_for_read(Log))
+            with replica_reads():
+                self.assertEqual(router.db_for_read(Log), REPLICA)
+            self.assertFalse(router.allow_migrate(REPLICA, "api"))
+        with replica_reads():
+            self.assertIsNone(router.db_for_read(Log))  # No replica configured
+
+    def test_profiles(self):
+        sqlite = database_settings(Path("/srv"), {"SQLITE_REPLICA_PATH": "/srv/replica.sqlite3"})
+        self.assertIn("journal_mode=WAL", sqlite["default"]["OPTIONS"]["init_command"])
+        self.assertEqual(sqlite[REPLICA]["TEST"], {"MIRROR": "default"})
+
+        postgres = database_settings(Path("/srv"), {"DB_PROFILE": "postgres", "DB_POOL_MAX_SIZE": "20"})
+        self.assertEqual(postgres["default"]["CONN_MAX_AGE"], 0)
+        self.assertEqual(postgres["default"]["OPTIONS"]["pool"]["max_size"], 20)
+        self.assertNotIn(REPLICA, postgres)
+
+
+class ConcurrentRemoveStockTests(TransactionTestCase):
+    THREADS = 8
+    ATTEMPTS_PER_THREAD = 10
+
+    def test_concurrent_scanners_never_lose_or_oversell(self):
+        item = make_item("contended", 50)
+        taken = []
+        lock = threading.Lock()
+
+        def scanner():
+            try:
+                for _ in range(self.ATTEMPTS_PER_THREAD):
+                    while True:
+                        try:
+                            remove_stock({item.id: 1})
+                        except InsufficientStock:
+                            break
+                        except OperationalError:
+                            time.sleep(0.001)  # database is locked, try again
+                            continue
+                        with lock:
+                            taken.append(1)
+                        break
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=scanner) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        item.refresh_from_db()
+        self.assertEqual(len(taken), 50)
+        self.assertEqual(item.quantity, 0)
+
+
+class ConcurrentConfirmTests(TransactionTestCase):
+    def test_session_confirmed_twice_takes_stock_once(self):
+        item = make_item("contended", 50)
+        user = User.objects.create_user(username="fitter", unique_id="F1")
+        session = ScannedItem.objects.create(car_label="CAR", user=user)
+        add_scans(session, {item.id: 5})
+        outcomes = []
+        lock = threading.Lock()
+        start = threading.Barrier(2)
+
+        def confirm():
+            try:
+                start.wait()
+                while True:
+                    try:
+                        confirm_scans(session)
+                        outcome = "confirmed"
+                    except ScannedItem.DoesNotExist:
+                        outcome = "gone"
+                    except OperationalError:
+                        time.sleep(0.001)  # database is locked, try again
+                        continue
+                    with lock:
+                        outcomes.append(outcome)
+                    break
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=confirm) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        item.refresh_from_db()
+        self.assertEqual(sorted(outcomes), ["confirmed", "gone"])
+        self.assertEqual(item.quantity, 45)
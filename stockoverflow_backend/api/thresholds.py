@@ -0,0 +1,110 @@
+from django.db import transaction
+from django.db.models import F, Q, Sum
+
+from .alerts import queue_breaches, resolve_breaches
+from .models import CarPart, InventoryItem
+from .change_feed import publish_items
+from .response_cache import bump
+
+UPCOMING_STATUS = "from_upcoming"
+
+
+def upcoming_demand(item_ids=None):
+    """
+    Parts needed by all upcoming cars, per inventory item, in one GROUP BY.
+    """
+    parts = CarPart.objects.filter(car__status=UPCOMING_STATUS)
+    if item_ids is not None:
+        parts = parts.filter(inventory_item_id__in=item_ids)
+    rows = parts.values("inventory_item").annotate(total=Sum("quantity_needed"))
+    return {row["inventory_item"]: row["total"] for row in rows}
+
+
+def _projections(item_ids):
+    """
+    (item, projection dict or None) for the items recompute_thresholds
+    looks at; the dict is set when stock minus upcoming demand is below
+    the item's threshold.
+    """
+    demand = upcoming_demand(item_ids)
+
+    items = InventoryItem.objects.all()
+    if item_ids is not None:
+        items = items.filter(id__in=item_ids)
+    else:
+        items = items.filter(
+            Q(id__in=list(demand)) | Q(threshold_breached=True) | Q(quantity__lt=F("threshold"))
+        )
+
+    for item in items.only("id", "name", "sku", "quantity", "threshold", "threshold_breached"):
+        needed = demand.get(item.id, 0)
+        projected = item.quantity - needed
+        if projected >= item.threshold:
+            yield item, None
+            continue
+        yield item, {
+            "item": item.id,
+            "name": item.name,
+            "sku": item.sku,
+            "quantity": item.quantity,
+            "demand": needed,
+            "projected": projected,
+            "threshold": item.threshold,
+            "shortfall": item.threshold - projected,
+        }
+
+
+def projected_shortfalls():
+    """
+    Items projected below their threshold, largest shortfall first. Read
+    only; the flags are kept current by recompute_thresholds on writes.
+    """
+    projections = [projection for _, projection in _projections(None) if projection]
+    projections.sort(key=lambda row: row["shortfall"], reverse=True)
+    return projections
+
+
+def recompute_thresholds(item_ids=None):
+    """
+    Recompute threshold_breached from stock minus upcoming demand.
+
+    With item_ids only those items are looked at, which is what the write
+    paths (stock movements, item saves, Car/CarPart signals) use; without,
+    every item with demand or a flag to reconsider is. Flags are written
+    with at most two UPDATEs.
+
+    Returns {"newly_breached": [InventoryItem], "recovered": [item ids],
+    "projections": [per-item dicts for items projected below threshold]}.
+    """
+    if item_ids is not None:
+        item_ids = list(item_ids)
+        if not item_ids:
+            return {"newly_breached": [], "recovered": [], "projections": []}
+
+    newly_breached, recovered, projections = [], [], []
+    for item, projection in _projections(item_ids):
+        breached = projection is not None
+        if breached:
+            projections.append(projection)
+        if breached and not item.threshold_breached:
+            item.threshold_breached = True
+            newly_breached.append(item)
+        elif not breached and item.threshold_breached:
+            recovered.append(item.id)
+
+    if newly_breached:
+        InventoryItem.objects.filter(id__in=[item.id for item in newly_breached]).update(threshold_breached=True)
+    if recovered:
+        InventoryItem.objects.filter(id__in=recovered).update(threshold_breached=False)
+    if newly_breached or recovered:
+        bump("inventory")
+        publish_items([item.id for item in newly_breached] + recovered)
+        # Alert only once the flags are committed
+        transaction.on_commit(lambda: (queue_breaches(newly_breached), resolve_breaches(recovered)))
+
+    projections.sort(key=lambda row: row["shortfall"], reverse=True)
+    return {"newly_breached": newly_breached, "recovered": recovered, "projections": projections}
+
+
+def items_for_cars(car_ids):
+    return CarPart.objects.filter(car_id__in=car_ids).values_list("inventory_item_id", flat=True).distinct()
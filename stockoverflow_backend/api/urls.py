@@ -1,9 +1,11 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import CarViewSet, InventoryItemViewSet, CategoryViewSet, LogListView, UploadCarsView, UserViewSet, CheckoutViewSet
+from .views import scan_item, scan_batch, confirm_session, ScanSessionStatsView, BarcodeCacheStatsView, CarViewSet, InventoryItemViewSet, CategoryViewSet, LogListView, LogArchiveView, UploadCarsView, UserViewSet, CheckoutViewSet, ImportJobViewSet
 from django.http import JsonResponse
 from django.urls import get_resolver
 from .car_inventory import scan_vin
+from .change_feed import change_feed
+from . import async_views
 
 # Debugging view to list all URLs
 def show_urls(request):
@@ -18,14 +20,28 @@ router.register('inventory', InventoryItemViewSet, basename='inventory')
 router.register('categories', CategoryViewSet)
 router.register('users', UserViewSet)
 router.register(r'checkout', CheckoutViewSet, basename='checkout')
+router.register('import_jobs', ImportJobViewSet)
 
 
 # Define urlpatterns
 urlpatterns = [
     path('', include(router.urls)),         # Register API endpoints
     path('debug/urls/', show_urls),         # Debug endpoint
+    path('changes/', change_feed, name='change-feed'),
+    # ASGI-native scan and checkout endpoints (see async_views)
+    path('async/scan_vin/', async_views.scan_vin, name='async-scan-vin'),
+    path('async/scan_item/', async_views.scan_item, name='async-scan-item'),
+    path('async/confirm_session/', async_views.confirm_session, name='async-confirm-session'),
+    path('async/checkout/', async_views.create_checkout, name='async-checkout'),
     path('logs/', LogListView.as_view(), name='logs-list'),
+    path('logs/archive/', LogArchiveView.as_view(), name='logs-archive'),
+    path('logs/archive/<str:month>/', LogArchiveView.as_view(), name='logs-archive-month'),
     path('api/scan_vin/', scan_vin, name='scan_vin'),
+    path('api/scan_item/', scan_item, name='scan_item'),
+    path('api/scan_batch/', scan_batch, name='scan_batch'),
+    path('api/confirm_session/', confirm_session, name='confirm_session'),
+    path('api/barcode_cache/stats/', BarcodeCacheStatsView.as_view(), name='barcode-cache-stats'),
+    path('api/scan_sessions/stats/', ScanSessionStatsView.as_view(), name='scan-session-stats'),
         path("api/cars/bulk_upload/", UploadCarsView.as_view(), name="bulk_upload"),
 
 ]
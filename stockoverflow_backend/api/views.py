@@ -3,27 +3,58 @@ from rest_framework.response import Response
 from rest_framework import status, viewsets
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.parsers import MultiPartParser, FormParser
-from .models import Car, InventoryItem, Category, Log, ScannedItem, User
+from .models import Car, InventoryItem, Category, Log, ScannedItem, User, normalize_vin
 from .serializers import CarSerializer, InventoryItemSerializer, CategorySerializer, LogSerializer, UserSerializer
 from django.http import JsonResponse
 from rest_framework.generics import ListAPIView
 from django.contrib.auth import authenticate
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
+from django.conf import settings
+from django.db import router, transaction
+import os
 import uuid
 import json
-import pandas as pd
-from .models import Checkout, CheckoutPart, InventoryItem
+from collections import Counter
+from django.core.exceptions import ValidationError
+from .models import Checkout, CheckoutPart, InventoryItem, ImportJob
 from .serializers import CheckoutSerializer
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.decorators import action
-
-from .serializers import CheckoutCreateSerializer
-
-class CheckoutViewSet(viewsets.ModelViewSet):
-    queryset = Checkout.objects.all().order_by("-created_at")
+from rest_framework.decorators import action, api_view, permission_classes
+
+from .serializers import CheckoutCreateSerializer, ImportJobSerializer
+from .car_import import missing_columns, schedule_columns
+from .import_jobs import enqueue_import, retry_import
+from .stock import InsufficientStock
+from .pagination import KeysetPagination, LogPagination
+from .logs import EXPORT_FORMATS, export_logs, log_rows
+from .log_archive import archived_months, filter_archived, read_archive
+from .audit import audit_log, request_user
+from .thresholds import projected_shortfalls
+from .car_inventory import scan_cars
+from .barcodes import get_barcode_cache, resolve_barcodes
+from .response_cache import CachedListMixin
+from .db_router import ReplicaReadsMixin
+from .metrics import timed
+from .scan_sessions import add_scans, confirm_scans, is_expired, scan_total, session_counts, session_lines
+from .filters import QueryParamFilter, StableOrderingFilter, is_filtered
+
+class CheckoutViewSet(ReplicaReadsMixin, viewsets.ModelViewSet):
+    queryset = Checkout.objects.select_related("user").prefetch_related("checkoutpart_set__part").order_by("-created_at")
     serializer_class = CheckoutSerializer  # For read/view
+    pagination_class = KeysetPagination
+    filter_backends = [QueryParamFilter, StableOrderingFilter]
+    query_filters = {
+        "vin": ("vin__prefix", normalize_vin),
+        "order_number": "order_number",
+        "user": "user",
+        "created_after": "created_at__gte",
+        "created_before": "created_at__lt",
+    }
+    ordering_fields = ["created_at", "order_number", "id"]
+    ordering = ("-created_at",)
 
+    @method_decorator(timed("checkout"))
     def create(self, request, *args, **kwargs):
         serializer = CheckoutCreateSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -34,9 +65,15 @@ class CheckoutViewSet(viewsets.ModelViewSet):
 
 
 
-class UserViewSet(ModelViewSet):
+class UserViewSet(CachedListMixin, ModelViewSet):
+    cache_resource = "users"
     queryset = User.objects.all()
     serializer_class = UserSerializer
+    pagination_class = KeysetPagination
+    filter_backends = [QueryParamFilter, StableOrderingFilter]
+    query_filters = {"role": "role", "is_active": "is_active"}
+    ordering_fields = ["username", "role", "id"]
+    ordering = ("id",)
     
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -45,70 +82,52 @@ class UserViewSet(ModelViewSet):
         return super().destroy(request, *args, **kwargs)
 
 
+class ImportJobViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = ImportJob.objects.all().order_by("-created_at")
+    serializer_class = ImportJobSerializer
+
+    @action(detail=True, methods=["post"])
+    def retry(self, request, pk=None):
+        job = self.get_object()
+        if not os.path.exists(job.file_path):
+            return Response({"error": "The uploaded file is no longer available."}, status=400)
+        if not retry_import(job):
+            return Response({"error": "Only completed or failed jobs can be retried."}, status=400)
+        job.refresh_from_db()
+        return Response(ImportJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
 # ViewSets for CRUD operations
-class CategoryViewSet(ModelViewSet):
+class CategoryViewSet(CachedListMixin, ModelViewSet):
+    cache_resource = "categories"
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
 
 class UploadCarsView(APIView):
     parser_classes = (MultiPartParser, FormParser)
 
+    @method_decorator(timed("upload_cars"))
     def post(self, request, *args, **kwargs):
         file = request.FILES.get("file")
         if not file:
             return Response({"error": "No file provided"}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            # Read the Excel file
-            df = pd.read_excel(file)
+            # Only the header is read here; the worker streams the rows
+            columns = schedule_columns(file)
         except Exception as e:
             return Response({"error": f"Failed to process file: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Define expected columns
-        expected_columns = {
-            "Frame": "vin",
-            "Type description": "model",
-            "Adaptation description": "adaptation",
-            "Estim Arrival": "scheduled_date",
-            "Order date": "order_date",
-            "Name": "client_name",
-            "Dealer's comment": "dealers_comments",
-            "Location": "location",
-        }
-
         # Check for missing columns
-        missing_columns = [col for col in expected_columns if col not in df.columns]
-        if missing_columns:
-            return Response({"error": f"Missing required columns: {', '.join(missing_columns)}"}, status=400)
-
-        # Process rows
-        errors = []
-        success_count = 0
-        for index, row in df.iterrows():
-            try:
-                # Map row data to model fields
-                car_data = {db_field: row[excel_col] for excel_col, db_field in expected_columns.items()}
-                
-                # Convert dates
-                for date_field in ["scheduled_date", "order_date"]:
-                    if car_data.get(date_field):
-                        try:
-                            car_data[date_field] = pd.to_datetime(car_data[date_field]).date()
-                        except ValueError:
-                            car_data[date_field] = None  # Handle invalid date format
-                
-                # Always create a new Car instance
-                Car.objects.create(**car_data)
-                success_count += 1
+        missing = missing_columns(columns)
+        if missing:
+            return Response({"error": f"Missing required columns: {', '.join(missing)}"}, status=400)
 
-            except Exception as e:
-                errors.append(f"Row {index + 1}: {str(e)}")
-
-        return Response({
-            "message": f"Upload complete. {success_count} cars added.",
-            "errors": errors,
-        }, status=status.HTTP_201_CREATED)
+        # Import runs in the background; poll /api/import_jobs/<id>/ for progress
+        job = enqueue_import(file)
+        return Response(ImportJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
 
+@timed("bulk_upload")
 @csrf_exempt
 def bulk_upload(request):
     """
@@ -135,9 +154,46 @@ def bulk_upload(request):
     return JsonResponse({'error': 'Method not allowed'}, status=405)
 
 
-class InventoryItemViewSet(ModelViewSet):
+class InventoryItemViewSet(CachedListMixin, ModelViewSet):
+    cache_resource = "inventory"
     queryset = InventoryItem.objects.all()
     serializer_class = InventoryItemSerializer
+    pagination_class = KeysetPagination
+    filter_backends = [QueryParamFilter, StableOrderingFilter]
+    query_filters = {
+        "category": "category",
+        "threshold_breached": "threshold_breached",
+        "parent": "parent",
+        "sku": "sku__startswith",
+    }
+    ordering_fields = ["name", "sku", "quantity", "category", "id"]
+    ordering = ("id",)
+
+    def uncached_list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        items = list(queryset) if page is None else page
+
+        children_by_parent = {}
+        if page is None and not is_filtered(request, self):
+            # The full list already holds every child; build the tree in memory
+            for item in items:
+                children_by_parent.setdefault(item.parent_id, []).append(item)
+        else:
+            # Fetch the descendants one tree level at a time
+            level = [item.id for item in items]
+            while level:
+                children = list(InventoryItem.objects.filter(parent_id__in=level).order_by("id"))
+                for child in children:
+                    children_by_parent.setdefault(child.parent_id, []).append(child)
+                level = [child.id for child in children]
+
+        context = self.get_serializer_context()
+        context["children_by_parent"] = children_by_parent
+        serializer = self.get_serializer(items, many=True, context=context)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
 
     def create(self, request, *args, **kwargs):
         print("=== Incoming Inventory POST Data ===")
@@ -171,38 +227,42 @@ class InventoryItemViewSet(ModelViewSet):
 
         return Response(self.get_serializer(parent_item).data, status=status.HTTP_201_CREATED)
 
-def update(self, request, *args, **kwargs):
-    item_instance = self.get_object()
-    old_data = {
-        "name": item_instance.name,
-        "sku": item_instance.sku,
-        "barcode": item_instance.barcode,
-        "quantity": item_instance.quantity,
-        "threshold": item_instance.threshold,
-        "category": item_instance.category,  # ✅ FIXED HERE
-    }
-    response = super().update(request, *args, **kwargs)
-    if response.status_code == status.HTTP_200_OK:
-        new_data = response.data
-        changes = [
-            f"{field}: {old_data[field]} -> {new_data[field]}"
-            for field in old_data if old_data[field] != new_data[field]
-        ]
-        Log.objects.create(
-            action="Updated Item",
-            item_name=new_data["name"],
-            user=request.user.username if request.user.is_authenticated else "Anonymous",
-            details="Updated Fields:\n" + "\n".join(changes)
-        )
-    return response
+    @action(detail=False, methods=["get"])
+    def shortfalls(self, request):
+        # Items whose stock minus upcoming-car demand is below threshold
+        return Response(projected_shortfalls())
 
+    def update(self, request, *args, **kwargs):
+        item_instance = self.get_object()
+        old_data = {
+            "name": item_instance.name,
+            "sku": item_instance.sku,
+            "barcode": item_instance.barcode,
+            "quantity": item_instance.quantity,
+            "threshold": item_instance.threshold,
+            "category": item_instance.category,  # ✅ FIXED HERE
+        }
+        response = super().update(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            new_data = response.data
+            changes = [
+                f"{field}: {old_data[field]} -> {new_data[field]}"
+                for field in old_data if old_data[field] != new_data[field]
+            ]
+            audit_log(
+                action="Updated Item",
+                item_name=new_data["name"],
+                user=request_user(request),
+                details="Updated Fields:\n" + "\n".join(changes)
+            )
+        return response
 
     def destroy(self, request, *args, **kwargs):
         item_instance = self.get_object()
-        Log.objects.create(
+        audit_log(
             action="Deleted Item",
             item_name=item_instance.name,
-            user=request.user.username if request.user.is_authenticated else "Anonymous",
+            user=request_user(request),
             details=(
                 f"Deleted Item Details:\n"
                 f"Name: {item_instance.name}, SKU: {item_instance.sku}, Barcode: {item_instance.barcode}"
@@ -210,65 +270,30 @@ def update(self, request, *args, **kwargs):
         )
         return super().destroy(request, *args, **kwargs)
 
-class CarViewSet(ModelViewSet):
+class CarViewSet(CachedListMixin, ModelViewSet):
+    cache_resource = "cars"
     queryset = Car.objects.all()
     serializer_class = CarSerializer
+    pagination_class = KeysetPagination
+    filter_backends = [QueryParamFilter, StableOrderingFilter]
+    query_filters = {
+        "status": "status",
+        "vin": ("vin__prefix", normalize_vin),
+        "location": "location",
+        "scheduled_after": "scheduled_date__gte",
+        "scheduled_before": "scheduled_date__lte",
+        "ordered_after": "order_date__gte",
+        "ordered_before": "order_date__lte",
+    }
+    ordering_fields = ["scheduled_date", "order_date", "vin", "status", "id"]
+    ordering = ("id",)
     parser_classes = (MultiPartParser, FormParser)  # Add support for file uploads
 
     def create(self, request, *args, **kwargs):
         # Check if a file is being uploaded
         
         if "file" in request.FILES:
-            file = request.FILES["file"]
-            try:
-                df = pd.read_excel(file)
-            except Exception as e:
-                return Response({"error": f"Failed to process file: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
-
-            # Define expected columns
-            expected_columns = {
-                "Frame": "vin",
-                "Type description": "model",
-                "Adaptation description": "adaptation",
-                "Estim Arrival": "scheduled_date",
-                "Order date": "order_date",
-                "Name": "client_name",
-                "Dealer's comment": "dealers_comments",
-                "Location": "location",
-            }
-
-            # Check for missing columns
-            missing_columns = [col for col in expected_columns if col not in df.columns]
-            if missing_columns:
-                return Response({"error": f"Missing required columns: {', '.join(missing_columns)}"}, status=400)
-
-            # Process rows
-            errors = []
-            success_count = 0
-            for index, row in df.iterrows():
-                try:
-                    # Map row data to model fields
-                    car_data = {db_field: row.get(excel_col, "").strip() for excel_col, db_field in expected_columns.items()}
-                    car_data["status"] = "from_upcoming"  # Default status
-                    
-                    # Convert dates
-                    for date_field in ["scheduled_date", "order_date"]:
-                        if car_data.get(date_field):
-                            try:
-                                car_data[date_field] = pd.to_datetime(car_data[date_field]).date()
-                            except ValueError:
-                                car_data[date_field] = None  # Handle invalid date format
-                    
-                    # Save or update car
-                    Car.objects.update_or_create(vin=car_data["vin"], defaults=car_data)
-                    success_count += 1
-                except Exception as e:
-                    errors.append(f"Row {index + 1}: {str(e)}")
-
-            return Response({
-                "message": f"Upload complete. {success_count} cars added/updated.",
-                "errors": errors,
-            }, status=status.HTTP_200_OK)
+            return self.upload(request)
         else:
             # Handle regular single-car creation
             serializer = self.get_serializer(data=request.data)
@@ -276,6 +301,23 @@ class CarViewSet(ModelViewSet):
             self.perform_create(serializer)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @method_decorator(timed("upload_cars"))
+    def upload(self, request):
+        file = request.FILES["file"]
+        try:
+            columns = schedule_columns(file)
+        except Exception as e:
+            return Response({"error": f"Failed to process file: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Check for missing columns
+        missing = missing_columns(columns)
+        if missing:
+            return Response({"error": f"Missing required columns: {', '.join(missing)}"}, status=400)
+
+        # Import runs in the background; poll /api/import_jobs/<id>/ for progress
+        job = enqueue_import(file)
+        return Response(ImportJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
 
 def badge_login(request):
     badge_id = request.POST.get("badge_id")
@@ -285,6 +327,7 @@ def badge_login(request):
     return JsonResponse({"error": "Invalid badge"}, status=401)
 
 
+@timed("scan_item")
 @csrf_exempt
 def scan_item(request):
     session_id = request.POST.get("session_id") or str(uuid.uuid4())
@@ -292,61 +335,180 @@ def scan_item(request):
     part_barcode = request.POST.get("part_barcode")
     
     try:
-        scanned_item, created = ScannedItem.objects.get_or_create(
-            session_id=session_id,
-            defaults={"car_label": car_label, "parts": [], "user": request.user}
-        )
-        if part_barcode:
-            part = InventoryItem.objects.get(barcode=part_barcode)
-            scanned_item.parts.append({
-                "name": part.name,
-                "sku": part.sku,
-                "barcode": part.barcode,
-                "quantity": part.quantity
-            })
-            scanned_item.save()
-        return JsonResponse({"session_id": scanned_item.session_id, "parts": scanned_item.parts})
+        with transaction.atomic():
+            scanned_item, created = ScannedItem.objects.select_for_update().get_or_create(
+                session_id=session_id,
+                defaults={"car_label": car_label, "user": request.user}
+            )
+            if not created and is_expired(scanned_item):
+                return JsonResponse({"error": "Session expired"}, status=410)
+            if part_barcode:
+                part = resolve_barcodes([part_barcode]).get(part_barcode)
+                if part is None:
+                    raise InventoryItem.DoesNotExist
+                add_scans(scanned_item, {part["id"]: 1})
+        return JsonResponse({"session_id": scanned_item.session_id, "parts": session_lines(scanned_item)})
     except InventoryItem.DoesNotExist:
         return JsonResponse({"error": "Part not found"}, status=404)
 
 
+MAX_BATCH_SCANS = 1000
+
+
+@timed("scan_batch")
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def scan_batch(request):
+    """
+    Add many scans to a session in one request, e.g. a burst synced from a
+    handheld that buffered offline. Barcodes are resolved with one query
+    and added to the session's lines in one pass; VINs are scanned as with
+    scan_vin. Unknown barcodes are reported, not fatal.
+    """
+    barcodes = request.data.get("barcodes") or []
+    vins = request.data.get("vins") or []
+    if not isinstance(barcodes, list) or not isinstance(vins, list):
+        return Response({"error": "barcodes and vins must be lists."}, status=400)
+    if len(barcodes) + len(vins) > MAX_BATCH_SCANS:
+        return Response({"error": f"At most {MAX_BATCH_SCANS} scans per batch."}, status=400)
+    barcodes = [str(barcode).strip() for barcode in barcodes]
+    vins = [vin for vin in map(normalize_vin, vins) if vin]
+    try:
+        session_id = uuid.UUID(str(request.data.get("session_id") or uuid.uuid4()))
+    except ValueError:
+        return Response({"error": "Invalid session_id."}, status=400)
+
+    items = resolve_barcodes(barcodes)
+    counts, results = Counter(), []
+    for barcode in barcodes:
+        part = items.get(barcode)
+        if part is None:
+            results.append({"barcode": barcode, "status": "not_found"})
+            continue
+        counts[part["id"]] += 1
+        results.append({"barcode": barcode, "status": "added", "name": part["name"], "sku": part["sku"]})
+
+    with transaction.atomic():
+        scanned_item, created = ScannedItem.objects.select_for_update().get_or_create(
+            session_id=session_id,
+            defaults={"car_label": request.data.get("car_label") or "", "user": request.user},
+        )
+        if not created and is_expired(scanned_item):
+            return Response({"error": "Session expired."}, status=410)
+        add_scans(scanned_item, counts)
+
+    cars = scan_cars(vins, request_user(request))
+    return Response({
+        "session_id": scanned_item.session_id,
+        "scanned": scan_total(scanned_item),
+        "results": results,
+        "cars": [{"vin": vin, "status": car_status, "message": message} for vin, (car_status, message) in cars.items()],
+    })
+
+
+@timed("confirm_session")
 @csrf_exempt
 def confirm_session(request):
     session_id = request.POST.get("session_id")
     try:
         scanned_item = ScannedItem.objects.get(session_id=session_id)
-        for part in scanned_item.parts:
-            inventory_item = InventoryItem.objects.get(barcode=part["barcode"])
-            inventory_item.quantity -= 1  # Deduct quantity
-            inventory_item.save()
-        scanned_item.delete()  # Clear session
-        return JsonResponse({"message": "Session confirmed and inventory updated"})
-    except ScannedItem.DoesNotExist:
+    except (ScannedItem.DoesNotExist, ValidationError):
         return JsonResponse({"error": "Session not found"}, status=404)
+    if is_expired(scanned_item):
+        return JsonResponse({"error": "Session expired"}, status=410)
 
+    try:
+        confirm_scans(scanned_item)
+    except ScannedItem.DoesNotExist:
+        return JsonResponse({"error": "Session not found"}, status=404)  # Confirmed meanwhile
+    except InsufficientStock as e:
+        return JsonResponse({"error": "Insufficient stock", "shortages": [
+            {"item": item_id, "requested": requested, "available": available}
+            for item_id, (requested, available) in e.shortages.items()
+        ]}, status=409)
+    return JsonResponse({"message": "Session confirmed and inventory updated"})
+
+
+class BarcodeCacheStatsView(APIView):
+    """
+    Hit/miss counters of the barcode cache in this process.
+    """
+
+    def get(self, request):
+        return Response(get_barcode_cache().stats())
 
-# Log endpoints
-def get_logs(request):
-    logs = Log.objects.all().order_by('-timestamp')
-    log_list = [
-        {
-            "action": log.action,
-            "item_name": log.item_name,
-            "user": log.user,
-            "timestamp": log.timestamp.strftime("%d/%m/%Y, %H:%M:%S"),
-            "details": log.details
-        }
-        for log in logs
-    ]
-    return JsonResponse(log_list, safe=False)
 
+class ScanSessionStatsView(ReplicaReadsMixin, APIView):
+    """
+    Live and expired (not yet swept) scan session counts.
+    """
+
+    def get(self, request):
+        return Response({**session_counts(), "ttl_hours": settings.SCAN_SESSION_TTL_HOURS})
 
+
+# Log endpoints
 def reset_logs(request):
     if request.method == "POST":
         Log.objects.all().delete()
         return JsonResponse({"message": "Logs reset successfully."})
 
 
-class LogListView(ListAPIView):
-    queryset = Log.objects.all().order_by('-timestamp')
+class LogListView(ReplicaReadsMixin, ListAPIView):
+    """
+    Newest-first logs, 100 per page by default. ?export=ndjson|csv streams
+    every matching row instead of paginating.
+    """
+    queryset = Log.objects.all().order_by('-timestamp', '-id')
     serializer_class = LogSerializer
+    pagination_class = LogPagination
+    filter_backends = [QueryParamFilter]
+    query_filters = {
+        "action": "action",
+        "user": "user",
+        "item": "item_name",
+        "since": "timestamp__gte",
+        "until": "timestamp__lt",
+    }
+
+    def list(self, request, *args, **kwargs):
+        export_format = request.query_params.get("export")
+        if export_format:
+            if export_format not in EXPORT_FORMATS:
+                return Response({"error": f"Unsupported export format '{export_format}'."}, status=400)
+            # Pin the alias now: the rows are streamed after dispatch has returned
+            queryset = self.filter_queryset(self.get_queryset()).using(router.db_for_read(Log))
+            return export_logs(log_rows(queryset), export_format)
+        return super().list(request, *args, **kwargs)
+
+
+
+class LogArchiveView(APIView):
+    """
+    Read-only access to archived logs. Without a month, lists the archived
+    months; with one, streams that month (?export=ndjson|csv, default
+    ndjson) using the same filters as the live log API.
+    """
+
+    def get(self, request, month=None):
+        months = archived_months()
+        if month is None:
+            return Response({"months": months})
+        if month not in months:
+            return Response({"error": f"No archive for {month}."}, status=404)
+
+        export_format = request.query_params.get("export", "ndjson")
+        if export_format not in EXPORT_FORMATS:
+            return Response({"error": f"Unsupported export format '{export_format}'."}, status=400)
+        filters = {
+            "action": request.query_params.get("action"),
+            "user": request.query_params.get("user"),
+            "item": request.query_params.get("item"),
+            "since": request.query_params.get("since"),
+            "until": request.query_params.get("until"),
+        }
+        try:
+            rows = filter_archived(read_archive(month), **filters)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        return export_logs(rows, export_format)
@@ -2,6 +2,9 @@
 ASGI config for stockoverflow_backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server (e.g. ``uvicorn stockoverflow_backend.asgi:application``)
+for the /api/changes/ event stream. Change events are stored in the database,
+so the workers don't need to share memory.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
@@ -0,0 +1,79 @@
+"""
+DATABASES profiles, picked with the DB_PROFILE environment variable.
+
+sqlite (default): BASE_DIR/db.sqlite3, or SQLITE_PATH, in WAL mode with
+IMMEDIATE transactions so concurrent writers queue on the busy timeout
+instead of failing with "database is locked". SQLITE_REPLICA_PATH adds a
+second file as the "replica" alias, to try the replica router locally.
+
+postgres: POSTGRES_DB/USER/PASSWORD/HOST/PORT. Connections are kept for
+DB_CONN_MAX_AGE seconds, or pooled by psycopg when DB_POOL_MAX_SIZE is set
+(needs `pip install "psycopg[binary,pool]"`). POSTGRES_REPLICA_HOST adds a
+"replica" alias on that host with the same credentials.
+
+Reads only go to the replica where api.db_router says so.
+"""
+import os
+
+REPLICA = "replica"
+
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL;"  # Readers don't block the writer
+    "PRAGMA synchronous=NORMAL;"  # Safe with WAL, far fewer fsyncs
+    "PRAGMA temp_store=MEMORY;"
+    "PRAGMA cache_size=-20000;"  # 20 MB page cache per connection
+)
+
+
+def sqlite_database(path):
+    return {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": path,
+        "OPTIONS": {
+            "init_command": SQLITE_PRAGMAS,
+            "transaction_mode": "IMMEDIATE",  # Take the write lock up front
+            "timeout": 20,  # Seconds to wait for the lock
+        },
+    }
+
+
+def postgres_database(env, host):
+    database = {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": env.get("POSTGRES_DB", "stockoverflow"),
+        "USER": env.get("POSTGRES_USER", "stockoverflow"),
+        "PASSWORD": env.get("POSTGRES_PASSWORD", ""),
+        "HOST": host,
+        "PORT": env.get("POSTGRES_PORT", "5432"),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {},
+    }
+    if env.get("DB_POOL_MAX_SIZE"):
+        # Django's pool and persistent connections are mutually exclusive
+        database["CONN_MAX_AGE"] = 0
+        database["OPTIONS"]["pool"] = {
+            "min_size": int(env.get("DB_POOL_MIN_SIZE", 2)),
+            "max_size": int(env["DB_POOL_MAX_SIZE"]),
+            "timeout": 10,
+        }
+    else:
+        database["CONN_MAX_AGE"] = int(env.get("DB_CONN_MAX_AGE", 60))
+    return database
+
+
+def database_settings(base_dir, env=os.environ):
+    profile = env.get("DB_PROFILE", "sqlite")
+    if profile == "sqlite":
+        databases = {"default": sqlite_database(env.get("SQLITE_PATH", base_dir / "db.sqlite3"))}
+        replica = env.get("SQLITE_REPLICA_PATH") and sqlite_database(env["SQLITE_REPLICA_PATH"])
+    elif profile == "postgres":
+        databases = {"default": postgres_database(env, env.get("POSTGRES_HOST", "localhost"))}
+        replica = env.get("POSTGRES_REPLICA_HOST") and postgres_database(env, env["POSTGRES_REPLICA_HOST"])
+    else:
+        raise ValueError(f"Unknown DB_PROFILE '{profile}', expected 'sqlite' or 'postgres'.")
+
+    if replica:
+        # Tests read the primary's test database instead of creating one
+        replica["TEST"] = {"MIRROR": "default"}
+        databases[REPLICA] = replica
+    return databases
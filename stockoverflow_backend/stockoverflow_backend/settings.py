@@ -1,6 +1,6 @@
 from pathlib import Path
-import socket
-from django.core.mail.backends.smtp import EmailBackend
+
+from .databases import database_settings
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -25,6 +25,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.instrumentation.RequestMetricsMiddleware',  # First, so it times everything below
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # Place corsheaders here
@@ -57,12 +58,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'stockoverflow_backend.wsgi.application'
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
-}
+# SQLite by default; see databases.py for the PostgreSQL profile and replicas
+DATABASES = database_settings(BASE_DIR)
+DATABASE_ROUTERS = ['api.db_router.ReplicaRouter']
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -95,5 +93,83 @@ CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",  # React frontend
     "http://127.0.0.1:3000",  # Alternative localhost frontend
 ]
-DEFAULT_SOCKET_TIMEOUT = 1000  # Timeout in seconds
-socket.setdefaulttimeout(DEFAULT_SOCKET_TIMEOUT)
\ No newline at end of file
+
+# Bound SMTP calls instead of setting a process-wide socket timeout
+EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'  # filebased/locmem for local testing
+EMAIL_TIMEOUT = 10  # Seconds
+
+# Threshold breach alerts: one digest per interval from a background thread
+ALERT_ASYNC = True
+ALERT_DIGEST_INTERVAL = 300  # Seconds
+ALERT_FROM_EMAIL = 'admin@company.com'
+ALERT_RECIPIENTS = ['office@company.com']
+
+# Background car schedule imports
+IMPORT_JOB_DIR = BASE_DIR / 'import_jobs'  # Uploaded files waiting for the worker
+IMPORT_JOB_WORKERS = 2
+
+# Log retention: older logs are moved to LOG_ARCHIVE_DIR by `manage.py archive_logs`
+LOG_RETENTION_DAYS = 90
+LOG_ARCHIVE_DIR = BASE_DIR / 'log_archive'
+
+# Audit log writer: entries are spooled to disk and flushed in batches
+AUDIT_LOG_ASYNC = True
+AUDIT_LOG_SPOOL_DIR = BASE_DIR / 'audit_spool'
+AUDIT_LOG_BATCH_SIZE = 100
+AUDIT_LOG_FLUSH_INTERVAL = 2  # Seconds
+
+# Unconfirmed scan sessions expire this long after they were started and are
+# purged by `manage.py sweep_scan_sessions`
+SCAN_SESSION_TTL_HOURS = 12
+
+# Barcode -> item metadata cache for scans and checkouts. Set BARCODE_CACHE_ALIAS
+# to a CACHES alias (locmem, file, ...) to share entries through that backend too.
+BARCODE_CACHE_SIZE = 10000
+BARCODE_CACHE_TTL = 300  # Seconds
+BARCODE_CACHE_ALIAS = None
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Shared by all worker processes on the host; use memcached or redis across hosts
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'responses',
+    },
+}
+
+# Cached list responses with ETags. Versions live in this CACHES alias, so with
+# several worker processes it must be a shared backend (file, memcached, redis);
+# with a locmem alias responses are not cached at all.
+RESPONSE_CACHE_ALIAS = 'responses'
+RESPONSE_CACHE_TTL = 600  # Seconds
+
+# Server-Sent Events change feed at /api/changes/ (needs the ASGI entry point).
+# Events are stored in the database, so any number of ASGI workers can serve it.
+CHANGE_FEED_BUFFER = 1000  # Events kept for clients resuming after a reconnect
+CHANGE_FEED_HEARTBEAT = 15  # Seconds
+CHANGE_FEED_POLL_INTERVAL = 1  # Seconds until a client sees another worker's events
+
+# Per-request query count and timing: Server-Timing header plus one JSON log
+# line on "api.requests". Set REQUEST_METRICS_SLOW_MS to also log the SQL of
+# sampled slow requests on "api.requests.slow".
+REQUEST_METRICS = True
+REQUEST_METRICS_SLOW_MS = None
+REQUEST_METRICS_SLOW_SAMPLE_RATE = 1.0
+
+# Prometheus metrics at /metrics. Each worker process writes its values to
+# METRICS_DIR every METRICS_FLUSH_INTERVAL seconds and a scrape adds them up;
+# set METRICS_DIR to None for a single process.
+METRICS_DIR = BASE_DIR / 'metrics'
+METRICS_FLUSH_INTERVAL = 5  # Seconds
+
+# Request log lines are emitted at INFO and propagate; attach a handler to
+# "api.requests" (or the root logger) in the deployment to keep them.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'loggers': {
+        'api.requests': {'level': 'INFO'},
+    },
+}
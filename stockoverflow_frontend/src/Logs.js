@@ -1,16 +1,31 @@
-import React, { useEffect, useState } from "react";
+import React, { useCallback, useEffect, useState } from "react";
 import "./logs.css";
 
+const LOGS_URL = "http://127.0.0.1:8000/api/logs/";
+
 const Logs = () => {
   const [logs, setLogs] = useState([]);
+  const [nextPage, setNextPage] = useState(null);
+  const [loading, setLoading] = useState(false);
 
-  useEffect(() => {
-    fetch("http://127.0.0.1:8000/api/logs/")
+  // The API returns 100 logs per page, newest first, with a link to the next page
+  const loadPage = useCallback((url, append) => {
+    setLoading(true);
+    fetch(url)
       .then((response) => response.json())
-      .then((data) => setLogs(data))
-      .catch((error) => console.error("Error fetching logs:", error));
+      .then((data) => {
+        const page = Array.isArray(data) ? data : data.results;
+        setLogs((previous) => (append ? [...previous, ...page] : page));
+        setNextPage(Array.isArray(data) ? null : data.next);
+      })
+      .catch((error) => console.error("Error fetching logs:", error))
+      .finally(() => setLoading(false));
   }, []);
 
+  useEffect(() => {
+    loadPage(LOGS_URL, false);
+  }, [loadPage]);
+
   const formatTimestamp = (timestamp) => {
     const options = {
       day: "2-digit",
@@ -36,6 +51,11 @@ const Logs = () => {
           <div className="log-details">{log.details}</div>
         </div>
       ))}
+      {nextPage && (
+        <button className="logs-load-more" onClick={() => loadPage(nextPage, true)} disabled={loading}>
+          {loading ? "Loading..." : "Load more"}
+        </button>
+      )}
     </div>
   );
 };